@@ -0,0 +1,155 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""An on-disk cache of decoded ``pymedphys.Delivery`` objects.
+
+The cache is keyed by the SHA1 hash of the source file (or byte stream),
+the type of source, any extra parameters that change the decoding, and
+the PyMedPhys version. It is disabled by default, call
+``pymedphys.Delivery.enable_cache()`` to turn it on.
+"""
+
+import hashlib
+import logging
+import os
+import pathlib
+import tempfile
+import zipfile
+from typing import Any, Callable, Optional
+
+from pymedphys import _config
+from pymedphys._utilities.filehash import hash_file
+from pymedphys._version import __version__
+
+_CACHE_STATE = {"directory": None}  # type: dict
+
+
+def default_cache_directory() -> pathlib.Path:
+    return _config.get_config_dir().joinpath("cache", "delivery")
+
+
+def enable(directory=None):
+    if directory is None:
+        directory = default_cache_directory()
+
+    directory = pathlib.Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    _CACHE_STATE["directory"] = directory
+
+
+def disable():
+    _CACHE_STATE["directory"] = None
+
+
+def get_directory() -> Optional[pathlib.Path]:
+    return _CACHE_STATE["directory"]
+
+
+def _hash_source(source) -> Optional[str]:
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return hashlib.sha1(source).hexdigest()
+
+    if isinstance(source, (str, os.PathLike)):
+        return hash_file(source)
+
+    # File-like objects and in-memory datasets are not cached.
+    return None
+
+
+def cache_filepath(kind: str, source, *key_parameters) -> Optional[pathlib.Path]:
+    directory = get_directory()
+    if directory is None:
+        return None
+
+    source_hash = _hash_source(source)
+    if source_hash is None:
+        return None
+
+    key = hashlib.sha1(
+        repr((__version__, kind, source_hash, key_parameters)).encode()
+    ).hexdigest()
+
+    return directory.joinpath(kind, f"{key}.npz")
+
+
+def retrieve_or_create(
+    cls, kind: str, source, create: Callable[[], Any], *key_parameters
+):
+    """Load a delivery from the cache, or create it and store it.
+
+    Parameters
+    ----------
+    cls
+        The ``Delivery`` class to load the cached result as.
+    kind : str
+        The type of the source, for example ``"trf"``.
+    source
+        Either a path to the source file, or the raw bytes of the
+        source. Any other type of source skips the cache.
+    create : callable
+        A function with no parameters that decodes the source.
+    *key_parameters
+        Any extra parameters that affect the decoded result.
+
+    Notes
+    -----
+    A cache entry that can't be loaded, for example one that was
+    truncated, is treated as missing and is overwritten.
+
+    """
+    filepath = cache_filepath(kind, source, *key_parameters)
+    if filepath is None:
+        return create()
+
+    try:
+        delivery = cls.load(filepath)
+        logging.debug(
+            "Loaded cached delivery from %(filepath)s", {"filepath": filepath}
+        )
+
+        return delivery
+    except FileNotFoundError:
+        pass
+    except (OSError, EOFError, ValueError, KeyError, zipfile.BadZipFile):
+        logging.warning(
+            "Unable to load the cached delivery at %(filepath)s, it will be "
+            "recreated",
+            {"filepath": filepath},
+            exc_info=True,
+        )
+
+    delivery = create()
+
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+
+    # A unique temporary file per writer, so that threads and processes
+    # creating the same entry at once don't write over each other.
+    with tempfile.NamedTemporaryFile(
+        dir=filepath.parent,
+        prefix=f"{filepath.stem}_",
+        suffix="_temp.npz",
+        delete=False,
+    ) as f:
+        temp_filepath = f.name
+        try:
+            delivery.save(f)
+        except BaseException:
+            f.close()
+            os.unlink(temp_filepath)
+            raise
+
+    os.replace(temp_filepath, filepath)
+
+    return delivery
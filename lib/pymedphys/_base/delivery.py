@@ -19,7 +19,9 @@ from typing import Dict, List, Tuple, Type, TypeVar, Union
 
 from pymedphys._imports import numpy as np
 
+from pymedphys._base import cache as _cache
 from pymedphys._utilities.controlpoints import (
+    find_control_points_within_tolerance,
     remove_irrelevant_control_points,
     to_tuple,
 )
@@ -75,6 +77,63 @@ class DeliveryBase(DeliveryNamedTuple):
         new_kwargs = {key: to_tuple(item) for key, item in kwargs.items()}
         return super().__new__(cls, *new_args, **new_kwargs)
 
+    def save(self, filepath):
+        """Save the delivery to disk in NumPy's binary ``.npz`` format.
+
+        Parameters
+        ----------
+        filepath
+            The path, or a writable binary file object, to save the
+            delivery to.
+
+        """
+        arrays = {
+            field: np.array(getattr(self, field))
+            for field in self._fields  # pylint: disable = no-member
+        }
+
+        np.savez(filepath, **arrays)
+
+    @classmethod
+    def load(cls: Type[DeliveryGeneric], filepath) -> DeliveryGeneric:
+        """Load a delivery that was saved with ``pymedphys.Delivery.save``.
+
+        Parameters
+        ----------
+        filepath
+            The path, or a readable binary file object, of a saved
+            delivery.
+
+        Returns
+        -------
+        delivery : pymedphys.Delivery
+
+        """
+        with np.load(filepath, allow_pickle=False) as saved:
+            return cls(**{field: saved[field] for field in cls._fields})
+
+    @staticmethod
+    def enable_cache(directory=None):
+        """Cache decoded deliveries on disk, keyed by the source file's hash.
+
+        Once enabled, ``from_trf``, ``from_icom``, ``from_monaco`` and
+        ``from_dicom`` look up their result within the cache before
+        decoding the source, and store their result within it after.
+
+        Parameters
+        ----------
+        directory : pathlib.Path, optional
+            The directory to store the cache within. Defaults to
+            ``~/.pymedphys/cache/delivery``.
+
+        """
+        _cache.enable(directory)
+
+    @staticmethod
+    def disable_cache():
+        """Stop using the on-disk delivery cache."""
+        _cache.disable()
+
     @classmethod
     def _empty(cls: Type[DeliveryGeneric]) -> DeliveryGeneric:
         return cls(
@@ -208,6 +267,76 @@ class DeliveryBase(DeliveryNamedTuple):
 
         return cls(*new_delivery_data)
 
+    def decimate(
+        self: DeliveryGeneric, tolerance_mm=0.1, tolerance_mu=0.01, tolerance_deg=0.1
+    ) -> DeliveryGeneric:
+        """Remove the control points that can be reproduced by linearly
+        interpolating between their neighbours.
+
+        Unlike stripping every n-th control point, the error introduced
+        is bounded. The gantry, collimator, MLC and jaw are interpolated
+        against the cumulative MU, as ``MetersetMap`` does. Every
+        removed control point's values are within the given tolerances
+        of that interpolation between the retained control points either
+        side of it. Where the MU doesn't change, such as during a
+        beam-off move, they are instead interpolated by control point
+        index so that the retained control points still follow the
+        path of the move.
+
+        Parameters
+        ----------
+        tolerance_mm : float, optional
+            The allowed MLC and jaw position error, by default 0.1 mm.
+        tolerance_mu : float, optional
+            The allowed monitor unit error, by default 0.01 MU. The MU
+            is interpolated by control point index, which for a logfile
+            is the time of each control point.
+        tolerance_deg : float, optional
+            The allowed gantry and collimator angle error, by default
+            0.1 degrees.
+
+        Returns
+        -------
+        delivery : pymedphys.Delivery
+            A delivery containing only the required control points.
+
+        """
+        cls = type(self)
+
+        monitor_units = np.array(self.monitor_units, dtype=float)
+        number_of_control_points = len(monitor_units)
+        if number_of_control_points < 3:
+            return self
+
+        mlc = np.array(self.mlc, dtype=float).reshape(number_of_control_points, -1)
+        jaw = np.array(self.jaw, dtype=float).reshape(number_of_control_points, -1)
+
+        trajectories = np.concatenate(
+            [
+                monitor_units[:, None],
+                np.array(self.gantry, dtype=float)[:, None],
+                np.array(self.collimator, dtype=float)[:, None],
+                mlc,
+                jaw,
+            ],
+            axis=1,
+        )
+        tolerances = np.concatenate(
+            [
+                [tolerance_mu, tolerance_deg, tolerance_deg],
+                np.full(mlc.shape[1] + jaw.shape[1], tolerance_mm),
+            ]
+        )
+
+        mask = find_control_points_within_tolerance(
+            trajectories,
+            tolerances,
+            positions=monitor_units,
+            by_index=np.arange(len(tolerances)) == 0,
+        )
+
+        return cls(*(np.array(item)[mask] for item in self))
+
     def _strip_delivery_data(self: DeliveryGeneric, skip_size) -> DeliveryGeneric:
         cls = type(self)
 
@@ -20,6 +20,7 @@ from typing import Union, cast
 from pymedphys._imports import numpy as np
 from pymedphys._imports import pydicom
 
+from pymedphys._base import cache as _cache
 from pymedphys._base.delivery import DeliveryBase
 from pymedphys._dicom import rtplan as _pmp_rtplan
 from pymedphys._dicom.delivery import utilities
@@ -134,6 +135,18 @@ class DeliveryDicom(DeliveryBase):
             rtplan_dataset = cast(pydicom.Dataset, rtplan)
         else:
             rtplan_filepath = cast(os.PathLike, rtplan)
+
+            if str(fraction_group_number).lower() != "all":
+                return _cache.retrieve_or_create(
+                    cls,
+                    "dicom",
+                    rtplan_filepath,
+                    lambda: cls.from_dicom(
+                        _load_dicom_file(rtplan_filepath), fraction_group_number
+                    ),
+                    fraction_group_number,
+                )
+
             rtplan_dataset = _load_dicom_file(rtplan_filepath)
 
         if str(fraction_group_number).lower() == "all":
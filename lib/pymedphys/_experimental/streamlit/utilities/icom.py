@@ -22,11 +22,16 @@ from pymedphys._imports import numpy as np
 from pymedphys._imports import pandas as pd
 from pymedphys._imports import streamlit as st
 
-import pymedphys._icom.delivery as pmp_icom_delivery
-import pymedphys._icom.extract as pmp_icom_extract
+import pymedphys._icom.columns as pmp_icom_columns
+import pymedphys._icom.segments as pmp_icom_segments
 
 
 def read_icom_log(filepath):
+    if str(filepath).endswith(
+        (pmp_icom_segments.OPEN_SUFFIX, pmp_icom_segments.CLOSED_SUFFIX)
+    ):
+        return b"".join(pmp_icom_segments.iter_segment_frames(filepath))
+
     with lzma.open(filepath, "r") as f:
         icom_stream = f.read()
 
@@ -153,28 +158,40 @@ def _get_relevant_times(filepath):
 
 @st.cache(show_spinner=False)
 def get_icom_datetimes_meterset_machine(filepath):
-    icom_stream = read_icom_log(filepath)
+    columns = _load_icom_columns(filepath, ["timestamp", "meterset", "machine_id"])
 
-    icom_data_points = pmp_icom_extract.get_data_points(icom_stream)
-    icom_datetime = pd.to_datetime(
-        pd.Series([item[8:26].decode() for item in icom_data_points], name="datetime"),
-        format="%Y-%m-%d%H:%M:%S",
-    )
-    _adjust_icom_datetime_to_remove_duplicates(icom_datetime)
+    return _get_datetimes_meterset_machine(columns)
 
-    meterset = pd.Series(
-        [pmp_icom_extract.extract(item, "Delivery MU")[1] for item in icom_data_points],
-        name="meterset",
-    )
 
-    machine_id = pd.Series(
-        [pmp_icom_extract.extract(item, "Machine ID")[1] for item in icom_data_points],
-        name="machine_id",
-    )
+def _load_icom_columns(filepath, names=None):
+    if str(filepath).endswith(pmp_icom_segments.OPEN_SUFFIX):
+        # Still being written, so not worth persisting.
+        columns = pmp_icom_columns.icom_stream_to_columns(read_icom_log(filepath))
+        if names is None:
+            return columns
+
+        return {name: columns[name] for name in names}
+
+    return pmp_icom_columns.load_icom_columns(filepath, names)
+
+
+def _get_datetimes_meterset_machine(columns):
+    icom_datetime = pd.Series(pd.to_datetime(columns["timestamp"]), name="datetime")
+    _adjust_icom_datetime_to_remove_duplicates(icom_datetime)
+
+    meterset = pd.Series(columns["meterset"], name="meterset")
+    machine_id = _get_string_series(columns, "machine_id")
 
     return icom_datetime, meterset, machine_id
 
 
+def _get_string_series(columns, name):
+    series = pd.Series(columns[name], name=name, dtype=object)
+    series[series == ""] = None
+
+    return series
+
+
 def _adjust_icom_datetime_to_remove_duplicates(icom_datetime):
     _, unique_index, unique_counts = np.unique(
         icom_datetime, return_index=True, return_counts=True
@@ -193,43 +210,21 @@ def _adjust_icom_datetime_to_remove_duplicates(icom_datetime):
 # the issue here.
 @st.cache(show_spinner=False, allow_output_mutation=True)
 def get_icom_dataset(filepath):
-    icom_stream = read_icom_log(filepath)
-    icom_data_points = pmp_icom_extract.get_data_points(icom_stream)
-
-    icom_datetime, meterset, machine_id = get_icom_datetimes_meterset_machine(filepath)
-
-    raw_delivery_items = pd.DataFrame(
-        [pmp_icom_delivery.get_delivery_data_items(item) for item in icom_data_points],
-        columns=["meterset", "gantry", "collimator", "mlc", "jaw"],
-    )
-    if np.all(meterset != raw_delivery_items["meterset"]):
-        raise ValueError("Expected meterset extractions to agree.")
-
-    turn_table = pd.Series(
-        [
-            pmp_icom_extract.extract(item, "Table Isocentric")[1]
-            for item in icom_data_points
-        ],
-        name="turn_table",
-    )
+    columns = _load_icom_columns(filepath)
 
-    energy = pd.Series(
-        [pmp_icom_extract.extract(item, "Energy")[1] for item in icom_data_points],
-        name="energy",
-    )
+    icom_datetime, meterset, machine_id = _get_datetimes_meterset_machine(columns)
 
+    gantry = pd.Series(columns["gantry"], name="gantry")
+    collimator = pd.Series(columns["collimator"], name="collimator")
+    turn_table = pd.Series(columns["turn_table"], name="turn_table")
+    energy = _get_string_series(columns, "energy")
     interlocks = pd.Series(
-        [pmp_icom_extract.extract(item, "Interlocks")[1] for item in icom_data_points],
-        name="interlocks",
-    )
-
-    beam_timer = pd.Series(
-        [pmp_icom_extract.extract(item, "Beam Timer")[1] for item in icom_data_points],
-        name="beam_timer",
+        pmp_icom_columns.split_interlocks(columns["interlocks"]), name="interlocks"
     )
+    beam_timer = pd.Series(columns["beam_timer"], name="beam_timer")
 
     width, length, centre_x, centre_y = _determine_width_length_centre(
-        raw_delivery_items["mlc"], raw_delivery_items["jaw"]
+        columns["mlc"], columns["jaw"]
     )
 
     icom_dataset = pd.concat(
@@ -239,7 +234,9 @@ def get_icom_dataset(filepath):
             energy,
             width,
             length,
-            raw_delivery_items[["meterset", "gantry", "collimator"]],
+            meterset,
+            gantry,
+            collimator,
             turn_table,
             interlocks,
             beam_timer,
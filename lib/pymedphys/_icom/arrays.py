@@ -0,0 +1,385 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Vectorised decoding of the delivery quantities within a whole iCOM
+stream.
+
+iCOM values are ASCII text whose length varies from element to element,
+so timesteps don't share fixed byte offsets. Instead the stream is
+viewed as a single ``uint8`` array, each kind of element is located
+across every timestep at once, and all of their values are parsed
+together, one character position at a time. Any timestep that can't be
+decoded exactly as ``extract.tokenise_frame`` would is reported as
+irregular, so that it can be decoded with it instead.
+"""
+
+import string
+from typing import Dict, Tuple
+
+from pymedphys._imports import numpy as np
+
+from . import extract, mappings
+
+DATE_TEMPLATE = b"dddd-dd-dddd:dd:dd"
+
+# The bytes that ``extract.ELEMENT_PATTERN`` accepts within a value.
+VALUE_CHARACTERS = frozenset(
+    b",-'\" ." + string.ascii_letters.encode() + string.digits.encode()
+)
+
+ELEMENT_PREFIXES = b"0\x00pP"
+KEY_LENGTH = 6
+
+# Relative to the start of an element's key.
+LENGTH_OFFSET = KEY_LENGTH
+VALUE_OFFSET = KEY_LENGTH + 4
+
+NEWLINE = ord(b"\n")
+
+MAX_DIGITS = 15
+
+
+def find_frame_starts(data: "np.ndarray") -> "np.ndarray":
+    """The start offsets of each timestep, the same as those of
+    ``extract.get_data_point_spans``, clipped to zero."""
+    # Searching from the first hyphen of each date
+    dates = np.flatnonzero(data[4 : max(len(data) - 13, 4)] == ord(b"-"))
+
+    for offset, character in enumerate(DATE_TEMPLATE):
+        found = data[dates + offset]
+        if character == ord(b"d"):
+            dates = dates[(found >= ord(b"0")) & (found <= ord(b"9"))]
+        else:
+            dates = dates[found == character]
+
+    if np.any(np.diff(dates) < extract.DATE_LENGTH):
+        # Overlapping dates, handled by the regular expression instead
+        return np.array(
+            [
+                max(start, 0)
+                for start, _ in extract.get_data_point_spans(data.tobytes())
+            ],
+            dtype=np.intp,
+        )
+
+    return np.maximum(dates - 8, 0)
+
+
+def find_keys(data: "np.ndarray", key: bytes, prefixes=ELEMENT_PREFIXES):
+    """The offsets of every element key, checking the byte before the
+    key is one of ``prefixes``, that the four byte length is followed by
+    three zero bytes, and that the length isn't a newline.
+
+    Returns
+    -------
+    key_starts, lengths : np.ndarray
+    """
+    last_start = len(data) - VALUE_OFFSET
+    candidates = np.flatnonzero(data[1 : max(last_start + 1, 1)] == key[0]) + 1
+
+    for offset, character in enumerate(key[1::], 1):
+        candidates = candidates[data[candidates + offset] == character]
+
+    is_prefix = np.zeros(len(candidates), dtype=bool)
+    for prefix in prefixes:
+        is_prefix |= data[candidates - 1] == prefix
+    candidates = candidates[is_prefix]
+
+    for offset in range(LENGTH_OFFSET + 1, VALUE_OFFSET):
+        candidates = candidates[data[candidates + offset] == 0]
+
+    lengths = data[candidates + LENGTH_OFFSET].astype(np.intp)
+    is_valid_length = lengths != NEWLINE
+
+    return candidates[is_valid_length], lengths[is_valid_length]
+
+
+def parse_decimals(
+    data: "np.ndarray", starts, lengths, require_point=False
+) -> Tuple["np.ndarray", "np.ndarray"]:
+    """Parse many ASCII decimal values at once.
+
+    Each value needs to be an optional ``-``, then digits with at most
+    one decimal point, and be directly followed by a byte that
+    ``extract.ELEMENT_PATTERN`` would not include within the value. The
+    result is identical to calling ``float`` on each value.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        The ``uint8`` view of the stream.
+    starts, lengths : np.ndarray
+        The offset and length of each value.
+    require_point : bool, optional
+        Only accept values with digits on both sides of a decimal point,
+        as collimator positions have.
+
+    Returns
+    -------
+    values, is_valid : np.ndarray
+    """
+    number_of_values = len(starts)
+    last = len(data) - 1
+
+    mantissa = np.zeros(number_of_values, dtype=np.int64)
+    number_of_digits = np.zeros(number_of_values, dtype=np.intp)
+    digits_after_point = np.zeros(number_of_values, dtype=np.intp)
+    number_of_points = np.zeros(number_of_values, dtype=np.intp)
+    is_after_point = np.zeros(number_of_values, dtype=bool)
+    is_valid = np.ones(number_of_values, dtype=bool)
+
+    is_negative = (lengths > 0) & (data[np.minimum(starts, last)] == ord(b"-"))
+
+    # One character of every value at a time
+    for position in range(int(lengths.max(initial=0))):
+        characters = data[np.minimum(starts + position, last)]
+        digits = characters - np.uint8(ord(b"0"))
+
+        is_within_value = position < lengths
+        is_digit = is_within_value & (digits <= 9)
+        is_point = is_within_value & (characters == ord(b"."))
+
+        is_other = is_within_value & ~is_digit & ~is_point
+        if position == 0:
+            is_other &= ~is_negative
+
+        is_valid &= ~is_other
+        number_of_digits += is_digit
+        digits_after_point += is_digit & is_after_point
+        number_of_points += is_point
+        is_after_point |= is_point
+
+        np.multiply(mantissa, 10, out=mantissa, where=is_digit)
+        np.add(mantissa, digits, out=mantissa, where=is_digit, casting="unsafe")
+
+    is_valid &= (number_of_points <= 1) & (number_of_digits > 0)
+    if require_point:
+        is_valid &= (
+            is_after_point
+            & (digits_after_point > 0)
+            & (number_of_digits > digits_after_point)
+        )
+
+    # Integers below 2 ** 53 and powers of ten up to 10 ** 22 are exact,
+    # so a single correctly rounded division gives the same as ``float``.
+    is_valid &= number_of_digits <= MAX_DIGITS
+
+    ends = starts + lengths
+    is_at_end = ends >= len(data)
+    following = data[np.minimum(ends, len(data) - 1)]
+    is_valid &= is_at_end | ~_is_value_character(following)
+
+    powers_of_ten = 10.0 ** np.arange(MAX_DIGITS + 1)
+    values = mantissa / powers_of_ten[np.minimum(digits_after_point, MAX_DIGITS)]
+    values[is_negative] *= -1
+
+    return values, is_valid
+
+
+def _is_value_character(characters):
+    lookup = np.zeros(256, dtype=bool)
+    lookup[list(VALUE_CHARACTERS)] = True
+
+    return lookup[characters]
+
+
+def get_first_values(
+    data: "np.ndarray", frame_starts, frame_ends, key
+) -> Tuple["np.ndarray", "np.ndarray"]:
+    """The first value of a numeric element within each timestep,
+    skipping those that are empty or missing, as for ``"first"``
+    elements of ``extract.tokenise_frame``.
+
+    Returns
+    -------
+    values, is_regular : np.ndarray
+        ``is_regular`` is ``False`` for timesteps without the element or
+        whose value couldn't be parsed.
+    """
+    number_of_frames = len(frame_starts)
+    key_starts, lengths = find_keys(data, key)
+    value_starts = key_starts + VALUE_OFFSET
+
+    frame_indices = np.searchsorted(frame_starts, key_starts - 1, side="right") - 1
+    is_within_frame = frame_indices >= 0
+
+    value_starts = value_starts[is_within_frame]
+    lengths = lengths[is_within_frame]
+    frame_indices = frame_indices[is_within_frame]
+
+    parsed, is_valid = parse_decimals(data, value_starts, lengths)
+
+    # Values cut short by the end of their timestep
+    is_valid &= value_starts + lengths < frame_ends[frame_indices]
+
+    following = data[np.minimum(value_starts, len(data) - 1)]
+    is_empty = (lengths == 0) & ~_is_value_character(following)
+    is_missing = (
+        is_valid
+        & (parsed == float(extract.MISSING_VALUE))
+        & (lengths == len(extract.MISSING_VALUE))
+    )
+    is_used = ~is_empty & ~is_missing
+
+    values = np.full(number_of_frames, np.nan)
+    is_regular = np.zeros(number_of_frames, dtype=bool)
+
+    used_frames, first = np.unique(frame_indices[is_used], return_index=True)
+    values[used_frames] = parsed[is_used][first]
+    is_regular[used_frames] = is_valid[is_used][first]
+
+    return values, is_regular
+
+
+def get_collimation(
+    data: "np.ndarray", frame_starts, frame_ends, labels: Dict[str, int]
+) -> Tuple[Dict[str, "np.ndarray"], "np.ndarray"]:
+    """The positions of the first block of each collimator label within
+    each timestep.
+
+    Parameters
+    ----------
+    labels : dict
+        The number of positions expected for each label, for example
+        ``{"MLCX": 160, "ASYMY": 2}``.
+
+    Returns
+    -------
+    positions, is_regular
+        ``positions`` maps each label to an array of shape
+        ``(number_of_frames, number)``. ``is_regular`` is ``False`` for
+        timesteps where any label is missing, has a different number of
+        positions, or has a position that couldn't be parsed.
+    """
+    number_of_frames = len(frame_starts)
+
+    item_key_starts, item_lengths = find_keys(
+        data, extract.COLLIMATOR_ITEM_KEY, prefixes=b"0"
+    )
+    is_item = item_key_starts >= 2
+    is_item[is_item] &= data[item_key_starts[is_item] - 2] == NEWLINE
+    item_key_starts = item_key_starts[is_item]
+    item_lengths = item_lengths[is_item]
+
+    item_starts = item_key_starts - 2
+    item_value_starts = item_key_starts + VALUE_OFFSET
+    item_values, item_is_valid = parse_decimals(
+        data, item_value_starts, item_lengths, require_point=True
+    )
+
+    # Whether each item is directly followed by a valid next item
+    item_ends = item_value_starts + item_lengths
+    is_chained = np.zeros(len(item_starts), dtype=bool)
+    is_chained[:-1] = (item_ends[:-1] == item_starts[1:]) & item_is_valid[1:]
+    is_chained &= item_is_valid
+    chain_ends = np.flatnonzero(~is_chained)
+
+    label_key_starts, label_lengths = find_keys(data, extract.COLLIMATOR_LABEL_KEY)
+    label_frames = np.searchsorted(frame_starts, label_key_starts - 1, side="right") - 1
+
+    positions = {}
+    is_regular = np.ones(number_of_frames, dtype=bool)
+
+    for label, number in labels.items():
+        encoded_label = label.encode()
+        label_value_starts = label_key_starts + VALUE_OFFSET
+
+        is_label = (label_lengths == len(encoded_label)) & (label_frames >= 0)
+        for offset, character in enumerate(encoded_label):
+            is_label &= (
+                data[np.minimum(label_value_starts + offset, len(data) - 1)]
+                == character
+            )
+
+        block_starts = label_value_starts[is_label] + len(encoded_label)
+        block_frames = label_frames[is_label]
+
+        # A label directly followed by more value characters is a
+        # different label.
+        following = data[np.minimum(block_starts, len(data) - 1)]
+        is_label_end = ~_is_value_character(following)
+
+        frames, first = np.unique(block_frames, return_index=True)
+        block_starts = block_starts[first]
+        is_label_end = is_label_end[first]
+
+        first_items = np.searchsorted(item_starts, block_starts)
+        is_block = first_items < len(item_starts)
+        is_block[is_block] &= (
+            item_starts[first_items[is_block]] == block_starts[is_block]
+        )
+        is_block &= is_label_end
+
+        frames = frames[is_block]
+        first_items = first_items[is_block]
+
+        last_items = chain_ends[np.searchsorted(chain_ends, first_items)]
+        is_complete = (last_items - first_items + 1 == number) & item_is_valid[
+            first_items
+        ]
+        is_complete[is_complete] &= (
+            item_ends[last_items[is_complete]] <= frame_ends[frames[is_complete]]
+        )
+
+        frames = frames[is_complete]
+        first_items = first_items[is_complete]
+
+        label_positions = np.full((number_of_frames, number), np.nan)
+        label_positions[frames] = item_values[first_items[:, None] + np.arange(number)]
+        positions[label] = label_positions
+
+        has_label = np.zeros(number_of_frames, dtype=bool)
+        has_label[frames] = True
+        is_regular &= has_label
+
+    return positions, is_regular
+
+
+def delivery_items_from_stream(icom_stream: bytes):
+    """The raw delivery quantities of every timestep within an iCOM
+    stream.
+
+    Returns
+    -------
+    spans : list of tuple
+        The ``(start, end)`` offsets of each timestep.
+    items : dict
+        ``"Delivery MU"``, ``"Gantry"`` and ``"Collimator"`` arrays of
+        shape ``(n,)``, and ``"MLCX"`` and ``"ASYMY"`` arrays of the
+        iCOM collimator positions with shapes ``(n, 160)`` and
+        ``(n, 2)``.
+    is_regular : np.ndarray
+        Whether each timestep was decoded. Those that weren't need to
+        be decoded with ``extract.tokenise_frame``.
+    """
+    data = np.frombuffer(icom_stream, dtype=np.uint8)
+
+    frame_starts = find_frame_starts(data)
+    frame_ends = np.append(frame_starts[1::], len(data))
+
+    items, is_regular = get_collimation(
+        data, frame_starts, frame_ends, {"MLCX": 160, "ASYMY": 2}
+    )
+
+    for label in ("Delivery MU", "Gantry", "Collimator"):
+        key, _, _ = mappings.ICOM[label]
+        items[label], is_label_regular = get_first_values(
+            data, frame_starts, frame_ends, key
+        )
+        is_regular &= is_label_regular
+
+    spans = list(zip(frame_starts.tolist(), frame_ends.tolist()))
+
+    return spans, items, is_regular
@@ -0,0 +1,175 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""A columnar representation of an iCOM stream, built once and then
+persisted alongside its archive.
+"""
+
+import logging
+import os
+import pathlib
+import zipfile
+from typing import Dict, Iterable
+
+from pymedphys._imports import numpy as np
+
+from . import arrays, convert, delivery, extract
+
+COLUMNS_SUFFIX = ".columns.npz"
+
+FLOAT_FIELDS = {
+    "meterset": "Delivery MU",
+    "gantry": "Gantry",
+    "collimator": "Collimator",
+    "turn_table": "Table Isocentric",
+    "beam_timer": "Beam Timer",
+}
+STRING_FIELDS = {
+    "machine_id": "Machine ID",
+    "patient_id": "Patient ID",
+    "energy": "Energy",
+}
+
+# Interlocks are stored as a single string per timestep, joined by this.
+INTERLOCK_SEPARATOR = "\n"
+
+
+def icom_stream_to_columns(icom_stream) -> Dict[str, "np.ndarray"]:
+    """Decode an iCOM stream into one typed array per quantity.
+
+    Returns
+    -------
+    columns : dict
+        ``timestamp`` (``datetime64[s]``), ``counter``, the float
+        columns of ``FLOAT_FIELDS``, ``mlc`` of shape ``(n, 80, 2)`` and
+        ``jaw`` of shape ``(n, 2)`` in the ``pymedphys.Delivery``
+        coordinate system, the string columns of ``STRING_FIELDS``, and
+        ``interlocks``. Missing numbers are NaN and missing strings are
+        empty.
+    """
+    frames = list(extract.tokenise_stream(icom_stream))
+
+    columns = {
+        "timestamp": np.array(
+            [f"{frame.timestamp[0:10]}T{frame.timestamp[10::]}" for frame in frames],
+            dtype="datetime64[s]",
+        ),
+        "counter": np.array([frame.counter for frame in frames], dtype=np.uint8),
+    }
+
+    for name, label in FLOAT_FIELDS.items():
+        columns[name] = np.array([frame.fields[label] for frame in frames], dtype=float)
+
+    _, items, is_regular = arrays.delivery_items_from_stream(icom_stream)
+    mlc = delivery._convert_icom_mlc_to_delivery_coords(  # pylint: disable = protected-access
+        items["MLCX"]
+    )
+    jaw = delivery._convert_icom_jaw_to_delivery_coords(  # pylint: disable = protected-access
+        items["ASYMY"]
+    )
+
+    for i in np.flatnonzero(~is_regular):
+        try:
+            *_, mlc[i], jaw[i] = delivery.get_delivery_data_items_from_frame(frames[i])
+        except ValueError:
+            mlc[i] = np.nan
+            jaw[i] = np.nan
+
+    columns["mlc"] = mlc
+    columns["jaw"] = jaw
+
+    for name, label in STRING_FIELDS.items():
+        columns[name] = np.array(
+            [frame.fields[label] or "" for frame in frames], dtype=str
+        )
+
+    columns["interlocks"] = np.array(
+        [INTERLOCK_SEPARATOR.join(frame.fields["Interlocks"]) for frame in frames],
+        dtype=str,
+    )
+
+    return columns
+
+
+def get_columns_filepath(archive_filepath) -> pathlib.Path:
+    archive_filepath = pathlib.Path(archive_filepath)
+    return archive_filepath.with_name(f"{archive_filepath.name}{COLUMNS_SUFFIX}")
+
+
+def load_icom_columns(
+    archive_filepath, columns: Iterable[str] = None
+) -> Dict[str, "np.ndarray"]:
+    """Load the columns of an iCOM archive, building and persisting them
+    alongside the archive the first time.
+
+    The columns are rebuilt whenever the archive is newer than them. If
+    they are unable to be persisted, for example within a read-only
+    directory, they are still returned.
+
+    Parameters
+    ----------
+    archive_filepath : pathlib.Path
+        A patient archive or closed segment.
+    columns : Iterable[str], optional
+        Only load these columns from disk. By default all are loaded.
+
+    Returns
+    -------
+    columns : dict
+        As given by ``icom_stream_to_columns``.
+    """
+    columns_filepath = get_columns_filepath(archive_filepath)
+
+    try:
+        is_up_to_date = os.path.getmtime(columns_filepath) >= os.path.getmtime(
+            archive_filepath
+        )
+    except FileNotFoundError:
+        is_up_to_date = False
+
+    if is_up_to_date:
+        try:
+            with np.load(columns_filepath, allow_pickle=False) as saved:
+                names = saved.files if columns is None else columns
+                return {name: saved[name] for name in names}
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            logging.warning(
+                "Unable to read %(columns_filepath)s, rebuilding it.",
+                {"columns_filepath": columns_filepath},
+            )
+
+    built = icom_stream_to_columns(convert.read_icom_archive(archive_filepath))
+
+    temp_filepath = columns_filepath.with_name(f"{columns_filepath.name}.temp")
+    try:
+        with open(temp_filepath, "wb") as f:
+            np.savez_compressed(f, **built)
+        os.replace(temp_filepath, columns_filepath)
+    except OSError as e:
+        logging.warning(
+            "Unable to save %(columns_filepath)s: %(error)s",
+            {"columns_filepath": columns_filepath, "error": e},
+        )
+
+    if columns is None:
+        return built
+
+    return {name: built[name] for name in columns}
+
+
+def split_interlocks(interlocks: "np.ndarray"):
+    """The interlocks of each timestep as a list, as given by
+    ``extract.tokenise_frame``."""
+    return [item.split(INTERLOCK_SEPARATOR) if item else [] for item in interlocks]
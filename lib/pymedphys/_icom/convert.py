@@ -0,0 +1,200 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Converts many iCOM archives into deliveries with a pool of processes.
+"""
+
+import concurrent.futures
+import logging
+import lzma
+import os
+import pathlib
+import traceback
+from typing import Dict, Iterable, List, Tuple
+
+import pymedphys
+
+from . import segments
+
+
+def read_icom_archive(filepath) -> bytes:
+    """Read the iCOM stream of a patient archive or a closed segment."""
+    filepath = pathlib.Path(filepath)
+
+    if filepath.name.endswith(segments.CLOSED_SUFFIX):
+        return b"".join(segments.iter_segment_frames(filepath))
+
+    with lzma.open(filepath, "r") as f:
+        return f.read()
+
+
+def delivery_from_icom_archive(filepath) -> "pymedphys.Delivery":
+    return pymedphys.Delivery.from_icom(read_icom_archive(filepath))
+
+
+def _delivery_from_one(filepath):
+    try:
+        return filepath, delivery_from_icom_archive(filepath), None
+    except Exception:  # pylint: disable = broad-except
+        return filepath, None, traceback.format_exc()
+
+
+def deliveries_from_icom_archives(
+    filepaths: Iterable, processes=None
+) -> Tuple[Dict[pathlib.Path, "pymedphys.Delivery"], Dict[pathlib.Path, str]]:
+    """Convert many iCOM archives into deliveries with a pool of
+    processes.
+
+    Archives that fail to convert, such as those that are truncated or
+    corrupt, are reported rather than stopping the batch.
+
+    Parameters
+    ----------
+    filepaths : Iterable[pathlib.Path]
+        Patient archives, ``.xz``, as saved by the iCOM listener.
+    processes : int, optional
+        The number of worker processes, defaults to the number of CPUs.
+
+    Returns
+    -------
+    deliveries : dict
+        The delivery of each archive, keyed by its path.
+    failed : dict
+        The traceback of each archive that failed to convert, keyed by
+        its path.
+    """
+    deliveries = {}
+    failed = {}
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        for filepath, delivery, error in executor.map(
+            _delivery_from_one, list(filepaths), chunksize=8
+        ):
+            if error is None:
+                deliveries[filepath] = delivery
+            else:
+                _log_failure(filepath, error)
+                failed[filepath] = error
+
+    return deliveries, failed
+
+
+def is_up_to_date(archive_filepath, npz_filepath):
+    try:
+        npz_mtime = os.path.getmtime(npz_filepath)
+    except FileNotFoundError:
+        return False
+
+    return npz_mtime >= os.path.getmtime(archive_filepath)
+
+
+def _convert_one(paths):
+    archive_filepath, npz_filepath = paths
+
+    try:
+        delivery = delivery_from_icom_archive(archive_filepath)
+
+        npz_filepath.parent.mkdir(parents=True, exist_ok=True)
+        temp_filepath = npz_filepath.with_name(f"{npz_filepath.name}.temp")
+        with open(temp_filepath, "wb") as f:
+            delivery.save(f)
+        os.replace(temp_filepath, npz_filepath)
+    except Exception:  # pylint: disable = broad-except
+        return archive_filepath, traceback.format_exc()
+
+    return archive_filepath, None
+
+
+def icom2npz_by_directory(
+    input_directory, output_directory, processes=None
+) -> Tuple[List[pathlib.Path], List[pathlib.Path], Dict[pathlib.Path, str]]:
+    """Convert a directory tree of iCOM archives into saved deliveries
+    with a pool of processes.
+
+    Each delivery is saved with ``pymedphys.Delivery.save``, mirroring
+    the directory structure within the output directory, and can be
+    read back with ``pymedphys.Delivery.load``. Archives whose ``.npz``
+    file is newer than the archive are skipped.
+
+    Parameters
+    ----------
+    input_directory : pathlib.Path
+    output_directory : pathlib.Path
+    processes : int, optional
+        The number of worker processes, defaults to the number of CPUs.
+
+    Returns
+    -------
+    converted : list of pathlib.Path
+    skipped : list of pathlib.Path
+    failed : dict
+        The traceback of each archive that failed to convert, keyed by
+        its path.
+    """
+    input_directory = pathlib.Path(input_directory)
+    output_directory = pathlib.Path(output_directory)
+
+    to_convert = []
+    skipped = []
+    for archive_filepath in sorted(input_directory.glob("**/*.xz")):
+        npz_filepath = output_directory.joinpath(
+            archive_filepath.relative_to(input_directory)
+        ).with_suffix(".npz")
+
+        if is_up_to_date(archive_filepath, npz_filepath):
+            skipped.append(archive_filepath)
+        else:
+            to_convert.append((archive_filepath, npz_filepath))
+
+    logging.info(
+        "Converting %(to_convert)s iCOM archives, %(skipped)s are already up to date",
+        {"to_convert": len(to_convert), "skipped": len(skipped)},
+    )
+
+    converted = []
+    failed = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        for archive_filepath, error in executor.map(
+            _convert_one, to_convert, chunksize=8
+        ):
+            if error is None:
+                converted.append(archive_filepath)
+            else:
+                _log_failure(archive_filepath, error)
+                failed[archive_filepath] = error
+
+    return converted, skipped, failed
+
+
+def _log_failure(filepath, error):
+    logging.warning(
+        "Failed to convert %(filepath)s:\n%(error)s",
+        {"filepath": filepath, "error": error},
+    )
+
+
+def icom2npz_cli(args):
+    converted, skipped, failed = icom2npz_by_directory(
+        args.input_directory, args.output_directory, processes=args.processes
+    )
+
+    print(
+        f"Converted: {len(converted)}, "
+        f"Already up to date: {len(skipped)}, "
+        f"Failed: {len(failed)}"
+    )
+
+    for archive_filepath in failed:
+        print(f"    Failed: {archive_filepath}")
@@ -14,9 +14,10 @@
 
 from pymedphys._imports import numpy as np
 
+import pymedphys._base.cache
 import pymedphys._base.delivery
 
-from . import extract
+from . import arrays, extract
 
 
 def get_delivery_data_items(single_icom_stream: bytes):
@@ -43,35 +44,65 @@ def get_delivery_data_items(single_icom_stream: bytes):
         coordinate system.
     """
 
-    shrunk_stream, meterset = extract.extract(single_icom_stream, "Delivery MU")
-    shrunk_stream, gantry = extract.extract(shrunk_stream, "Gantry")
-    shrunk_stream, collimator = extract.extract(shrunk_stream, "Collimator")
+    return get_delivery_data_items_from_frame(
+        extract.tokenise_frame(single_icom_stream)
+    )
 
-    shrunk_stream, raw_mlc = extract.extract_coll(shrunk_stream, b"MLCX", 160)
+
+def get_delivery_data_items_from_frame(frame: extract.Frame):
+    meterset = frame.fields["Delivery MU"]
+    gantry = frame.fields["Gantry"]
+    collimator = frame.fields["Collimator"]
+
+    raw_mlc = _get_collimation(frame, "MLCX", 160)
     mlc = _convert_icom_mlc_to_delivery_coords(raw_mlc)
 
-    shrunk_stream, raw_jaw = extract.extract_coll(shrunk_stream, b"ASYMY", 2)
+    raw_jaw = _get_collimation(frame, "ASYMY", 2)
     jaw = _convert_icom_jaw_to_delivery_coords(raw_jaw)
 
     return meterset, gantry, collimator, mlc, jaw
 
 
+def _get_collimation(frame: extract.Frame, label, number):
+    try:
+        items = frame.collimation[label]
+    except KeyError:
+        raise ValueError(f"No {label} positions found within iCOM timestep.")
+
+    if len(items) != number:
+        raise ValueError(
+            f"Expected {number} {label} positions within iCOM timestep, "
+            f"instead found {len(items)}."
+        )
+
+    return items
+
+
 def delivery_from_icom_stream(icom_stream):
-    icom_stream_points = extract.get_data_points(icom_stream)
-    delivery_raw = [
-        get_delivery_data_items(single_icom_stream)
-        for single_icom_stream in icom_stream_points
-    ]
+    spans, items, is_regular = arrays.delivery_items_from_stream(icom_stream)
+
+    mu = items["Delivery MU"]
+    gantry = items["Gantry"]
+    collimator = items["Collimator"]
+    raw_mlc = items["MLCX"]
+    raw_jaw = items["ASYMY"]
+
+    for index in np.flatnonzero(~is_regular):
+        start, end = spans[index]
+        frame = extract.tokenise_frame(icom_stream, start, end)
+
+        mu[index] = frame.fields["Delivery MU"]
+        gantry[index] = frame.fields["Gantry"]
+        collimator[index] = frame.fields["Collimator"]
+        raw_mlc[index] = _get_collimation(frame, "MLCX", 160)
+        raw_jaw[index] = _get_collimation(frame, "ASYMY", 2)
 
-    mu = np.array([item[0] for item in delivery_raw])
     diff_mu = np.concatenate([[0], np.diff(mu)])
     diff_mu[diff_mu < 0] = 0
     mu = np.cumsum(diff_mu)
 
-    gantry = np.array([item[1] for item in delivery_raw])
-    collimator = np.array([item[2] for item in delivery_raw])
-    mlc = np.array([item[3] for item in delivery_raw])
-    jaw = np.array([item[4] for item in delivery_raw])
+    mlc = _convert_icom_mlc_to_delivery_coords(raw_mlc)
+    jaw = _convert_icom_jaw_to_delivery_coords(raw_jaw)
 
     return mu, gantry, collimator, mlc, jaw
 
@@ -81,16 +112,23 @@ class DeliveryIcom(
 ):
     @classmethod
     def from_icom(cls, icom_stream):
-        return cls(  # pylint: disable = protected-access
-            *delivery_from_icom_stream(icom_stream)
-        )._filter_cps()
+        def create():
+            return cls(  # pylint: disable = protected-access
+                *delivery_from_icom_stream(icom_stream)
+            )._filter_cps()
+
+        return pymedphys._base.cache.retrieve_or_create(  # pylint: disable = protected-access
+            cls, "icom", icom_stream, create
+        )
 
 
 def _convert_icom_mlc_to_delivery_coords(raw_mlc):
+    """Either a single timestep's 160 positions, or an array of shape
+    ``(n, 160)`` for many timesteps."""
     mlc = np.array(raw_mlc)
-    mlc = mlc.reshape((80, 2))
-    mlc = np.fliplr(np.flipud(mlc * 10))
-    mlc[:, 1] = -mlc[:, 1]
+    mlc = mlc.reshape(mlc.shape[0:-1] + (80, 2))
+    mlc = mlc[..., ::-1, ::-1] * 10
+    mlc[..., 1] = -mlc[..., 1]
     mlc = np.round(mlc, 10)
 
     return mlc
@@ -98,6 +136,6 @@ def _convert_icom_mlc_to_delivery_coords(raw_mlc):
 
 def _convert_icom_jaw_to_delivery_coords(raw_jaw):
     jaw = np.round(np.array(raw_jaw) * 10, 10)
-    jaw = np.flipud(jaw)
+    jaw = jaw[..., ::-1]
 
     return jaw
@@ -1,21 +1,193 @@
+import collections
 import functools
 import re
+from typing import Iterator, List
 
 from . import mappings
 
 DATE_PATTERN = re.compile(rb"\d\d\d\d-\d\d-\d\d\d\d:\d\d:\d\d")
+DATE_LENGTH = 18
 
 
-def get_data_points(data):
-    date_index = [m.span() for m in DATE_PATTERN.finditer(data)]
-    start_points = [span[0] - 8 for span in date_index]
+# Any iCOM element. The groups are the element's key, as used within
+# ``mappings.ICOM``, and its value.
+ELEMENT_PATTERN = re.compile(
+    rb"""[0\x00pP]((?s:..)[A-Z][A-Z]\x00[PR]).\x00\x00\x00([,\-'"a-zA-Z0-9 \.-]*)"""
+)
+
+COLLIMATOR_LABEL_KEY = b"\xb8\x00DS\x00R"
+COLLIMATOR_ITEM_KEY = b"\x1c\x01DS\x00R"
+
+# The run of positions that directly follows a collimator label. Each
+# position starts with ``COLLIMATOR_ITEM_START`` followed by the four
+# byte length and then the value.
+COLLIMATOR_ITEM_START = b"\n0" + COLLIMATOR_ITEM_KEY
+COLLIMATOR_ITEMS_PATTERN = re.compile(
+    rb"(?:\n0\x1c\x01DS\x00R.\x00\x00\x00-?\d+\.\d+)*"
+)
+
+MISSING_VALUE = b"-32767"
+
+LABELS_BY_KEY = {key: label for label, (key, _, _) in mappings.ICOM.items()}
+
+Frame = collections.namedtuple(
+    "Frame", ["timestamp", "counter", "fields", "collimation"]
+)
 
-    end_points = start_points[1::] + [None]
 
-    data_points = [data[start:end] for start, end in zip(start_points, end_points)]
+def get_data_point_spans(data):
+    """The ``(start, end)`` offsets of each timestep within an iCOM
+    stream."""
+    start_points = [m.start() - 8 for m in DATE_PATTERN.finditer(data)]
+    end_points = start_points[1::] + [len(data)]
+
+    return list(zip(start_points, end_points))
+
+
+def get_data_points(data):
+    data_points = [data[start:end] for start, end in get_data_point_spans(data)]
     return data_points
 
 
+class FrameSplitter:
+    """Split a stream of iCOM data, as it arrives, into timesteps.
+
+    A timestep is only complete once the start of the next one has
+    been received. Received data is held within a single ``bytearray``,
+    and only the data received since the previous call is searched for
+    the start of new timesteps.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._has_start = False
+
+    def __len__(self):
+        """The number of buffered bytes not yet returned as a timestep."""
+        return len(self._buffer)
+
+    def feed(self, data) -> List[bytes]:
+        """Add newly received data, returning any timesteps it completes."""
+        buffer = self._buffer
+        search_start = max(len(buffer) - DATE_LENGTH + 1, 0)
+        buffer += data
+
+        start_points = [0] if self._has_start else []
+        for match in DATE_PATTERN.finditer(buffer, search_start):
+            start = max(match.start() - 8, 0)
+            if not start_points or start > start_points[-1]:
+                start_points.append(start)
+
+        if not start_points:
+            # Only keep enough to find a timestep that starts within the
+            # data still to come.
+            del buffer[: -(DATE_LENGTH + 8)]
+            return []
+
+        frames = [
+            bytes(buffer[start:end])
+            for start, end in zip(start_points, start_points[1::])
+        ]
+
+        del buffer[: start_points[-1]]
+        self._has_start = True
+
+        return frames
+
+
+def tokenise_stream(data) -> Iterator[Frame]:
+    """Tokenise every timestep within an iCOM stream.
+
+    Each timestep is tokenised in place, by offset, without first
+    being copied out of the stream.
+    """
+    for start, end in get_data_point_spans(data):
+        yield tokenise_frame(data, max(start, 0), end)
+
+
+def tokenise_frame(data, start=0, end=None) -> Frame:
+    """Extract all known fields from a single iCOM timestep in one pass.
+
+    This gives the same results as calling ``extract`` and
+    ``extract_coll`` for every field, without rescanning the timestep
+    for each of them.
+
+    Parameters
+    ----------
+    data : bytes-like
+        Either a single timestep, as given by ``get_data_points``, or a
+        whole iCOM stream, in which case ``start`` and ``end`` give the
+        offsets of the timestep within it.
+    start : int, optional
+    end : int, optional
+
+    Returns
+    -------
+    frame : Frame
+        ``timestamp`` and ``counter`` are taken from the timestep's
+        header. ``fields`` is keyed by each label within
+        ``mappings.ICOM``, with the value ``None`` (or ``[]`` for those
+        that gather all values) if the label is not present.
+        ``collimation`` maps each collimator label, such as ``"MLCX"``,
+        to its list of positions.
+    """
+    if end is None:
+        end = len(data)
+
+    timestamp = bytes(data[start + 8 : start + 26]).decode()
+    counter = data[start + 26]
+
+    fields = {
+        label: [] if where == "all" else None
+        for label, (_, _, where) in mappings.ICOM.items()
+    }
+    collimation = {}
+
+    position = start
+    while True:
+        match = ELEMENT_PATTERN.search(data, position, end)
+        if match is None:
+            break
+
+        key, value = match.groups()
+        position = match.end()
+
+        if key == COLLIMATOR_LABEL_KEY:
+            items_end = COLLIMATOR_ITEMS_PATTERN.match(data, position, end).end()
+
+            label = value.decode()
+            if label not in collimation:
+                items = bytes(data[position:items_end]).split(COLLIMATOR_ITEM_START)
+                collimation[label] = [float(item[4:]) for item in items[1:]]
+
+            position = items_end
+            continue
+
+        if not value or value == MISSING_VALUE:
+            continue
+
+        try:
+            label = LABELS_BY_KEY[key]
+        except KeyError:
+            continue
+
+        _, this_type, where = mappings.ICOM[label]
+        if where == "first" and fields[label] is not None:
+            continue
+
+        if this_type is str:
+            value = value.decode()
+        else:
+            value = this_type(value)
+
+        if where == "all":
+            fields[label].append(value)
+        else:
+            fields[label] = value
+
+    return Frame(timestamp, counter, fields, collimation)
+
+
 @functools.lru_cache()
 def get_coll_regex(label, number):
     header = rb"0\xb8\x00DS\x00R.\x00\x00\x00" + label + b"\n"
@@ -40,7 +212,9 @@ def extract_coll(data, label, number):
 @functools.lru_cache()
 def get_extraction_regex(key):
     regex = re.compile(
-        rb"""[0\x00pP]""" + key + rb""".\x00\x00\x00([,\-'"a-zA-Z0-9 \.-]+)"""
+        rb"""[0\x00pP]"""
+        + re.escape(key)
+        + rb""".\x00\x00\x00([,\-'"a-zA-Z0-9 \.-]+)"""
     )
     return regex
 
@@ -2,8 +2,6 @@ import logging
 import pathlib
 import re
 import socket
-import time
-import traceback
 
 from . import patients
 
@@ -89,20 +87,4 @@ def listen(ip, data_dir):
     finally:
         s.close()
         logging.info(s)
-
-
-def listen_cli(args):
-    while True:
-        try:
-            listen(args.ip, args.directory)
-        except KeyboardInterrupt:
-            raise
-        except:  # pylint: disable = bare-except
-            traceback.print_exc()
-
-        logging.warning(
-            "The iCOM listener dropped out. Will wait 15 minutes, and "
-            "then retry connection."
-        )
-
-        time.sleep(60 * 15)
+        patient_icom_data.close()
@@ -0,0 +1,387 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Listens to the iCOM streams of many Linacs from within one process.
+"""
+
+import asyncio
+import concurrent.futures
+import contextlib
+import dataclasses
+import datetime
+import logging
+import pathlib
+import time
+from typing import Callable, Iterable, Optional
+
+from . import extract, listener, patients, segments
+
+READ_SIZE = 65536
+RECEIVE_TIMEOUT = 10
+INITIAL_BACKOFF = 1
+MAX_BACKOFF = 60 * 15
+
+
+@dataclasses.dataclass
+class ConnectionStats:
+    """Counters describing a single Linac's iCOM connection.
+
+    All times are from ``time.monotonic`` unless otherwise stated.
+    """
+
+    ip: str
+    connected: bool = False
+    connections: int = 0
+    disconnections: int = 0
+    bytes_received: int = 0
+    frames_received: int = 0
+    frames_handled: int = 0
+    handling_errors: int = 0
+    last_receive_time: Optional[float] = None
+    last_frame_timestamp: Optional[str] = None
+    handling_lag: float = 0
+    max_handling_lag: float = 0
+
+    _window_start_time: float = dataclasses.field(
+        default_factory=time.monotonic, init=False, repr=False
+    )
+    _window_start_bytes: int = dataclasses.field(default=0, init=False, repr=False)
+    _window_start_frames: int = dataclasses.field(default=0, init=False, repr=False)
+
+    def throughput(self):
+        """The bytes and frames received per second since the previous
+        call."""
+        now = time.monotonic()
+        elapsed = max(now - self._window_start_time, 1e-9)
+
+        bytes_per_second = (self.bytes_received - self._window_start_bytes) / elapsed
+        frames_per_second = (self.frames_received - self._window_start_frames) / elapsed
+
+        self._window_start_time = now
+        self._window_start_bytes = self.bytes_received
+        self._window_start_frames = self.frames_received
+
+        return bytes_per_second, frames_per_second
+
+    def timestamp_lag(self):
+        """The number of seconds between the Linac's timestamp of the
+        most recent frame and now, assuming the Linac and this computer
+        share a clock and timezone."""
+        if self.last_frame_timestamp is None:
+            return None
+
+        try:
+            frame_time = datetime.datetime.strptime(
+                self.last_frame_timestamp, "%Y-%m-%d%H:%M:%S"
+            )
+        except ValueError:
+            return None
+
+        return (datetime.datetime.now() - frame_time).total_seconds()
+
+
+class IcomConnection:
+    """Receives the iCOM stream from one Linac, reconnecting with an
+    exponential backoff whenever the connection fails.
+
+    Parameters
+    ----------
+    ip : str
+        The IP address of the Linac. It labels the Linac's timesteps and
+        statistics.
+    handle_frame : Callable[[str, bytes], None]
+        Called with the IP and the data of each timestep, in order. It is
+        run within ``executor`` so that handling does not block the
+        event loop. Exceptions raised while handling a timestep are
+        logged and counted within ``stats.handling_errors``, and
+        receiving continues with the next timestep.
+    executor : concurrent.futures.Executor, optional
+        By default a single worker thread for this connection, so that
+        frames are handled in the order they were received. An executor
+        shared with other connections delays their handling whenever
+        this connection's handling is slow.
+    port : int, optional
+    host : str, optional
+        The address to connect to, by default ``ip``. Given when the
+        Linac is reached at an address other than its IP, such as a
+        replayed Linac on its own port of ``127.0.0.1``.
+    receive_timeout : float, optional
+        Reconnect if no data is received for this many seconds.
+    initial_backoff, max_backoff : float, optional
+        The wait before reconnecting doubles after each failed attempt,
+        starting at ``initial_backoff`` seconds and capped at
+        ``max_backoff``. It is reset once data is received.
+    """
+
+    def __init__(
+        self,
+        ip: str,
+        handle_frame: Callable[[str, bytes], None],
+        executor: concurrent.futures.Executor = None,
+        port: int = listener.ICOM_PORT,
+        host: str = None,
+        receive_timeout: float = RECEIVE_TIMEOUT,
+        initial_backoff: float = INITIAL_BACKOFF,
+        max_backoff: float = MAX_BACKOFF,
+    ):
+        if executor is None:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+        self.ip = ip
+        self.host = ip if host is None else host
+        self.port = port
+        self.stats = ConnectionStats(ip)
+
+        self._handle_frame = handle_frame
+        self._executor = executor
+        self._receive_timeout = receive_timeout
+        self._initial_backoff = initial_backoff
+        self._max_backoff = max_backoff
+
+    async def run(self):
+        """Receive and handle the stream until cancelled."""
+        backoff = self._initial_backoff
+
+        while True:
+            try:
+                received = await self._receive()
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                logging.warning(
+                    "iCOM connection to %(ip)s dropped out: %(error)r",
+                    {"ip": self.ip, "error": e},
+                )
+                received = False
+
+            if received:
+                backoff = self._initial_backoff
+
+            logging.info(
+                "Will retry the iCOM connection to %(ip)s in %(backoff)s seconds.",
+                {"ip": self.ip, "backoff": backoff},
+            )
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self._max_backoff)
+
+    async def _receive(self):
+        """Receive until the connection fails. Returns whether any data
+        was received."""
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self._receive_timeout
+        )
+
+        self.stats.connected = True
+        self.stats.connections += 1
+        logging.info("Connected to the iCOM stream of %(ip)s.", {"ip": self.ip})
+
+        splitter = extract.FrameSplitter()
+        received = False
+        loop = asyncio.get_running_loop()
+
+        try:
+            while True:
+                data = await asyncio.wait_for(
+                    reader.read(READ_SIZE), self._receive_timeout
+                )
+                if not data:
+                    logging.warning(
+                        "iCOM connection to %(ip)s was closed.", {"ip": self.ip}
+                    )
+                    return received
+
+                received = True
+                receive_time = time.monotonic()
+                self.stats.bytes_received += len(data)
+                self.stats.last_receive_time = receive_time
+
+                for frame in splitter.feed(data):
+                    self.stats.frames_received += 1
+
+                    try:
+                        self.stats.last_frame_timestamp = frame[8:26].decode()
+                        await loop.run_in_executor(
+                            self._executor, self._handle_frame, self.ip, frame
+                        )
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception:  # pylint: disable = broad-except
+                        self.stats.handling_errors += 1
+                        logging.exception(
+                            "Unable to handle a timestep from %(ip)s.", {"ip": self.ip}
+                        )
+                        continue
+
+                    self.stats.frames_handled += 1
+                    self.stats.handling_lag = time.monotonic() - receive_time
+                    self.stats.max_handling_lag = max(
+                        self.stats.max_handling_lag, self.stats.handling_lag
+                    )
+        finally:
+            self.stats.connected = False
+            self.stats.disconnections += 1
+            writer.close()
+
+
+class FrameHandler:
+    """The same handling of each timestep as ``listener.listen``. The
+    timestep is saved, and recorded against the patient whenever one is
+    loaded.
+
+    Each Linac's timesteps need to be handled in order, although
+    different Linacs may be handled concurrently. ``close`` needs to be
+    called once listening has stopped.
+
+    Parameters
+    ----------
+    data_dir : os.PathLike
+    live_storage : str, optional
+        Either ``"files"``, to save each timestep within
+        ``<data_dir>/live/<ip>/<counter>.txt`` as ``listener.listen``
+        does, or ``"segments"`` to instead append it to the hourly
+        segments of a ``segments.SegmentStore`` within
+        ``<data_dir>/segments``.
+    """
+
+    def __init__(self, data_dir, live_storage="files"):
+        data_dir = pathlib.Path(data_dir)
+        self._patient_icom_data = patients.PatientIcomData(
+            data_dir.joinpath("patients")
+        )
+        self._segment_store = None
+        self._ip_directories = {}
+
+        if live_storage == "segments":
+            self._segment_store = segments.SegmentStore(data_dir.joinpath("segments"))
+        elif live_storage == "files":
+            self._live_dir = data_dir.joinpath("live")
+        else:
+            raise ValueError(f"Unknown live storage `{live_storage}`")
+
+    def __call__(self, ip, frame):
+        if self._segment_store is not None:
+            self._segment_store.append(ip, frame)
+        else:
+            listener.save_an_icom_batch(
+                extract.DATE_PATTERN, self._get_ip_directory(ip), frame
+            )
+
+        self._patient_icom_data.update_data(ip, frame)
+
+    def close(self):
+        """Finish the patient recordings in progress, and close, and
+        compress, any open segments."""
+        self._patient_icom_data.close()
+
+        if self._segment_store is not None:
+            self._segment_store.close()
+
+    def _get_ip_directory(self, ip):
+        try:
+            return self._ip_directories[ip]
+        except KeyError:
+            pass
+
+        ip_directory = self._live_dir.joinpath(ip)
+        ip_directory.mkdir(exist_ok=True, parents=True)
+        self._ip_directories[ip] = ip_directory
+
+        return ip_directory
+
+
+def create_frame_handler(data_dir, live_storage="files") -> FrameHandler:
+    """Create the handling of each timestep used by ``listen_cli``. See
+    ``FrameHandler``."""
+    return FrameHandler(data_dir, live_storage)
+
+
+async def listen_many(
+    ips: Iterable[str],
+    handle_frame: Callable[[str, bytes], None],
+    port: int = listener.ICOM_PORT,
+    stats_interval: float = 60,
+    **kwargs,
+):
+    """Listen to the iCOM streams of many Linacs until cancelled.
+
+    Parameters
+    ----------
+    ips : Iterable[str]
+        The IP addresses of the Linacs.
+    handle_frame : Callable[[str, bytes], None]
+        Called with the IP and the data of each timestep. Each Linac's
+        timesteps are handled, in order, by that Linac's own worker
+        thread, so that slow handling for one Linac does not stall the
+        others. It is therefore called concurrently for different IPs.
+    port : int, optional
+    stats_interval : float, optional
+        How often, in seconds, to log each connection's counters.
+    **kwargs
+        Passed to ``IcomConnection``.
+    """
+    with contextlib.ExitStack() as stack:
+        connections = [
+            IcomConnection(
+                ip,
+                handle_frame,
+                executor=stack.enter_context(
+                    concurrent.futures.ThreadPoolExecutor(max_workers=1)
+                ),
+                port=port,
+                **kwargs,
+            )
+            for ip in ips
+        ]
+
+        tasks = [asyncio.ensure_future(connection.run()) for connection in connections]
+        tasks.append(asyncio.ensure_future(_log_stats(connections, stats_interval)))
+
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+async def _log_stats(connections, stats_interval):
+    while True:
+        await asyncio.sleep(stats_interval)
+        for connection in connections:
+            stats = connection.stats
+            bytes_per_second, frames_per_second = stats.throughput()
+
+            logging.info(
+                "%(ip)s | connected: %(connected)s | reconnects: %(reconnects)s | "
+                "%(bytes_per_second).0f B/s | %(frames_per_second).1f frames/s | "
+                "handling errors: %(handling_errors)s | "
+                "handling lag: %(handling_lag).3f s | timestamp lag: %(timestamp_lag)s s",
+                {
+                    "ip": stats.ip,
+                    "connected": stats.connected,
+                    "reconnects": max(stats.connections - 1, 0),
+                    "bytes_per_second": bytes_per_second,
+                    "frames_per_second": frames_per_second,
+                    "handling_errors": stats.handling_errors,
+                    "handling_lag": stats.handling_lag,
+                    "timestamp_lag": stats.timestamp_lag(),
+                },
+            )
+
+
+def listen_cli(args):
+    handle_frame = create_frame_handler(args.directory, args.live_storage)
+
+    try:
+        asyncio.run(listen_many(args.ip, handle_frame))
+    finally:
+        handle_frame.close()
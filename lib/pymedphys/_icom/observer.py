@@ -1,41 +1,215 @@
+import logging
+import os
 import pathlib
+import threading
 import time
+from typing import Callable, Dict, List
 
 from pymedphys._imports import watchdog
 
 import pymedphys._utilities.filesystem
 
-
-def read_and_trigger_callback(event, callback):
-    event_source_path = pathlib.Path(event.src_path)
-    ip = event_source_path.parent.name
-
-    with pymedphys._utilities.filesystem.open_no_lock(  # pylint: disable = protected-access
-        event_source_path, "rb"
-    ) as f:
-        data = f.read()
-
-    callback(ip, data)
-
-
-def create_event_handler(callback):
+from . import segments
+
+FRAME_FILE_PATTERN = "*/[0-2][0-9][0-9].txt"
+SEGMENT_FILE_PATTERN = f"*/*{segments.OPEN_SUFFIX}"
+
+# The seconds between each batch of file events being processed.
+WINDOW = 0.5
+
+# The seconds a file needs to have been left unmodified before it is
+# read. A burst of writes to the one file is then only read once.
+DEBOUNCE = 0.1
+
+# The most seconds a file is left unread for. A file that is written to
+# more often than the debounce allows, such as an open segment while a
+# Linac is delivering, is otherwise never read.
+MAX_LATENCY = 2.0
+
+
+class BatchedFileReader:
+    """Coalesces the file events of the iCOM listener's output so that
+    each file is read once per burst of writes.
+
+    File events, passed to ``record``, only note which paths have
+    changed. Those paths are
+    then read together by ``process_pending``, in the order that they
+    were first modified, once they have been left unmodified for
+    ``debounce`` seconds, or once ``max_latency`` seconds have passed
+    since they were first modified, whichever comes first.
+
+    Two kinds of file are handled. ``<ip>/<counter>.txt`` files each
+    hold a single timestep and are read whole, but only when their size
+    or modification time has changed since they were last read. Open
+    ``<ip>/*.seg`` segments of a ``segments.SegmentStore`` are appended
+    to, so the offset read up to is tracked and only newly appended
+    timesteps are read. Segments first seen are read from their start.
+    Once a segment is closed, and so removed, any of its timesteps not
+    yet read are read from the closed segment instead.
+
+    Parameters
+    ----------
+    callback : Callable[[str, bytes], None]
+        Called with the Linac's IP, taken from the name of the file's
+        directory, and each timestep read.
+    debounce : float, optional
+    max_latency : float, optional
+    """
+
+    def __init__(
+        self,
+        callback: Callable[[str, bytes], None],
+        debounce=DEBOUNCE,
+        max_latency=MAX_LATENCY,
+    ):
+        self._callback = callback
+        self._debounce = debounce
+        self._max_latency = max_latency
+
+        self._lock = threading.Lock()
+        self._pending: Dict[str, List[float]] = {}
+
+        self._offsets: Dict[str, int] = {}
+        self._read_stats: Dict[str, tuple] = {}
+
+    def record(self, path, now=None):
+        if now is None:
+            now = time.monotonic()
+
+        with self._lock:
+            try:
+                self._pending[path][1] = now
+            except KeyError:
+                self._pending[path] = [now, now]
+
+    def process_pending(self, now=None) -> int:
+        """Read the files whose writes have settled, and pass their new
+        timesteps to the callback.
+
+        Returns
+        -------
+        number_of_frames : int
+            The number of timesteps passed to the callback.
+        """
+        if now is None:
+            now = time.monotonic()
+
+        with self._lock:
+            ready = sorted(
+                (
+                    (first_seen, path)
+                    for path, (first_seen, last_seen) in self._pending.items()
+                    if now - last_seen >= self._debounce
+                    or now - first_seen >= self._max_latency
+                )
+            )
+            for _, path in ready:
+                del self._pending[path]
+
+        number_of_frames = 0
+        for _, path in ready:
+            path = pathlib.Path(path)
+            ip = path.parent.name
+
+            try:
+                frames = self._read_new_frames(path)
+            except FileNotFoundError:
+                self._offsets.pop(str(path), None)
+                self._read_stats.pop(str(path), None)
+                continue
+
+            for frame in frames:
+                try:
+                    self._callback(ip, frame)
+                except Exception:  # pylint: disable = broad-except
+                    logging.exception(
+                        "Unable to handle a timestep read from %(path)s",
+                        {"path": path},
+                    )
+
+            number_of_frames += len(frames)
+
+        if ready:
+            logging.debug(
+                "Read %(number_of_frames)s timesteps from %(number_of_files)s files",
+                {"number_of_frames": number_of_frames, "number_of_files": len(ready)},
+            )
+
+        return number_of_frames
+
+    def _read_new_frames(self, path: pathlib.Path) -> List[bytes]:
+        if not path.name.endswith(segments.OPEN_SUFFIX):
+            return self._read_changed_frame_file(path)
+
+        try:
+            return self._read_appended_frames(path)
+        except FileNotFoundError:
+            offset = self._offsets.pop(str(path), 0)
+            return list(segments.iter_closed_frames(path, offset))
+
+    def _read_changed_frame_file(self, path: pathlib.Path) -> List[bytes]:
+        key = str(path)
+
+        with pymedphys._utilities.filesystem.open_no_lock(  # pylint: disable = protected-access
+            path, "rb"
+        ) as f:
+            stat = os.fstat(f.fileno())
+            stat_key = (stat.st_size, stat.st_mtime_ns)
+            if self._read_stats.get(key) == stat_key:
+                return []
+
+            self._read_stats[key] = stat_key
+            return [f.read()]
+
+    def _read_appended_frames(self, path: pathlib.Path) -> List[bytes]:
+        key = str(path)
+
+        with pymedphys._utilities.filesystem.open_no_lock(  # pylint: disable = protected-access
+            path, "rb"
+        ) as f:
+            offset = self._offsets.get(key, 0)
+            if os.fstat(f.fileno()).st_size < offset:
+                offset = 0
+
+            f.seek(offset)
+            frames = []
+            for frame in segments._iter_records(  # pylint: disable = protected-access
+                f
+            ):
+                frames.append(frame)
+                offset = f.tell()
+
+            self._offsets[key] = offset
+
+        return frames
+
+    def run(self, stop_event: threading.Event, window=WINDOW):
+        """Process the pending files every ``window`` seconds until
+        ``stop_event`` is set."""
+        while not stop_event.wait(window):
+            self.process_pending()
+
+        self.process_pending(now=float("inf"))
+
+
+def create_event_handler(batched_file_reader: BatchedFileReader):
     def on_created(event):
-        print(f"File created: {event.src_path}")
-        read_and_trigger_callback(event, callback)
+        batched_file_reader.record(event.src_path)
 
-    def on_deleted(_):
-        pass
+    def on_deleted(event):
+        # Segments are removed once closed, and are then read one last
+        # time, from the closed segment, in their turn.
+        batched_file_reader.record(event.src_path)
 
     def on_modified(event):
-        print(f"File modified: {event.src_path}")
-        read_and_trigger_callback(event, callback)
+        batched_file_reader.record(event.src_path)
 
     def on_moved(_):
         pass
 
     event_handler = watchdog.events.PatternMatchingEventHandler(
-        patterns="*/[0-2][0-9][0-9].txt",
-        ignore_patterns="",
+        patterns=[FRAME_FILE_PATTERN, SEGMENT_FILE_PATTERN],
+        ignore_patterns=[],
         ignore_directories=True,
         case_sensitive=True,
     )
@@ -47,8 +221,17 @@ def create_event_handler(callback):
     return event_handler
 
 
-def observe_with_callback(directories_to_watch, callback):
-    event_handler = create_event_handler(callback)
+def observe_with_callback(
+    directories_to_watch,
+    callback,
+    window=WINDOW,
+    debounce=DEBOUNCE,
+    max_latency=MAX_LATENCY,
+):
+    batched_file_reader = BatchedFileReader(
+        callback, debounce=debounce, max_latency=max_latency
+    )
+    event_handler = create_event_handler(batched_file_reader)
 
     observers = []
 
@@ -62,10 +245,11 @@ def observe_with_callback(directories_to_watch, callback):
     for observer in observers:
         observer.start()
 
+    stop_event = threading.Event()
     try:
-        while True:
-            time.sleep(1)
+        batched_file_reader.run(stop_event, window=window)
     finally:
+        stop_event.set()
         for observer in observers:
             observer.stop()
             observer.join()
@@ -1,15 +1,34 @@
 import logging
 import lzma
+import os
 import pathlib
+import re
+import time
 import traceback
 
 import pymedphys
 
-from . import extract, observer
+from . import delivery as _delivery
+from . import extract, observer, segments
 
 # TODO: Convert logging to use lazy formatting
 # see https://docs.python.org/3/howto/logging.html#optimization
 
+MAX_FRAMES_PER_RECORDING = 86400
+FLUSH_INTERVAL = 5
+
+PARTIAL_SUFFIX = ".part"
+
+# Each flush starts a new xz stream, so matches are never found further
+# back than a few seconds of timesteps. A small dictionary compresses
+# these just as well as the default 8 MiB one, while needing a few MB
+# rather than ~100 MB per open recording.
+COMPRESSION_FILTERS = [{"id": lzma.FILTER_LZMA2, "preset": 6, "dict_size": 2 ** 18}]
+
+# The patient and machine elements of a timestep precede those of the
+# delivery itself, whose group is "R".
+DELIVERY_ELEMENT_PATTERN = re.compile(rb"[0\x00pP](?s:..)[A-Z][A-Z]\x00R")
+
 
 class NoMUDelivered(ValueError):
     pass
@@ -39,8 +58,42 @@ def validate_data(data_to_be_saved):
     return delivery
 
 
+class RecordingValidator:
+    """Validates a recording incrementally, as each batch of its
+    timesteps is written, so that the archive never needs to be read
+    back in whole.
+
+    Each batch is decoded in the same way as ``validate_data`` decodes a
+    whole recording. The last timestep of the previous batch is decoded
+    again with each batch, so that the MU delivered between batches is
+    included.
+    """
+
+    def __init__(self):
+        self.total_mu = 0.0
+        self.is_readable = True
+        self._last_frame = b""
+
+    def update(self, data: bytes):
+        if not self.is_readable or not data:
+            return
+
+        try:
+            mu, *_ = _delivery.delivery_from_icom_stream(self._last_frame + data)
+            last_frame = extract.get_data_points(data)[-1]
+        except Exception as _:  # pylint: disable = broad-except
+            logging.debug("Was not able to transform the iCOM dataset.")
+
+            traceback.print_exc()
+            self.is_readable = False
+            return
+
+        self.total_mu += float(mu[-1])
+        self._last_frame = last_frame
+
+
 def save_patient_data(start_timestamp, patient_data, output_dir: pathlib.Path):
-    _, patient_id = extract.extract(patient_data[0], "Patient ID")
+    patient_id = extract.tokenise_frame(patient_data[0]).fields["Patient ID"]
 
     logging.debug(
         "When preparing patient record to be saved, the patient id was "
@@ -49,49 +102,136 @@ def save_patient_data(start_timestamp, patient_data, output_dir: pathlib.Path):
     )
 
     for data in patient_data:
-        _, patient_name = extract.extract(data, "Patient Name")
+        patient_name = extract.tokenise_frame(data).fields["Patient Name"]
         if not patient_name is None:
             break
 
-    logging.debug(
-        "When preparing patient record to be saved, the patient name was "
-        "%(patient_name)s",
-        {"patient_name": patient_name},
-    )
-
-    patient_dir = output_dir.joinpath(f"{patient_id}_{patient_name}")
-    patient_dir.mkdir(parents=True, exist_ok=True)
+    recording = PatientRecording(output_dir, start_timestamp, patient_id, patient_name)
+    for data in patient_data:
+        recording.append(data)
+
+    recording.finish()
+
+
+class PatientRecording:
+    """Writes a patient's iCOM timesteps to their archive as they are
+    received.
+
+    The timesteps are compressed incrementally into
+    ``<patient_id>_<patient_name>/<timestamp>.xz.part``. Every
+    ``flush_interval`` seconds the current xz stream is ended, and a new
+    one started, so that a crash loses at most the last few seconds of
+    the recording. Concatenated xz streams are read back by
+    ``lzma.open`` as one. Each stream's timesteps are validated as it
+    is ended, so finishing the recording doesn't need to read the
+    archive back. Should the recording never be finished, the archive
+    is recovered by ``recover_partial_recordings``.
+
+    Parameters
+    ----------
+    output_dir : os.PathLike
+    start_timestamp : str
+        The ISO timestamp of the recording's first timestep.
+    patient_id : str
+    patient_name : str
+    flush_interval : float, optional
+    """
+
+    def __init__(
+        self,
+        output_dir,
+        start_timestamp,
+        patient_id,
+        patient_name,
+        flush_interval=FLUSH_INTERVAL,
+    ):
+        self.patient_id = patient_id
+        self.patient_name = patient_name
+        self.number_of_frames = 0
+
+        patient_dir = pathlib.Path(output_dir).joinpath(f"{patient_id}_{patient_name}")
+        patient_dir.mkdir(parents=True, exist_ok=True)
+
+        logging.debug(
+            "The patient archive directory to be used is %(patient_dir)s.",
+            {"patient_dir": patient_dir},
+        )
 
-    logging.debug(
-        "The patient archive directory to be used is %(patient_dir)s.",
-        {"patient_dir": patient_dir},
-    )
+        reformatted_timestamp = (
+            start_timestamp.replace(":", "").replace("T", "_").replace("-", "")
+        )
+        self.filename = patient_dir.joinpath(f"{reformatted_timestamp}.xz")
+        self._partial_filename = patient_dir.joinpath(
+            f"{reformatted_timestamp}.xz{PARTIAL_SUFFIX}"
+        )
 
-    reformatted_timestamp = (
-        start_timestamp.replace(":", "").replace("T", "_").replace("-", "")
-    )
-    filename = patient_dir.joinpath(f"{reformatted_timestamp}.xz")
+        self._file = open(self._partial_filename, "wb")
+        self._compressor = lzma.LZMACompressor(filters=COMPRESSION_FILTERS)
+        self._validator = RecordingValidator()
+        self._unvalidated = []
+        self._flush_interval = flush_interval
+        self._last_flush = time.monotonic()
+        self._is_flushed = True
+
+    def append(self, data):
+        self._file.write(self._compressor.compress(data))
+        self._unvalidated.append(data)
+        self.number_of_frames += 1
+        self._is_flushed = False
+
+        if time.monotonic() - self._last_flush >= self._flush_interval:
+            self.flush()
+
+    def flush(self):
+        """End the current xz stream, write it to disk, and validate the
+        timesteps within it."""
+        if not self._is_flushed:
+            self._file.write(self._compressor.flush())
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+            self._compressor = lzma.LZMACompressor(filters=COMPRESSION_FILTERS)
+            self._is_flushed = True
+
+            self._validator.update(b"".join(self._unvalidated))
+            self._unvalidated = []
+
+        self._last_flush = time.monotonic()
+
+    def finish(self):
+        """Close the archive, and then save it.
+
+        Archives with no MU delivered are removed, and those that can't
+        be read as a delivery are moved into ``unknown_error_in_record``.
+        """
+        self.flush()
+        self._file.close()
+
+        _save_archive(
+            self._validator,
+            self._partial_filename,
+            self.filename,
+            f"{self.patient_name} ({self.patient_id})",
+        )
 
-    data = b""
-    for item in patient_data:
-        data += item
 
-    try:
-        delivery = validate_data(data)
+def _save_archive(
+    validator: RecordingValidator, partial_filename, filename, description
+):
+    if validator.is_readable and validator.total_mu == 0:
         logging.info(  # pylint: disable = logging-fstring-interpolation
-            f"Delivery with a total MU of {round(delivery.mu[-1],1)} for "
-            f"{patient_name} ({patient_id}) is being saved within "
-            f"{filename}."
-        )
-    except NoMUDelivered as _:
-        logging.info(  # pylint: disable = logging-fstring-interpolation
-            "No MU delivered, not saving delivery data for "
-            f"{patient_name} ({patient_id})."
+            f"No MU delivered, not saving delivery data for {description}."
         )
+        partial_filename.unlink()
 
         return
 
-    except UnableToReadIcom as _:
+    if validator.is_readable:
+        logging.info(  # pylint: disable = logging-fstring-interpolation
+            f"Delivery with a total MU of {round(validator.total_mu, 1)} for "
+            f"{description} is being saved within {filename}."
+        )
+    else:
         new_location = filename.parent.parent.joinpath(
             "unknown_error_in_record", filename.parent.name, filename.name
         )
@@ -101,67 +241,204 @@ def save_patient_data(start_timestamp, patient_data, output_dir: pathlib.Path):
         filename = new_location
 
         logging.warning(  # pylint: disable = logging-fstring-interpolation
-            "Unknown error within the record for "
-            f"{patient_name} ({patient_id}). "
+            f"Unknown error within the record for {description}. "
             f"Will instead save the record within {str(filename)}."
         )
 
-    with lzma.open(filename, "w") as f:
-        f.write(data)
+    os.replace(partial_filename, filename)
+
+
+def recover_partial_recordings(output_dir):
+    """Finish the patient archives left partially written by a
+    ``PatientRecording`` that was never finished, such as when the
+    listener was killed.
+
+    Each ``.xz.part`` archive is truncated to its complete xz streams,
+    dropping any final stream that was cut short. It is then validated
+    and saved in the same way as ``PatientRecording.finish``. This must
+    only be run while no recording is being written within
+    ``output_dir``.
+    """
+    for partial_filename in sorted(
+        pathlib.Path(output_dir).glob(f"*/*.xz{PARTIAL_SUFFIX}")
+    ):
+        filename = partial_filename.with_name(
+            partial_filename.name[: -len(PARTIAL_SUFFIX)]
+        )
+
+        logging.warning(
+            "Recovering the unfinished patient archive %(filename)s.",
+            {"filename": partial_filename},
+        )
+
+        validator = RecordingValidator()
+        complete_length = 0
+        with open(partial_filename, "rb") as f:
+            for data, complete_length in _iter_complete_xz_streams(f):
+                validator.update(data)
+
+        if complete_length == 0:
+            partial_filename.unlink()
+            continue
+
+        with open(partial_filename, "r+b") as f:
+            f.truncate(complete_length)
+
+        _save_archive(
+            validator,
+            partial_filename,
+            filename,
+            f"the recovered archive {partial_filename.parent.name}",
+        )
+
+
+def _iter_complete_xz_streams(f, block_size=2 ** 16):
+    """Decompress each complete xz stream of a file in turn, along with
+    the offset of the end of that stream."""
+    decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_XZ)
+    decompressed = []
+    position = 0
+    data = b""
+
+    while True:
+        if not data:
+            data = f.read(block_size)
+            if not data:
+                return
+
+        try:
+            decompressed.append(decompressor.decompress(data))
+        except lzma.LZMAError:
+            return
+
+        if not decompressor.eof:
+            position += len(data)
+            data = b""
+            continue
+
+        unused_data = decompressor.unused_data
+        position += len(data) - len(unused_data)
+        yield b"".join(decompressed), position
+
+        decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_XZ)
+        decompressed = []
+        data = unused_data
 
 
 class PatientIcomData:
-    def __init__(self, output_dir):
-        self._data = {}
-        self._usage_start = {}
-        self._current_patient_data = {}
+    """Collects each Linac's iCOM timesteps by patient, saving each
+    patient's record once their delivery has completed.
+
+    Only the most recent timestep is held for each Linac, with the
+    timesteps of any delivery being recorded written straight to a
+    ``PatientRecording``. A recording is finished whenever the patient
+    is unloaded or changes, or once it reaches
+    ``max_frames_per_recording`` timesteps, so that memory use stays
+    bounded however long the listener runs.
+
+    Any archives left unfinished within ``output_dir``, by a previous
+    run that was stopped without ``close`` being called, are recovered
+    upon creation. ``close`` finishes the recordings still in progress.
+
+    Parameters
+    ----------
+    output_dir : os.PathLike
+        The directory to save the patient records within.
+    max_frames_per_recording : int, optional
+        By default 86400 timesteps, which is over six hours of iCOM
+        data.
+    """
+
+    def __init__(self, output_dir, max_frames_per_recording=MAX_FRAMES_PER_RECORDING):
+        self._previous_data = {}
+        self._identity = {}
+        self._recordings = {}
         self._output_dir = pathlib.Path(output_dir)
+        self._max_frames_per_recording = max_frames_per_recording
+
+        recover_partial_recordings(self._output_dir)
+
+    def close(self):
+        """Finish every recording still in progress."""
+        recordings, self._recordings = self._recordings, {}
+
+        for recording in recordings.values():
+            if recording is None:
+                continue
+
+            try:
+                recording.finish()
+            except Exception:  # pylint: disable = broad-except
+                logging.exception(
+                    "Unable to finish the recording within %(filename)s.",
+                    {"filename": recording.filename},
+                )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
 
     def update_data(self, ip, data):
         try:
-            if self._data[ip][-1][26] == data[26]:
+            previous_data = self._previous_data[ip]
+        except KeyError:
+            previous_data = None
+
+        if previous_data is not None:
+            if previous_data[26] == data[26]:
                 logging.warning("Skip this data item, duplicate of previous data item.")
-                if self._data[ip][-1] != data:
+                if previous_data != data:
                     raise ValueError("Duplicate ID, but not duplicate data!")
 
                 return
 
-            if (self._data[ip][-1][26] + 1) % 256 != data[26]:
-                raise ValueError("Data stream appears to be arriving out of order")
-            self._data[ip].append(data)
-        except KeyError:
-            self._data[ip] = [data]
+            if (previous_data[26] + 1) % 256 != data[26]:
+                logging.warning(
+                    "Timesteps from %(ip)s appear to have been missed, the "
+                    "counter jumped from %(previous)s to %(current)s.",
+                    {"ip": ip, "previous": previous_data[26], "current": data[26]},
+                )
+
+        self._previous_data[ip] = data
 
         timestamp = data[8:26].decode()
-        shrunk_data, patient_id = extract.extract(data, "Patient ID")
-        shrunk_data, patient_name = extract.extract(shrunk_data, "Patient Name")
-        shrunk_data, machine_id = extract.extract(shrunk_data, "Machine ID")
+        patient_id, patient_name, machine_id = self._get_identity(ip, data)
         logging.info(  # pylint: disable = logging-fstring-interpolation
             f"IP: {ip} | Timestamp: {timestamp} | "
             f"Patient ID: {patient_id} | "
             f"Patient Name: {patient_name} | Machine ID: {machine_id}"
         )
 
-        try:
-            usage_start = self._usage_start[ip]
-        except KeyError:
-            usage_start = None
+        recording = self._recordings.get(ip)
 
-        if patient_id is not None:
-            if usage_start is None:
-                self._current_patient_data[ip] = []
+        if recording is not None and (
+            patient_id != recording.patient_id
+            or recording.number_of_frames >= self._max_frames_per_recording
+        ):
+            logging.debug(
+                "Delivery recorded within %(filename)s appears to have completed.",
+                {"filename": recording.filename},
+            )
+
+            recording.finish()
+            recording = self._recordings[ip] = None
 
-                timestamp = data[8:26].decode()
+        if patient_id is not None:
+            if recording is None:
                 iso_timestamp = f"{timestamp[0:10]}T{timestamp[10::]}"
-                self._usage_start[ip] = iso_timestamp
+                recording = self._recordings[ip] = PatientRecording(
+                    self._output_dir, iso_timestamp, patient_id, patient_name
+                )
 
                 logging.debug(
                     "Starting data collection for patient id %(patient_id)s. "
                     "Recording started at %(usage_start)s.",
-                    {"usage_start": self._usage_start[ip], "patient_id": patient_id},
+                    {"usage_start": iso_timestamp, "patient_id": patient_id},
                 )
 
-            self._current_patient_data[ip].append(data)
+            recording.append(data)
 
             logging.debug(
                 "iCOM stream appended to the data being collected for "
@@ -169,27 +446,50 @@ class PatientIcomData:
                 {"patient_id": patient_id},
             )
 
-        elif not usage_start is None:
-            logging.debug(
-                "Delivery that started at %(usage_start)s appears to "
-                "have completed.",
-                {"usage_start": usage_start},
-            )
-
-            save_patient_data(
-                usage_start, self._current_patient_data[ip], self._output_dir
-            )
-            self._current_patient_data[ip] = None
-            self._usage_start[ip] = None
-
         else:
             logging.debug("No delivery is currently being recorded.")
 
+    def _get_identity(self, ip, data):
+        """The patient ID, patient name and machine ID of a timestep.
+
+        These are only extracted again when the timestep's header, the
+        bytes before its first delivery element, differs from that of
+        the Linac's previous timestep.
+        """
+        match = DELIVERY_ELEMENT_PATTERN.search(data, 27)
+        header_end = len(data) if match is None else match.start()
+        header = data[27:header_end]
+
+        try:
+            previous_header, identity = self._identity[ip]
+            if previous_header == header:
+                return identity
+        except KeyError:
+            pass
+
+        fields = extract.tokenise_frame(data, 0, header_end).fields
+        identity = (fields["Patient ID"], fields["Patient Name"], fields["Machine ID"])
+        self._identity[ip] = (header, identity)
+
+        return identity
+
 
 def archive_by_patient(directories_to_watch, output_dir):
-    patient_icom_data = PatientIcomData(output_dir)
+    with PatientIcomData(output_dir) as patient_icom_data:
+
+        def archive_by_patient_callback(ip, data):
+            patient_icom_data.update_data(ip, data)
+
+        observer.observe_with_callback(
+            directories_to_watch, archive_by_patient_callback
+        )
 
-    def archive_by_patient_callback(ip, data):
-        patient_icom_data.update_data(ip, data)
 
-    observer.observe_with_callback(directories_to_watch, archive_by_patient_callback)
+def archive_segments_by_patient(
+    segments_directory, ip, output_dir, start=None, end=None
+):
+    """Archive by patient the timesteps held within a
+    ``segments.SegmentStore``, as if they were being received live."""
+    with PatientIcomData(output_dir) as patient_icom_data:
+        for data in segments.iter_frames(segments_directory, ip, start=start, end=end):
+            patient_icom_data.update_data(ip, data)
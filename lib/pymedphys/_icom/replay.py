@@ -0,0 +1,442 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Replays iCOM streams over TCP in the place of Linacs, and benchmarks
+the listener against them.
+"""
+
+import asyncio
+import concurrent.futures
+import contextlib
+import dataclasses
+import logging
+import random
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Sequence
+
+from pymedphys._imports import numpy as np
+
+from . import convert, extract, listener, multilistener, synthetic
+
+FRAME_INTERVAL = 0.25
+
+
+@dataclasses.dataclass
+class Faults:
+    """The faults to inject into a replayed stream.
+
+    Each probability is applied independently to every timestep sent.
+
+    Attributes
+    ----------
+    disconnect : float
+        Close the connection after sending a whole timestep.
+    partial_frame : float
+        Send only the start of a timestep, then close the connection.
+        The remainder of that timestep is never sent.
+    split_frame : float
+        Send a timestep in two writes, ``split_pause`` seconds apart, so
+        that it arrives across more than one read.
+    split_pause : float
+    seed : int, optional
+        Seed so that the same faults are able to be reproduced.
+    """
+
+    disconnect: float = 0
+    partial_frame: float = 0
+    split_frame: float = 0
+    split_pause: float = 0.01
+    seed: Optional[int] = None
+
+
+class ReplayLinac:
+    """Serves a sequence of iCOM timesteps over TCP as a Linac would.
+
+    Each connection continues from the first timestep not yet fully
+    sent, and the server keeps accepting connections until all
+    timesteps have been sent. Timesteps are sent to one connection at a
+    time.
+
+    Parameters
+    ----------
+    frames : Sequence[bytes]
+        The timesteps to send, for example from ``read_frames``.
+    host : str, optional
+    port : int, optional
+        By default the iCOM port. Use ``0`` for any free port, which is
+        then available as ``port`` once started.
+    speed : float, optional
+        The multiple of real time to send at, where real time is one
+        timestep every ``frame_interval`` seconds. ``float("inf")``
+        sends as fast as the connection allows.
+    frame_interval : float, optional
+    repeat : bool, optional
+        Once every timestep has been sent, start again from the first.
+    faults : Faults, optional
+    """
+
+    def __init__(
+        self,
+        frames: Sequence[bytes],
+        host: str = "127.0.0.1",
+        port: int = listener.ICOM_PORT,
+        speed: float = 1,
+        frame_interval: float = FRAME_INTERVAL,
+        repeat: bool = False,
+        faults: Faults = None,
+    ):
+        if faults is None:
+            faults = Faults()
+
+        self.host = host
+        self.port = port
+        self.frames = frames
+        self.send_times: List[Optional[float]] = [None] * len(frames)
+        self.frames_sent = 0
+        self.faults_injected = {"disconnect": 0, "partial_frame": 0, "split_frame": 0}
+
+        self._interval = frame_interval / speed
+        self._repeat = repeat
+        self._faults = faults
+        self._random = random.Random(faults.seed)
+        self._server = None
+        self._lock = None
+        self._finished = None
+
+    async def start(self):
+        self._lock = asyncio.Lock()
+        self._finished = asyncio.Event()
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def wait_finished(self):
+        """Wait until every timestep has been sent."""
+        await self._finished.wait()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+
+    async def _handle_connection(self, _, writer):
+        async with self._lock:
+            try:
+                await self._send(writer)
+            except (ConnectionError, OSError) as e:
+                logging.debug(
+                    "Replay to %(host)s dropped out: %(error)r",
+                    {"host": self.host, "error": e},
+                )
+            finally:
+                writer.close()
+
+    async def _send(self, writer):
+        faults = self._faults
+        next_send_time = time.monotonic()
+
+        while self._repeat or self.frames_sent < len(self.frames):
+            index = self.frames_sent % len(self.frames)
+            frame = self.frames[index]
+
+            if self._interval > 0:
+                await asyncio.sleep(max(next_send_time - time.monotonic(), 0))
+                next_send_time += self._interval
+
+            if self._random.random() < faults.partial_frame:
+                self.faults_injected["partial_frame"] += 1
+                writer.write(frame[0 : self._random.randrange(1, len(frame))])
+                await writer.drain()
+                self.frames_sent += 1
+                return
+
+            if self._random.random() < faults.split_frame:
+                self.faults_injected["split_frame"] += 1
+                split = self._random.randrange(1, len(frame))
+                writer.write(frame[0:split])
+                await writer.drain()
+                await asyncio.sleep(faults.split_pause)
+                writer.write(frame[split::])
+            else:
+                writer.write(frame)
+
+            await writer.drain()
+            self.send_times[index] = time.monotonic()
+            self.frames_sent += 1
+
+            if not self._repeat and self.frames_sent == len(self.frames):
+                self._finished.set()
+
+            if self._random.random() < faults.disconnect:
+                self.faults_injected["disconnect"] += 1
+                return
+
+        self._finished.set()
+
+
+def read_frames(archive_filepath) -> List[bytes]:
+    """The timesteps of a patient archive or closed segment."""
+    return extract.get_data_points(convert.read_icom_archive(archive_filepath))
+
+
+@dataclasses.dataclass
+class BenchmarkResult:
+    frames_sent: int
+    frames_handled: int
+    handling_errors: int
+    reconnects: int
+    elapsed: float
+    frames_per_second: float
+    bytes_per_second: float
+    latency_median: float
+    latency_95th_percentile: float
+    latency_max: float
+    peak_traced_memory: Optional[int]
+
+    def summary(self):
+        summary = (
+            f"Frames sent: {self.frames_sent}, handled: {self.frames_handled}, "
+            f"handling errors: {self.handling_errors}, "
+            f"reconnects: {self.reconnects}\n"
+            f"Throughput: {self.frames_per_second:.0f} frames/s, "
+            f"{self.bytes_per_second / 1e6:.2f} MB/s\n"
+            f"Latency: median {self.latency_median * 1000:.2f} ms, "
+            f"95th percentile {self.latency_95th_percentile * 1000:.2f} ms, "
+            f"max {self.latency_max * 1000:.2f} ms"
+        )
+
+        if self.peak_traced_memory is not None:
+            summary += f"\nPeak traced memory: {self.peak_traced_memory / 1e6:.2f} MB"
+
+        return summary
+
+
+def benchmark_listener(
+    frames_by_ip: Dict[str, Sequence[bytes]],
+    handle_frame: Callable[[str, bytes], None] = None,
+    speed: float = float("inf"),
+    faults: Faults = None,
+    timeout: float = 60,
+    trace_memory: bool = True,
+) -> BenchmarkResult:
+    """Replay iCOM streams to ``multilistener.IcomConnection`` and
+    measure how well the listener keeps up.
+
+    Parameters
+    ----------
+    frames_by_ip : dict
+        The timesteps of each simulated Linac, keyed by the IP that
+        labels it. Every Linac is served from its own free port of
+        ``127.0.0.1``.
+    handle_frame : Callable[[str, bytes], None], optional
+        The handling of each timestep. By default the full handling of
+        ``multilistener.create_frame_handler`` within a temporary
+        directory.
+    speed : float, optional
+        The multiple of real time to replay at, by default as fast as
+        possible.
+    faults : Faults, optional
+        The faults to inject into every Linac's stream.
+    timeout : float, optional
+        Stop waiting for timesteps to be handled after this many seconds.
+    trace_memory : bool, optional
+        Trace memory allocations with ``tracemalloc``. This slows
+        handling considerably, so throughput is best measured without
+        it.
+
+    Returns
+    -------
+    BenchmarkResult
+        Latency is from the last byte of a timestep being sent to its
+        handling completing. It includes the time a timestep waits to
+        be split off by the start of the next one, and any backlog when
+        replaying faster than the timesteps are able to be handled.
+        Memory is the peak traced while replaying.
+    """
+    if handle_frame is None:
+        with tempfile.TemporaryDirectory() as data_dir:
+            handle_frame = multilistener.create_frame_handler(data_dir)
+            try:
+                return benchmark_listener(
+                    frames_by_ip,
+                    handle_frame,
+                    speed=speed,
+                    faults=faults,
+                    timeout=timeout,
+                    trace_memory=trace_memory,
+                )
+            finally:
+                handle_frame.close()
+
+    return asyncio.run(
+        _benchmark_listener(
+            frames_by_ip, handle_frame, speed, faults, timeout, trace_memory
+        )
+    )
+
+
+async def _benchmark_listener(
+    frames_by_ip, handle_frame, speed, faults, timeout, trace_memory
+):
+    linacs = {
+        ip: ReplayLinac(
+            frames,
+            port=0,
+            speed=speed,
+            faults=None if faults is None else dataclasses.replace(faults),
+        )
+        for ip, frames in frames_by_ip.items()
+    }
+    for linac in linacs.values():
+        await linac.start()
+
+    frame_indices = {
+        ip: {frame[8:27]: i for i, frame in enumerate(frames)}
+        for ip, frames in frames_by_ip.items()
+    }
+    latencies = []
+
+    def timed_handle_frame(ip, frame):
+        handle_frame(ip, frame)
+
+        send_time = linacs[ip].send_times[frame_indices[ip][frame[8:27]]]
+        latencies.append(time.monotonic() - send_time)
+
+    if trace_memory:
+        tracemalloc.start()
+
+    start_time = time.monotonic()
+
+    with contextlib.ExitStack() as stack:
+        connections = [
+            multilistener.IcomConnection(
+                ip,
+                timed_handle_frame,
+                executor=stack.enter_context(
+                    concurrent.futures.ThreadPoolExecutor(max_workers=1)
+                ),
+                port=linac.port,
+                host=linac.host,
+                initial_backoff=0.01,
+                max_backoff=0.1,
+            )
+            for ip, linac in linacs.items()
+        ]
+        tasks = [asyncio.ensure_future(connection.run()) for connection in connections]
+
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*[linac.wait_finished() for linac in linacs.values()]),
+                timeout,
+            )
+            # The final timestep of a stream is only split off once the
+            # connection closes, which the replay does once finished.
+            while any(
+                connection.stats.connected or connection.stats.connections == 0
+                for connection in connections
+            ):
+                if time.monotonic() - start_time > timeout:
+                    break
+                await asyncio.sleep(0.001)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for linac in linacs.values():
+                linac.close()
+
+    elapsed = time.monotonic() - start_time
+    peak_traced_memory = None
+    if trace_memory:
+        _, peak_traced_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    frames_handled = sum(connection.stats.frames_handled for connection in connections)
+    bytes_received = sum(connection.stats.bytes_received for connection in connections)
+    latencies = np.array(latencies) if latencies else np.array([np.nan])
+
+    return BenchmarkResult(
+        frames_sent=sum(linac.frames_sent for linac in linacs.values()),
+        frames_handled=frames_handled,
+        handling_errors=sum(
+            connection.stats.handling_errors for connection in connections
+        ),
+        reconnects=sum(
+            max(connection.stats.connections - 1, 0) for connection in connections
+        ),
+        elapsed=elapsed,
+        frames_per_second=frames_handled / elapsed,
+        bytes_per_second=bytes_received / elapsed,
+        latency_median=float(np.median(latencies)),
+        latency_95th_percentile=float(np.percentile(latencies, 95)),
+        latency_max=float(np.max(latencies)),
+        peak_traced_memory=peak_traced_memory,
+    )
+
+
+def _get_linac_labels(number_of_linacs):
+    # Every simulated Linac is served from 127.0.0.1, these only name
+    # them in place of their IP.
+    return [f"linac_{i + 1}" for i in range(number_of_linacs)]
+
+
+def replay_cli(args):
+    frames_by_port = {
+        args.port + i: read_frames(archive) for i, archive in enumerate(args.archives)
+    }
+    faults = Faults(
+        disconnect=args.disconnect,
+        partial_frame=args.partial_frame,
+        split_frame=args.split_frame,
+    )
+
+    async def serve():
+        linacs = [
+            ReplayLinac(
+                frames,
+                port=port,
+                speed=args.speed,
+                repeat=args.repeat,
+                faults=dataclasses.replace(faults),
+            )
+            for port, frames in frames_by_port.items()
+        ]
+        for linac in linacs:
+            await linac.start()
+            print(
+                f"Replaying {len(linac.frames)} timesteps from {linac.host}:{linac.port}"
+            )
+
+        await asyncio.gather(*[linac.wait_finished() for linac in linacs])
+
+    asyncio.run(serve())
+
+
+def benchmark_cli(args):
+    frames = synthetic.create_frames(args.frames, seed=0)
+    frames_by_ip = {ip: frames for ip in _get_linac_labels(args.linacs)}
+    faults = Faults(
+        disconnect=args.disconnect,
+        partial_frame=args.partial_frame,
+        split_frame=args.split_frame,
+        seed=0,
+    )
+
+    result = benchmark_listener(
+        frames_by_ip, speed=args.speed, faults=faults, trace_memory=args.trace_memory
+    )
+    print(result.summary())
@@ -0,0 +1,435 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Append-only storage of iCOM timesteps within hourly segment files.
+
+Each Linac's timesteps are appended, length-prefixed, to one segment
+file per hour, ``<directory>/<ip>/<YYYYmmdd_HH>.seg``. Once the hour has
+passed the segment is closed, at which point it is compressed, in
+independent chunks, into ``<YYYYmmdd_HH>.seg.xz``. Alongside it is a
+small index, ``<YYYYmmdd_HH>.seg.idx``, of the first timestamp and the
+file offset of each chunk so that a time can be seeked to without
+decompressing the whole hour.
+
+Writing the index is the point at which closing a segment takes effect.
+The index records the length of the compressed data, so any chunks
+written beyond it by an interrupted close are discarded, and a hash of
+the open segment, so that an open segment which has already been closed
+is removed rather than closed again. The index also records where the
+chunks of the most recent close begin, so that a reader following the
+open segment is able to finish reading it from the closed one.
+"""
+
+import concurrent.futures
+import hashlib
+import io
+import json
+import logging
+import lzma
+import os
+import pathlib
+import shutil
+import struct
+from typing import BinaryIO, Dict, Iterator, Tuple
+
+OPEN_SUFFIX = ".seg"
+CLOSED_SUFFIX = ".seg.xz"
+INDEX_SUFFIX = ".seg.idx"
+
+LENGTH = struct.Struct("<I")
+TIMESTAMP_SLICE = slice(8, 26)
+TIMESTAMP_FORMAT = "%Y-%m-%d%H:%M:%S"
+
+FRAMES_PER_CHUNK = 240
+
+
+def get_segment_name(timestamp: str) -> str:
+    """The name of the segment for a timestep's timestamp, as it appears
+    within the timestep, such as ``"2021-01-0108:00:00"``."""
+    return f"{timestamp[0:4]}{timestamp[5:7]}{timestamp[8:10]}_{timestamp[10:12]}"
+
+
+class SegmentStore:
+    """Appends iCOM timesteps to hourly segment files.
+
+    Segments are closed, and so compressed, by a background thread so
+    that appending is never held up by the compression of an hour of
+    timesteps.
+
+    Parameters
+    ----------
+    directory : os.PathLike
+        The root of the store. Each Linac is given its own directory,
+        named by IP, within it.
+    frames_per_chunk : int, optional
+        The number of timesteps within each independently compressed
+        chunk of a closed segment. This is the granularity of seeking.
+    """
+
+    def __init__(self, directory, frames_per_chunk=FRAMES_PER_CHUNK):
+        self._directory = pathlib.Path(directory)
+        self._frames_per_chunk = frames_per_chunk
+        self._open: Dict[str, Tuple[str, BinaryIO]] = {}
+
+        self._closing: Dict[pathlib.Path, concurrent.futures.Future] = {}
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    def append(self, ip, frame: bytes):
+        """Append a timestep, closing the Linac's previous segment if the
+        timestep starts a new hour."""
+        segment_name = get_segment_name(frame[TIMESTAMP_SLICE].decode())
+
+        try:
+            open_name, segment_file = self._open[ip]
+        except KeyError:
+            open_name, segment_file = None, None
+
+        if open_name != segment_name:
+            if segment_file is not None:
+                segment_file.close()
+
+            segment_file = self._open_segment(ip, segment_name)
+            self._open[ip] = (segment_name, segment_file)
+
+        segment_file.write(LENGTH.pack(len(frame)) + frame)
+        segment_file.flush()
+
+    def wait_until_closed(self):
+        """Wait for the segments being closed in the background."""
+        for future in list(self._closing.values()):
+            future.result()
+
+    def close(self):
+        """Close, and compress, every open segment."""
+        for ip, (_, segment_file) in self._open.items():
+            segment_file.close()
+            self._close_segments(ip)
+
+        self._open = {}
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _open_segment(self, ip, segment_name):
+        ip_directory = self._directory.joinpath(ip)
+        ip_directory.mkdir(parents=True, exist_ok=True)
+
+        self._close_segments(ip, keep=segment_name)
+
+        path = ip_directory.joinpath(f"{segment_name}{OPEN_SUFFIX}")
+
+        # The Linac's clock may have gone back into an hour whose
+        # segment is still being closed.
+        closing = self._closing.get(path)
+        if closing is not None:
+            closing.result()
+
+        if path.exists() and not _remove_if_already_closed(path):
+            _truncate_incomplete_record(path)
+
+        return open(path, "ab")
+
+    def _close_segments(self, ip, keep=None):
+        for path in sorted(self._directory.joinpath(ip).glob(f"*{OPEN_SUFFIX}")):
+            if path.name != f"{keep}{OPEN_SUFFIX}" and path not in self._closing:
+                future = self._executor.submit(
+                    _close_segment_in_background, path, self._frames_per_chunk
+                )
+                self._closing[path] = future
+                future.add_done_callback(
+                    lambda _, path=path: self._closing.pop(path, None)
+                )
+
+
+def _close_segment_in_background(path, frames_per_chunk):
+    try:
+        close_segment(path, frames_per_chunk)
+    except Exception:  # pylint: disable = broad-except
+        logging.exception(
+            "Unable to close the iCOM segment %(path)s. It will be closed again "
+            "once the Linac's segment next changes.",
+            {"path": path},
+        )
+
+
+def close_segment(path, frames_per_chunk=FRAMES_PER_CHUNK):
+    """Compress an open segment into chunks, write its index, and then
+    remove it.
+
+    Each step leaves the segment in a state that is able to be closed
+    again, should closing be interrupted.
+    """
+    path = pathlib.Path(path)
+    closed_path, index_path = _get_closed_paths(path)
+
+    with open(path, "rb") as f:
+        contents = f.read()
+
+    source = hashlib.sha1(contents).hexdigest()
+    index = _read_index(index_path)
+    if index["source"] == source:
+        path.unlink()
+        return
+
+    frames = list(_iter_records(io.BytesIO(contents)))
+
+    # A segment may be reopened after being closed, for example when
+    # the listener is restarted within the hour. Its chunks are then
+    # appended to those already closed.
+    chunks = index["chunks"]
+    partial_path = closed_path.with_name(f"{closed_path.name}.part")
+    if closed_path.exists():
+        shutil.copyfile(closed_path, partial_path)
+        os.truncate(partial_path, index["length"])
+    else:
+        partial_path.write_bytes(b"")
+
+    with open(partial_path, "ab") as f:
+        close_offset = f.tell()
+        for i in range(0, len(frames), frames_per_chunk):
+            chunk = frames[i : i + frames_per_chunk]
+            chunks.append([chunk[0][TIMESTAMP_SLICE].decode(), f.tell()])
+            f.write(
+                lzma.compress(
+                    b"".join(LENGTH.pack(len(frame)) + frame for frame in chunk)
+                )
+            )
+
+        length = f.tell()
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(partial_path, closed_path)
+
+    partial_index_path = index_path.with_name(f"{index_path.name}.part")
+    with open(partial_index_path, "w") as f:
+        json.dump(
+            {
+                "chunks": chunks,
+                "length": length,
+                "source": source,
+                "close_offset": close_offset,
+            },
+            f,
+        )
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(partial_index_path, index_path)
+    path.unlink()
+
+
+def iter_segment_frames(path, start: str = None, end: str = None) -> Iterator[bytes]:
+    """Iterate over the timesteps within either an open or a closed
+    segment.
+
+    Parameters
+    ----------
+    path : os.PathLike
+    start, end : str, optional
+        Only yield timesteps whose timestamp is within ``[start, end)``,
+        given in the same form as within the timestep, such as
+        ``"2021-01-0108:00:00"``.
+    """
+    path = pathlib.Path(path)
+
+    if path.name.endswith(CLOSED_SUFFIX):
+        index = _read_index(_get_index_path(path))
+
+        offset = 0
+        if start is not None:
+            offset = _find_chunk_offset(index, start)
+
+        with open(path, "rb") as raw:
+            raw.seek(offset)
+
+            # Only the chunks within the index have been committed.
+            # Any beyond it are from a close still in progress.
+            compressed = raw
+            if os.fstat(raw.fileno()).st_size > index["length"]:
+                if index["length"] <= offset:
+                    return
+
+                compressed = io.BytesIO(raw.read(index["length"] - offset))
+
+            with lzma.open(compressed, "rb") as f:
+                yield from _filter_by_time(_iter_records(f), start, end)
+    else:
+        with open(path, "rb") as f:
+            yield from _filter_by_time(_iter_records(f), start, end)
+
+
+def iter_closed_frames(open_path, offset=0) -> Iterator[bytes]:
+    """Iterate over the timesteps of an open segment that has since been
+    closed.
+
+    Parameters
+    ----------
+    open_path : os.PathLike
+        The path the segment had while it was open.
+    offset : int, optional
+        Only yield the timesteps from this many bytes into the open
+        segment, such as the offset that it had been read up to.
+    """
+    closed_path, index_path = _get_closed_paths(pathlib.Path(open_path))
+    index = _read_index(index_path)
+    close_offset = index["close_offset"]
+
+    with open(closed_path, "rb") as raw:
+        raw.seek(close_offset)
+        compressed = raw.read(index["length"] - close_offset)
+
+    if not compressed:
+        return
+
+    with lzma.open(io.BytesIO(compressed), "rb") as f:
+        f.seek(offset)
+        yield from _iter_records(f)
+
+
+def iter_frames(directory, ip, start=None, end=None) -> Iterator[bytes]:
+    """Iterate, in order, over a Linac's stored timesteps.
+
+    Parameters
+    ----------
+    directory : os.PathLike
+        The root of the ``SegmentStore``.
+    ip : str
+    start, end : datetime.datetime, optional
+        Only yield timesteps whose timestamp is within ``[start, end)``.
+    """
+    start = _format_timestamp(start)
+    end = _format_timestamp(end)
+
+    ip_directory = pathlib.Path(directory).joinpath(ip)
+    segment_names = sorted(
+        {
+            path.name[: -len(suffix)]
+            for suffix in (CLOSED_SUFFIX, OPEN_SUFFIX)
+            for path in ip_directory.glob(f"*{suffix}")
+        }
+    )
+
+    for segment_name in segment_names:
+        if start is not None and segment_name < get_segment_name(start):
+            continue
+        if end is not None and segment_name > get_segment_name(end):
+            break
+
+        # A reopened segment has both closed and open parts.
+        for suffix in (CLOSED_SUFFIX, OPEN_SUFFIX):
+            path = ip_directory.joinpath(f"{segment_name}{suffix}")
+            if path.exists():
+                yield from iter_segment_frames(path, start, end)
+
+
+def read_icom_stream(directory, ip, start=None, end=None) -> bytes:
+    """A Linac's stored timesteps concatenated into a single iCOM stream,
+    the same form as that saved within the patient archives."""
+    return b"".join(iter_frames(directory, ip, start, end))
+
+
+def _find_chunk_offset(index, start):
+    offset = 0
+    for first_timestamp, chunk_offset in index["chunks"]:
+        if first_timestamp > start:
+            break
+        offset = chunk_offset
+
+    return offset
+
+
+def _get_closed_paths(open_path: pathlib.Path):
+    stem = open_path.name[: -len(OPEN_SUFFIX)]
+
+    return (
+        open_path.with_name(f"{stem}{CLOSED_SUFFIX}"),
+        open_path.with_name(f"{stem}{INDEX_SUFFIX}"),
+    )
+
+
+def _get_index_path(closed_path: pathlib.Path):
+    return closed_path.with_name(
+        f"{closed_path.name[: -len(CLOSED_SUFFIX)]}{INDEX_SUFFIX}"
+    )
+
+
+def _read_index(index_path):
+    try:
+        with open(index_path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"chunks": [], "length": 0, "source": None, "close_offset": 0}
+
+
+def _remove_if_already_closed(path: pathlib.Path):
+    """Remove an open segment left behind by an interrupted close after
+    its timesteps had already been closed. Returns whether it was
+    removed."""
+    _, index_path = _get_closed_paths(path)
+    source = _read_index(index_path)["source"]
+    if source is None or source != hashlib.sha1(path.read_bytes()).hexdigest():
+        return False
+
+    path.unlink()
+    return True
+
+
+def _filter_by_time(frames, start, end):
+    for frame in frames:
+        timestamp = frame[TIMESTAMP_SLICE].decode()
+        if start is not None and timestamp < start:
+            continue
+        if end is not None and timestamp >= end:
+            return
+
+        yield frame
+
+
+def _iter_records(f: BinaryIO) -> Iterator[bytes]:
+    """The length-prefixed records of a segment. A trailing record that
+    was only partially written is ignored."""
+    while True:
+        length_bytes = f.read(LENGTH.size)
+        if len(length_bytes) < LENGTH.size:
+            return
+
+        (length,) = LENGTH.unpack(length_bytes)
+        record = f.read(length)
+        if len(record) < length:
+            return
+
+        yield record
+
+
+def _truncate_incomplete_record(path):
+    complete_length = 0
+    with open(path, "rb") as f:
+        for record in _iter_records(f):
+            complete_length += LENGTH.size + len(record)
+
+    if os.path.getsize(path) != complete_length:
+        os.truncate(path, complete_length)
+
+
+def _format_timestamp(a_datetime):
+    if a_datetime is None or isinstance(a_datetime, str):
+        return a_datetime
+
+    return a_datetime.strftime(TIMESTAMP_FORMAT)
@@ -0,0 +1,185 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Creates synthetic iCOM streams for testing and benchmarking.
+"""
+
+import datetime
+from typing import Dict, List
+
+from pymedphys._imports import numpy as np
+
+from pymedphys._base.delivery import DeliveryBase
+from pymedphys._trf.decode.synthetic import create_synthetic_delivery
+
+from . import extract, mappings
+
+FRAME_PREFIX = b"\x00" * 8
+ELEMENT_SEPARATOR = b"\n"
+
+
+def encode_element(key: bytes, value) -> bytes:
+    """Encode a single iCOM element.
+
+    Parameters
+    ----------
+    key : bytes
+        The element's key, as used within ``mappings.ICOM``.
+    value : str, int or float
+    """
+    if isinstance(value, float):
+        value = f"{value:.2f}"
+
+    value = str(value).encode()
+
+    return b"0" + key + bytes([len(value)]) + b"\x00\x00\x00" + value
+
+
+def encode_frame(
+    timestamp: datetime.datetime,
+    counter: int,
+    fields: Dict[str, object] = None,
+    collimation: Dict[str, List[float]] = None,
+) -> bytes:
+    """Encode a single iCOM timestep.
+
+    Parameters
+    ----------
+    timestamp : datetime.datetime
+    counter : int
+        The timestep's counter, from 0 to 255.
+    fields : dict, optional
+        Values keyed by the labels within ``mappings.ICOM``. Labels that
+        gather all values may be given a list.
+    collimation : dict, optional
+        Positions, in iCOM's own coordinates and units, keyed by
+        collimator label such as ``"MLCX"`` or ``"ASYMY"``.
+
+    Returns
+    -------
+    frame : bytes
+        The timestep, which ``extract.tokenise_frame`` is able to decode.
+    """
+    elements = []
+
+    for label, value in (fields or {}).items():
+        key, _, _ = mappings.ICOM[label]
+        values = value if isinstance(value, list) else [value]
+        elements += [encode_element(key, item) for item in values]
+
+    for label, items in (collimation or {}).items():
+        elements.append(encode_element(extract.COLLIMATOR_LABEL_KEY, label))
+        elements += [
+            encode_element(extract.COLLIMATOR_ITEM_KEY, float(item)) for item in items
+        ]
+
+    return (
+        FRAME_PREFIX
+        + timestamp.strftime("%Y-%m-%d%H:%M:%S").encode()
+        + bytes([counter % 256])
+        + ELEMENT_SEPARATOR
+        + ELEMENT_SEPARATOR.join(elements)
+        + ELEMENT_SEPARATOR
+    )
+
+
+def delivery_to_collimation(mlc, jaw) -> Dict[str, List[float]]:
+    """Convert the MLC and jaw positions of a single ``pymedphys.Delivery``
+    control point into iCOM's coordinates and units."""
+    mlc = np.array(mlc, dtype=float)
+    mlc[:, 1] = -mlc[:, 1]
+    raw_mlc = np.flipud(np.fliplr(mlc)) / 10
+
+    raw_jaw = np.flipud(np.array(jaw, dtype=float)) / 10
+
+    return {"MLCX": list(raw_mlc.ravel()), "ASYMY": list(raw_jaw)}
+
+
+def create_icom_stream(
+    delivery: DeliveryBase,
+    start=datetime.datetime(2021, 1, 1, 8, 0, 0),
+    interval=datetime.timedelta(seconds=0.25),
+    first_counter=0,
+    patient_id="123456",
+    patient_name="DOE, JANE",
+    machine_id="2619",
+) -> bytes:
+    """Create an iCOM stream with one timestep per control point of a
+    delivery.
+
+    The collimation is recorded with a precision of 0.1 mm, and the
+    meterset and angles to 0.01.
+
+    Parameters
+    ----------
+    delivery : pymedphys.Delivery
+    start : datetime.datetime, optional
+        The time of the first timestep.
+    interval : datetime.timedelta, optional
+        The time between timesteps.
+    first_counter : int, optional
+        The counter of the first timestep.
+    patient_id, patient_name, machine_id : str, optional
+        Recorded within every timestep. Set ``patient_id`` to ``None``
+        to create a stream with no patient loaded.
+    """
+    frames = []
+
+    for i, (monitor_units, gantry, collimator, mlc, jaw) in enumerate(zip(*delivery)):
+        fields = {
+            "Machine ID": machine_id,
+            "Delivery MU": float(monitor_units),
+            "Gantry": float(gantry),
+            "Collimator": float(collimator),
+        }
+
+        if patient_id is not None:
+            fields = {
+                "Patient ID": patient_id,
+                "Patient Name": patient_name,
+                **fields,
+            }
+
+        frames.append(
+            encode_frame(
+                start + i * interval,
+                first_counter + i,
+                fields,
+                delivery_to_collimation(mlc, jaw),
+            )
+        )
+
+    return b"".join(frames)
+
+
+def create_frames(number_of_frames, seed=None, **kwargs) -> List[bytes]:
+    """Create the timesteps of an iCOM stream of a random delivery.
+
+    Parameters
+    ----------
+    number_of_frames : int
+    seed : int, optional
+        Seed for the random number generator so that the same
+        timesteps are able to be reproduced.
+    **kwargs
+        Passed on to ``create_icom_stream``.
+
+    Returns
+    -------
+    frames : list of bytes
+    """
+    delivery = create_synthetic_delivery(number_of_rows=number_of_frames, seed=seed)
+
+    return extract.get_data_points(create_icom_stream(delivery, **kwargs))
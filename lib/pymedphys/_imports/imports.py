@@ -51,6 +51,8 @@ import pandas
 import PIL
 import plotly
 import plotly.express
+import pyarrow
+import pyarrow.parquet
 import scipy
 import scipy.interpolate
 import scipy.ndimage
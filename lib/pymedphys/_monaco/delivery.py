@@ -17,6 +17,7 @@ import re
 
 from pymedphys._imports import numpy as np
 
+import pymedphys._base.cache
 import pymedphys._base.delivery
 import pymedphys._utilities.transforms
 
@@ -28,10 +29,15 @@ class DeliveryMonaco(
 ):
     @classmethod
     def from_monaco(cls, tel_path):
-        read_tel_contents = utility.create_read_monaco_file()
-        tel_contents = read_tel_contents(tel_path)
+        def create():
+            read_tel_contents = utility.create_read_monaco_file()
+            tel_contents = read_tel_contents(tel_path)
 
-        return cls(*delivery_from_tel_plan_contents(tel_contents))
+            return cls(*delivery_from_tel_plan_contents(tel_contents))
+
+        return pymedphys._base.cache.retrieve_or_create(  # pylint: disable = protected-access
+            cls, "monaco", tel_path, create
+        )
 
 
 def delivery_from_tel_plan_contents(tel_contents):
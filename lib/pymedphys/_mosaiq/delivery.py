@@ -16,6 +16,7 @@
 """Uses Mosaiq SQL to extract patient delivery details.
 """
 
+import datetime
 import functools
 import struct
 
@@ -162,14 +163,127 @@ def get_mosaiq_delivery_details(
             )
         )
 
+    return _create_delivery_details(sql_result[0])
+
+
+def _create_delivery_details(sql_result_row):
     OISDeliveryDetails = create_ois_delivery_details_class()
-    delivery_details = OISDeliveryDetails(*sql_result[0])
+    delivery_details = OISDeliveryDetails(*sql_result_row)
 
     delivery_details.field_type = constants.FIELD_TYPES[delivery_details.field_type]
 
     return delivery_details
 
 
+def get_mosaiq_delivery_candidates_for_day(connection, machine, day, buffer=0):
+    """Retrieve every treatment record on a machine for a whole day.
+
+    This allows all of the logfiles delivered on one machine within one
+    day to be identified with a single query by then calling
+    ``find_mosaiq_delivery_details`` for each logfile.
+
+    Args:
+        connection: A connection pointing to the Mosaiq SQL server
+        machine: The name of the machine the deliveries occurred on
+        day: The date of the deliveries, in the form 'YYYY-MM-DD'
+        buffer: The number of seconds to extend the day by on each side.
+            This should be at least as large as the buffer later
+            provided to ``find_mosaiq_delivery_details``.
+    Returns:
+        candidates: The treatment records. Each is the same as a row
+            used to create the delivery details within
+            ``get_mosaiq_delivery_details``, followed by the field
+            label, field name, create time and edit time.
+    """
+    execute_string = """
+        SELECT
+            Ident.IDA,
+            TxField.FLD_ID,
+            Patient.Last_Name,
+            Patient.First_Name,
+            Tracktreatment.WasQAMode,
+            TxField.Type_Enum,
+            Tracktreatment.WasBeamComplete,
+            TxField.Field_Label,
+            TxField.Field_Name,
+            TrackTreatment.Create_DtTm,
+            TrackTreatment.Edit_DtTm
+        FROM TrackTreatment, Ident, Patient, TxField, Staff
+        WHERE
+            TrackTreatment.Pat_ID1 = Ident.Pat_ID1 AND
+            Patient.Pat_ID1 = Ident.Pat_ID1 AND
+            TrackTreatment.FLD_ID = TxField.FLD_ID AND
+            Staff.Staff_ID = TrackTreatment.Machine_ID_Staff_ID AND
+            REPLACE(Staff.Last_Name, ' ', '') = %(machine)s AND
+            TrackTreatment.Create_DtTm <= DATEADD(second, %(buffer)d, DATEADD(day, 1, %(day)s)) AND
+            TrackTreatment.Edit_DtTm >= DATEADD(second, -%(buffer)d, %(day)s)
+        """
+
+    parameters = {"buffer": buffer, "machine": machine, "day": day}
+
+    return api.execute(connection, execute_string, parameters)
+
+
+def find_mosaiq_delivery_details(
+    candidates, delivery_time, field_label, field_name, buffer=0
+):
+    """Identifies the patient details for a given delivery time from
+    the treatment records returned by
+    ``get_mosaiq_delivery_candidates_for_day``.
+
+    This applies the same matching as ``get_mosaiq_delivery_details``
+    without querying the database.
+
+    Args:
+        candidates: The treatment records for the machine and day.
+        delivery_time: The time of the treatment delivery, in the form
+            'YYYY-MM-DD HH:MM:SS'
+        field_label: The beam field label, called Field ID within Monaco
+        field_name: The beam field name, called Description within Monaco
+    Returns:
+        delivery_details: The identified delivery details
+    """
+    time = datetime.datetime.strptime(delivery_time, "%Y-%m-%d %H:%M:%S")
+    time_buffer = datetime.timedelta(seconds=buffer)
+
+    sql_result = [
+        candidate[0:7]
+        for candidate in candidates
+        if _sql_strings_equal(candidate[7], field_label)
+        and _sql_strings_equal(candidate[8], field_name)
+        and candidate[9] <= time + time_buffer
+        and candidate[10] >= time - time_buffer
+    ]
+
+    if len(sql_result) > 1:
+        for result in sql_result[1::]:
+            if result != sql_result[0]:
+                if buffer != 0:
+                    return find_mosaiq_delivery_details(
+                        candidates, delivery_time, field_label, field_name, buffer=0
+                    )
+
+                raise MultipleMosaiqEntries("Disagreeing entries were found.")
+
+    if not sql_result:
+        raise NoMosaiqEntries(
+            "No Mosaiq entries were found for {}/{} at {}".format(
+                field_label, field_name, delivery_time
+            )
+        )
+
+    return _create_delivery_details(sql_result[0])
+
+
+def _sql_strings_equal(a, b):
+    """Compare strings in the same way as the default, case insensitive,
+    Mosaiq MSSQL collation, which also ignores trailing spaces."""
+    if a is None or b is None:
+        return False
+
+    return a.rstrip().casefold() == b.rstrip().casefold()
+
+
 def mosaiq_mlc_missing_byte_workaround(raw_bytes_list):
     """This function checks if there is an odd number of bytes in the mlc list
     and appends a \\x00 if the byte number is odd.
@@ -16,6 +16,7 @@ from typing import Type
 
 from pymedphys._imports import numpy as np
 
+from pymedphys._base import cache as _cache
 from pymedphys._base.delivery import DeliveryBase, DeliveryGeneric
 from pymedphys._vendor.deprecated import deprecated as _deprecated
 
@@ -26,7 +27,17 @@ from .constants import (
     Y1_LEAF_BANK_NAMES,
     Y2_LEAF_BANK_NAMES,
 )
-from .trf2pandas import read_trf
+from .partition import split_into_header_table
+from .table import decode_selected_columns
+from .trf2pandas import read_trf_contents
+
+
+DELIVERY_COLUMN_NAMES = (
+    ["Step Dose/Actual Value (Mu)", GANTRY_NAME, COLLIMATOR_NAME]
+    + Y1_LEAF_BANK_NAMES
+    + Y2_LEAF_BANK_NAMES
+    + JAW_NAMES
+)
 
 
 class DeliveryLogfile(DeliveryBase):
@@ -45,10 +56,17 @@ class DeliveryLogfile(DeliveryBase):
         delivery : pymedphys.Delivery
 
         """
-        _, dataframe = read_trf(filepath)
-        delivery = cls._from_pandas(dataframe)
 
-        return delivery
+        def create():
+            _, trf_table_contents = split_into_header_table(read_trf_contents(filepath))
+
+            # Only the columns needed for the delivery are decoded,
+            # skipping the creation of the full DataFrame.
+            columns = decode_selected_columns(trf_table_contents, DELIVERY_COLUMN_NAMES)
+
+            return cls._from_pandas(columns)
+
+        return _cache.retrieve_or_create(cls, "trf", filepath, create)
 
     @classmethod
     @_deprecated(
@@ -62,6 +80,8 @@ class DeliveryLogfile(DeliveryBase):
 
     @classmethod
     def _from_pandas(cls: Type[DeliveryGeneric], table) -> DeliveryGeneric:
+        """Create a delivery from either a TRF DataFrame or a dictionary
+        of decoded TRF columns."""
         raw_monitor_units = table["Step Dose/Actual Value (Mu)"]
 
         diff = np.append([0], np.diff(raw_monitor_units))
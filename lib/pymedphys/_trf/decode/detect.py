@@ -1,5 +1,8 @@
+from pymedphys._imports import numpy as np
+
+from .constants import CONFIG
 from .partition import split_into_header_table
-from .table import decode_rows
+from .table import decode_rows, view_table_contents
 from .trf2pandas import header_as_dataframe
 
 
@@ -26,22 +29,93 @@ def search_for_possible_decoding_options(trf_table_contents):
     linac_state_codes_column_range = range(0, 50)
     reference_state_code_keys = None
 
+    candidates = find_candidate_decoding_options(
+        trf_table_contents,
+        line_grouping_range=line_grouping_range,
+        linac_state_codes_column_range=linac_state_codes_column_range,
+        reference_state_code_keys=reference_state_code_keys,
+    )
+
     possible_groupings = []
 
-    for line_grouping in line_grouping_range:
-        for linac_state_codes_column in linac_state_codes_column_range:
-            try:
-                decode_rows(
-                    trf_table_contents,
-                    input_line_grouping=line_grouping,
-                    input_linac_state_codes_column=linac_state_codes_column,
-                    reference_state_code_keys=reference_state_code_keys,
-                )
-                possible_groupings.append([line_grouping, linac_state_codes_column])
-                print(
-                    f"Line Grouping: {line_grouping}, Linac State Codes Column: {linac_state_codes_column}"
-                )
-            except ValueError:
-                pass
+    for line_grouping, linac_state_codes_column in candidates:
+        try:
+            decode_rows(
+                trf_table_contents,
+                input_line_grouping=line_grouping,
+                input_linac_state_codes_column=linac_state_codes_column,
+                reference_state_code_keys=reference_state_code_keys,
+            )
+            possible_groupings.append([line_grouping, linac_state_codes_column])
+            print(
+                f"Line Grouping: {line_grouping}, Linac State Codes Column: {linac_state_codes_column}"
+            )
+        except ValueError:
+            pass
 
     return possible_groupings
+
+
+def find_candidate_decoding_options(
+    trf_table_contents,
+    line_grouping_range=range(600, 800),
+    linac_state_codes_column_range=range(0, 50),
+    reference_state_code_keys=None,
+    number_of_sample_rows=100,
+):
+    """Cheaply narrow down the line groupings and linac state code
+    columns that could decode the provided TRF table.
+
+    Instead of fully decoding the table for every option, only a sample
+    of rows is checked for each line grouping that evenly divides the
+    table. An option is kept if all of the sampled values within its
+    linac state codes column are reference state codes. Since this is a
+    necessary condition for ``decode_rows`` to succeed, no options that
+    would have been accepted by a full decode are discarded.
+
+    Returns
+    -------
+    candidates : list of tuple
+        The ``(line_grouping, linac_state_codes_column)`` pairs that
+        still need to be confirmed with a full decode.
+    """
+    table_byte_length = len(trf_table_contents)
+
+    if table_byte_length == 0:
+        # There are no rows to sample, so every option is left to be
+        # decided by the full decode.
+        return [
+            (line_grouping, column)
+            for line_grouping in line_grouping_range
+            for column in linac_state_codes_column_range
+        ]
+
+    if reference_state_code_keys is None:
+        reference_state_codes = np.array(list(CONFIG["linac_state_codes"].keys()))
+    else:
+        reference_state_codes = np.array(list(reference_state_code_keys))
+    reference_state_codes = reference_state_codes.astype(int)
+
+    columns = np.array(linac_state_codes_column_range)
+
+    candidates = []
+    for line_grouping in line_grouping_range:
+        if line_grouping % 2 != 0 or table_byte_length % line_grouping != 0:
+            continue
+
+        number_of_columns = line_grouping // 2
+        raw_rows = view_table_contents(trf_table_contents, line_grouping)
+
+        sample_rows = np.unique(
+            np.linspace(0, len(raw_rows) - 1, number_of_sample_rows).astype(int)
+        )
+        valid_columns = columns[columns < number_of_columns]
+        sample = raw_rows[sample_rows[:, None], valid_columns[None, :]]
+
+        is_candidate = np.all(np.isin(sample, reference_state_codes), axis=0)
+
+        candidates += [
+            (line_grouping, int(column)) for column in valid_columns[is_candidate]
+        ]
+
+    return candidates
@@ -20,6 +20,10 @@ Header = namedtuple(
     "Header", ["machine", "date", "timezone", "field_label", "field_name"]
 )
 
+HEADER_COLUMN_END = (
+    b"\t\xdc\x00\xe8\t\xdc\x00\xe9\t\xdc\x00\xea\t\xdc\x00\xeb\t\xdc\x00"
+)
+
 
 def determine_header_length(trf_contents: bytes) -> int:
     """Returns the header length of a TRF file
@@ -30,6 +34,8 @@ def determine_header_length(trf_contents: bytes) -> int:
     Parameters
     ----------
     trf_contents : bytes
+        Either the bytes of the TRF file, or any object with a
+        ``bytes``-like ``find`` method such as an ``mmap.mmap``.
 
     Returns
     -------
@@ -38,8 +44,11 @@ def determine_header_length(trf_contents: bytes) -> int:
         TRF file.
     """
 
-    column_end = b"\t\xdc\x00\xe8\t\xdc\x00\xe9\t\xdc\x00\xea\t\xdc\x00\xeb\t\xdc\x00"
-    header_length = trf_contents.index(column_end) + len(column_end)
+    column_end_index = trf_contents.find(HEADER_COLUMN_END)
+    if column_end_index == -1:
+        raise ValueError("Unable to find the end of the TRF header.")
+
+    header_length = column_end_index + len(HEADER_COLUMN_END)
 
     # test = trf_contents.split(b"\t")
     # row_skips = 6
@@ -117,11 +126,21 @@ def decode_header(trf_header_contents: bytes) -> Header:
     return header
 
 
-def _raw_header_from_file(filepath):
+def _raw_header_from_file(filepath, read_size=1024):
+    """Read only as much of the file as is needed to find the header."""
+    trf_contents = b""
     with open(filepath, "rb") as file:
-        trf_contents = file.read()
+        while True:
+            data = file.read(read_size)
+            trf_contents += data
+
+            try:
+                header_length = determine_header_length(trf_contents)
+                break
+            except ValueError:
+                if not data:
+                    raise
 
-    header_length = determine_header_length(trf_contents)
     trf_header_contents = trf_contents[0:header_length]
 
     return trf_header_contents
@@ -0,0 +1,285 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Decodes a trf file incrementally, in blocks of rows.
+"""
+
+import io
+import os
+import time
+from typing import BinaryIO, Iterator, Tuple
+
+from pymedphys._imports import numpy as np
+from pymedphys._imports import pandas as pd
+
+from .constants import CONFIG
+from .header import determine_header_length
+from .table import (
+    GROUPING_OPTIONS,
+    compact_dataframe,
+    convert_data_table,
+    create_dataframe,
+    get_column_names,
+    get_reference_state_codes,
+    match_grouping_options,
+    view_table_contents,
+)
+from .trf2pandas import header_as_dataframe
+
+HEADER_READ_SIZE = 1024
+
+
+def stream_trf(
+    trf: BinaryIO,
+    rows_per_chunk: int = 1500,
+    follow: bool = False,
+    poll_interval: float = 1.0,
+    timeout: float = None,
+    compact: bool = False,
+) -> Tuple["pd.DataFrame", Iterator["pd.DataFrame"]]:
+    """Read an Elekta Linac Agility Head TRF in blocks of rows.
+
+    Only the header and at most one block of rows are held in memory
+    at a time, and decoding of the table starts before the whole file
+    has been read. With ``follow=True`` a TRF that is still being
+    written can be tailed.
+
+    Parameters
+    ----------
+    trf : BinaryIO
+        A binary file-like object positioned at the start of the TRF.
+        The caller remains responsible for closing it.
+    rows_per_chunk : int, optional
+        The maximum number of rows within each block, by default 1500,
+        which is one minute of delivery.
+    follow : bool, optional
+        If ``True``, once the end of the file is reached, keep polling
+        it for newly written rows instead of stopping. Rows are then
+        yielded as soon as they are available, even if that is fewer
+        than ``rows_per_chunk``. By default ``False``.
+    poll_interval : float, optional
+        The number of seconds to wait between polls when following.
+    timeout : float, optional
+        When following, stop once no new data has been written for this
+        many seconds. By default follow indefinitely.
+    compact : bool, optional
+        Return the blocks with the same compact dtypes as
+        ``pymedphys.trf.read(..., compact=True)``.
+
+    Returns
+    -------
+    Tuple[pd.DataFrame, Iterator[pd.DataFrame]]
+        The TRF header, and an iterator over the blocks of the TRF
+        table. The blocks are decoded identically to, and share the
+        time index of, the table given by ``pymedphys.trf.read``.
+
+    Examples
+    --------
+    >>> with open("a/path/goes/here.trf", "rb") as f:  # doctest: +SKIP
+    ...     header, chunks = pymedphys.trf.stream(f, rows_per_chunk=250)
+    ...     for table in chunks:
+    ...         print(table["Step Gantry/Scaled Actual (deg)"].max())
+    """
+    if rows_per_chunk < 1:
+        raise ValueError("`rows_per_chunk` needs to be at least 1.")
+
+    reader = _Reader(trf, follow, poll_interval, timeout)
+
+    buffer = bytearray()
+    while True:
+        try:
+            header_length = determine_header_length(buffer)
+            break
+        except ValueError:
+            data = reader.read(HEADER_READ_SIZE, wait=True)
+            if not data:
+                raise
+
+            buffer += data
+
+    header_dataframe = header_as_dataframe(bytes(buffer[0:header_length]))
+    del buffer[0:header_length]
+
+    grouping_options = GROUPING_OPTIONS
+    table_byte_length = reader.remaining_byte_length()
+    if table_byte_length is not None:
+        table_byte_length += len(buffer)
+        grouping_options = {
+            key: item
+            for key, item in grouping_options.items()
+            if table_byte_length % item["line_grouping"] == 0
+        }
+
+        if not grouping_options:
+            raise ValueError("Unexpected number of bytes within file.")
+
+    return (
+        header_dataframe,
+        _iter_table_chunks(reader, buffer, grouping_options, rows_per_chunk, compact),
+    )
+
+
+def _iter_table_chunks(reader, buffer, grouping_options, rows_per_chunk, compact):
+    column_adjustment_key = _determine_layout(
+        reader, buffer, grouping_options, rows_per_chunk
+    )
+    if column_adjustment_key is None:
+        return
+
+    line_grouping = grouping_options[column_adjustment_key]["line_grouping"]
+    column_names = get_column_names(column_adjustment_key)
+    if len(column_names) != line_grouping // 2:
+        raise ValueError("Columns names don't agree with number of columns")
+
+    chunk_byte_length = rows_per_chunk * line_grouping
+    first_row = 0
+
+    while True:
+        while len(buffer) < chunk_byte_length:
+            data = reader.read(
+                chunk_byte_length - len(buffer), wait=len(buffer) < line_grouping
+            )
+            if not data:
+                break
+
+            buffer += data
+
+        number_of_rows = min(len(buffer) // line_grouping, rows_per_chunk)
+        if number_of_rows == 0:
+            if buffer:
+                raise ValueError("Unexpected number of bytes within file.")
+
+            return
+
+        rows_byte_length = number_of_rows * line_grouping
+        rows = view_table_contents(bytes(buffer[0:rows_byte_length]), line_grouping)
+        del buffer[0:rows_byte_length]
+
+        yield _decode_chunk(rows, column_names, first_row, compact)
+
+        first_row += number_of_rows
+
+
+def _determine_layout(reader, buffer, grouping_options, rows_per_chunk):
+    """Read the start of the table until only one grouping option is
+    able to decode it.
+
+    While more than one option remains, reading continues past the first
+    block, up to the whole table if need be, so that the same layout as
+    ``pymedphys.trf.read`` is found.
+
+    Returns ``None`` if the table turns out to be empty.
+    """
+    largest_line_grouping = max(
+        item["line_grouping"] for item in grouping_options.values()
+    )
+    sample_byte_length = rows_per_chunk * largest_line_grouping
+    reference_state_codes = get_reference_state_codes()
+
+    while True:
+        data = b""
+        if len(buffer) < sample_byte_length:
+            data = reader.read(sample_byte_length - len(buffer), wait=True)
+            buffer += data
+
+        if not buffer:
+            return None
+
+        matching_groupings, non_reference_state_codes_found = match_grouping_options(
+            bytes(buffer), grouping_options, reference_state_codes, is_partial=True
+        )
+
+        if not matching_groupings:
+            raise ValueError(
+                "Decoded table didn't pass shape test. While attempting to "
+                "decode the TRF logfile there were some non-reference state "
+                "codes that were found. This may be the cause of this shape "
+                "test failure. The non-reference state codes found are "
+                f"{non_reference_state_codes_found}"
+            )
+
+        if len(matching_groupings) == 1:
+            return list(matching_groupings.keys())[0]
+
+        if len(buffer) >= sample_byte_length:
+            # Doubling the sample keeps the total number of rows checked
+            # proportional to the length of the table.
+            sample_byte_length *= 2
+        elif not data:
+            raise ValueError("Can't determine version of trf file from table shape")
+
+
+def _decode_chunk(rows, column_names, first_row, compact):
+    time_increment = CONFIG["time_increment"]
+
+    table_dataframe = create_dataframe(
+        rows.astype(np.int64), column_names, time_increment
+    )
+    table_dataframe.index = np.round(
+        (np.arange(len(rows)) + first_row) * time_increment, 2
+    )
+
+    convert_data_table(
+        table_dataframe, CONFIG["linac_state_codes"], CONFIG["wedge_codes"]
+    )
+
+    if compact:
+        table_dataframe = compact_dataframe(table_dataframe)
+
+    return table_dataframe
+
+
+class _Reader:
+    def __init__(self, file, follow, poll_interval, timeout):
+        self._file = file
+        self._follow = follow
+        self._poll_interval = poll_interval
+        self._timeout = timeout
+
+    def read(self, size, wait):
+        """Read up to ``size`` bytes.
+
+        When following and ``wait`` is set, poll the file until either
+        data arrives or the timeout is reached. An empty result means
+        there is no more data.
+        """
+        waited = 0
+        while True:
+            data = self._file.read(size)
+            if data or not (self._follow and wait):
+                return data
+
+            if self._timeout is not None and waited >= self._timeout:
+                return data
+
+            time.sleep(self._poll_interval)
+            waited += self._poll_interval
+
+    def remaining_byte_length(self):
+        """The number of unread bytes, or ``None`` if that isn't fixed."""
+        if self._follow:
+            return None
+
+        try:
+            if not self._file.seekable():
+                return None
+
+            position = self._file.tell()
+            end = self._file.seek(0, os.SEEK_END)
+            self._file.seek(position)
+        except (AttributeError, io.UnsupportedOperation):
+            return None
+
+        return end - position
@@ -0,0 +1,321 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Creates synthetic trf files and diagnostics zips for testing and
+benchmarking.
+"""
+
+import datetime
+import zipfile
+from typing import Dict
+
+from pymedphys._imports import numpy as np
+
+from pymedphys._base.delivery import DeliveryBase
+
+from .constants import (
+    COLLIMATOR_NAME,
+    CONFIG,
+    GANTRY_NAME,
+    JAW_NAMES,
+    Y1_LEAF_BANK_NAMES,
+    Y2_LEAF_BANK_NAMES,
+)
+from .header import HEADER_COLUMN_END
+from .table import (
+    GROUPING_OPTIONS,
+    _negated_negative_and_divide_by_10,
+    get_column_conversions,
+    get_column_names,
+    negative_and_divide_by_10,
+)
+
+LINAC_STATE_NAME = "Linac State/Actual Value (None)"
+WEDGE_NAME = "Wedge Position/Actual Value (None)"
+MU_NAME = "Step Dose/Actual Value (Mu)"
+
+
+def encode_header(
+    machine="2619",
+    date="21/01/01 00:00:00 Z",
+    timezone="+10:00",
+    field_label="1-1",
+    field_name="AP G0",
+) -> bytes:
+    """Create the header portion of a TRF file.
+
+    The fields given are in the same form as those returned by
+    ``decode_header``.
+    """
+    if field_label == "":
+        field = field_name
+    else:
+        field = f"{field_label}/{field_name}"
+
+    return (
+        b"\x00"
+        + date.encode("ascii")
+        + b"\x00"
+        + timezone.encode("ascii")
+        + b"\x00"
+        + field.encode("ascii")
+        + b"\x00"
+        + machine.encode("ascii")
+        + b"\x00"
+        + HEADER_COLUMN_END
+    )
+
+
+def encode_table(
+    columns: Dict[str, "np.ndarray"], number_of_rows, grouping="integrity_v4"
+) -> bytes:
+    """Create the table portion of a TRF file.
+
+    Parameters
+    ----------
+    columns : dict
+        Column values keyed by column name, given in the same units as
+        returned by ``pymedphys.trf.read``. Values are rounded to the
+        precision able to be stored within a TRF.
+    number_of_rows : int
+    grouping : str, optional
+        One of the keys of ``GROUPING_OPTIONS``, by default
+        ``"integrity_v4"``.
+
+    Returns
+    -------
+    trf_table_contents : bytes
+        The encoded table. The linac state of any rows not provided is
+        "Radiation On", the wedge is "Out", and all other columns not
+        provided are zero.
+    """
+    column_names = get_column_names(grouping)
+    if len(column_names) != GROUPING_OPTIONS[grouping]["line_grouping"] // 2:
+        raise ValueError("Columns names don't agree with number of columns")
+
+    column_indices = {name: i for i, name in enumerate(column_names)}
+
+    columns = {
+        LINAC_STATE_NAME: np.full(number_of_rows, "Radiation On"),
+        WEDGE_NAME: np.full(number_of_rows, "Out"),
+        **columns,
+    }
+
+    signed_rows = np.zeros((number_of_rows, len(column_names)), dtype=np.int64)
+    for name, values in columns.items():
+        signed_rows[:, column_indices[name]] = _encode_column(name, values)
+
+    return (signed_rows % 2 ** 16).astype("<u2").tobytes()
+
+
+def _encode_column(name, values):
+    if name == LINAC_STATE_NAME:
+        return _encode_codes(values, CONFIG["linac_state_codes"])
+
+    if name == WEDGE_NAME:
+        return _encode_codes(values, CONFIG["wedge_codes"])
+
+    values = np.asarray(values, dtype=float)
+    conversion = get_column_conversions().get(name)
+
+    if conversion is negative_and_divide_by_10:
+        values = values * 10
+    elif conversion is _negated_negative_and_divide_by_10:
+        values = -values * 10
+
+    encoded = np.round(values).astype(np.int64)
+
+    if conversion is None:
+        lower, upper = 0, 2 ** 16 - 1
+    else:
+        # Matches the two's complement interpretation of ``apply_negative``
+        lower, upper = -(2 ** 15) + 1, 2 ** 15
+
+    if np.any(encoded < lower) or np.any(encoded > upper):
+        raise ValueError(
+            f"Values within `{name}` are outside of the range able to be encoded."
+        )
+
+    return encoded
+
+
+def _encode_codes(values, lookup):
+    codes = {item: int(code) for code, item in lookup.items()}
+
+    try:
+        return np.array([codes[value] for value in values], dtype=np.int64)
+    except KeyError as e:
+        raise ValueError(f"Unable to encode {e} as it is not a known code.")
+
+
+def delivery_to_columns(delivery: DeliveryBase) -> Dict[str, "np.ndarray"]:
+    """The TRF columns that ``pymedphys.Delivery.from_trf`` reads, with
+    one row per control point of the delivery."""
+    mlc = np.array(delivery.mlc, dtype=float)
+    jaw = np.array(delivery.jaw, dtype=float)
+
+    columns = {
+        MU_NAME: np.array(delivery.monitor_units, dtype=float),
+        GANTRY_NAME: np.array(delivery.gantry, dtype=float),
+        COLLIMATOR_NAME: np.array(delivery.collimator, dtype=float),
+    }
+
+    for i, name in enumerate(Y1_LEAF_BANK_NAMES):
+        columns[name] = mlc[:, i, 0]
+
+    for i, name in enumerate(Y2_LEAF_BANK_NAMES):
+        columns[name] = mlc[:, i, 1]
+
+    for i, name in enumerate(JAW_NAMES):
+        columns[name] = jaw[:, i]
+
+    return columns
+
+
+def create_synthetic_delivery(number_of_rows=1500, seed=None) -> DeliveryBase:
+    """Create a random, but physically plausible, single arc delivery.
+
+    Parameters
+    ----------
+    number_of_rows : int, optional
+        The number of control points. When written to a TRF there is one
+        row per control point, and rows are 40 ms apart. By default
+        1500, which is one minute of delivery.
+    seed : int, optional
+        Seed for the random number generator so that the same delivery
+        is able to be reproduced.
+
+    Returns
+    -------
+    delivery : pymedphys.Delivery
+        A delivery with a full gantry rotation, linearly increasing MU,
+        and smoothly varying leaf and jaw positions.
+    """
+    rng = np.random.default_rng(seed)
+    time = np.linspace(0, 1, number_of_rows)
+
+    monitor_units = time * rng.uniform(100, 600)
+    gantry = np.linspace(-179.9, 179.9, number_of_rows)
+    collimator = np.full(number_of_rows, rng.uniform(-45, 45))
+
+    phases = rng.uniform(0, 2 * np.pi, size=(2, 80))
+    frequencies = rng.uniform(1, 4, size=(2, 80))
+    centre = 30 * np.sin(frequencies[0] * 2 * np.pi * time[:, None] + phases[0])
+    width = 40 + 35 * np.sin(frequencies[1] * 2 * np.pi * time[:, None] + phases[1])
+
+    mlc = np.stack([width / 2 + centre, width / 2 - centre], axis=-1)
+
+    jaw_extent = np.max(np.abs(mlc), axis=(1, 2)) + 5
+    jaw = np.stack([jaw_extent, jaw_extent], axis=-1)
+
+    return DeliveryBase(monitor_units, gantry, collimator, mlc, jaw)
+
+
+def create_trf_contents(
+    delivery: DeliveryBase = None,
+    columns: Dict[str, "np.ndarray"] = None,
+    grouping="integrity_v4",
+    **header_fields,
+) -> bytes:
+    """Create the contents of a synthetic TRF file.
+
+    Parameters
+    ----------
+    delivery : pymedphys.Delivery, optional
+        A delivery to write, with one table row per control point.
+    columns : dict, optional
+        Further column values to write, keyed by column name. These take
+        precedence over those created from ``delivery``.
+    grouping : str, optional
+        The TRF table layout, one of the keys of ``GROUPING_OPTIONS``.
+    **header_fields
+        Passed to ``encode_header``.
+
+    Returns
+    -------
+    trf_contents : bytes
+    """
+    all_columns = {}
+    if delivery is not None:
+        all_columns.update(delivery_to_columns(delivery))
+    if columns is not None:
+        all_columns.update(columns)
+
+    lengths = {len(values) for values in all_columns.values()}
+    if len(lengths) != 1:
+        raise ValueError(
+            "Either a delivery or columns need to be provided, and all "
+            "columns need to have the same length."
+        )
+
+    return encode_header(**header_fields) + encode_table(
+        all_columns, lengths.pop(), grouping=grouping
+    )
+
+
+def write_synthetic_diagnostics_zip(
+    filepath,
+    number_of_logfiles=10,
+    machine="2619",
+    start=datetime.datetime(2021, 1, 1, 8, 0, 0),
+    interval=datetime.timedelta(minutes=15),
+    number_of_rows=1500,
+    grouping="integrity_v4",
+    seed=None,
+):
+    """Write a zip of synthetic TRF files in the place of a Linac system
+    diagnostics backup.
+
+    Parameters
+    ----------
+    filepath : os.PathLike
+        The zip file to create. Linac system diagnostics backups are named
+        ``SDD+*.zip``.
+    number_of_logfiles : int, optional
+    machine : str, optional
+        The machine ID recorded within each TRF header.
+    start : datetime.datetime, optional
+        The UTC time of the first delivery.
+    interval : datetime.timedelta, optional
+        The time between the start of each delivery.
+    number_of_rows : int, optional
+        The number of rows within each TRF.
+    grouping : str, optional
+        The TRF table layout, one of the keys of ``GROUPING_OPTIONS``.
+    seed : int, optional
+        Seed so that the same archive is able to be reproduced.
+    """
+    rng = np.random.default_rng(seed)
+
+    with zipfile.ZipFile(filepath, "w", compression=zipfile.ZIP_DEFLATED) as zip_file:
+        for i in range(number_of_logfiles):
+            delivery_time = start + i * interval
+            delivery = create_synthetic_delivery(
+                number_of_rows, seed=rng.integers(2 ** 32)
+            )
+
+            trf_contents = create_trf_contents(
+                delivery,
+                grouping=grouping,
+                machine=machine,
+                date=delivery_time.strftime("%y/%m/%d %H:%M:%S Z"),
+                field_label=f"1-{i + 1}",
+                field_name=f"Arc {i + 1}",
+            )
+
+            member_name = (
+                f"TrfLogs/{machine}/{delivery_time.strftime('%Y%m%d_%H%M%S')}.trf"
+            )
+            zip_file.writestr(member_name, trf_contents)
@@ -12,7 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from typing import List
+from typing import Dict, List
 
 from pymedphys._imports import numpy as np
 from pymedphys._imports import pandas as pd
@@ -26,6 +26,20 @@ GROUPING_OPTIONS = {
     "unity_experimental": {"line_grouping": 700, "linac_state_codes_column": 6},
 }
 
+APPLY_NEGATIVE_KEYS = [
+    "Control point/Actual Value (None)",
+    "Table Isocentric/Scaled Actual (deg)",
+    "Table Isocentric/Positional Error (deg)",
+]
+
+NEGATIVE_AND_DIVIDE_BY_10_KEYS = [
+    "Step Dose/Actual Value (Mu)",
+    "Step Gantry/Scaled Actual (deg)",
+    "Step Gantry/Positional Error (deg)",
+    "Step Collimator/Scaled Actual (deg)",
+    "Step Collimator/Positional Error (deg)",
+]
+
 # LINE_GROUPING_OPTIONS = {
 #     item["line_grouping"]: item["linac_state_codes_column"]
 #     for _, item in GROUPING_OPTIONS.items()
@@ -38,8 +52,25 @@ def decode_rows(
     input_linac_state_codes_column=None,
     reference_state_code_keys=None,
 ):
-    table_byte_length = len(trf_table_contents)
+    raw_rows, column_adjustment_key = decode_raw_rows(
+        trf_table_contents,
+        input_line_grouping=input_line_grouping,
+        input_linac_state_codes_column=input_linac_state_codes_column,
+        reference_state_code_keys=reference_state_code_keys,
+    )
 
+    return raw_rows.astype(np.int64), column_adjustment_key
+
+
+def decode_raw_rows(
+    trf_table_contents,
+    input_line_grouping=None,
+    input_linac_state_codes_column=None,
+    reference_state_code_keys=None,
+):
+    """Determine the table layout and return the table as a zero-copy
+    ``uint16`` view over ``trf_table_contents``.
+    """
     if input_line_grouping is not None or input_linac_state_codes_column is not None:
         if input_line_grouping is None or input_linac_state_codes_column is None:
             raise ValueError(
@@ -56,49 +87,13 @@ def decode_rows(
     else:
         grouping_options = GROUPING_OPTIONS
 
-    possible_groupings = {}
-
-    for key, item in grouping_options.items():
-        grouping_option = item["line_grouping"]
-        linac_state_codes_column = item["linac_state_codes_column"]
-
-        if table_byte_length / grouping_option == table_byte_length // grouping_option:
-            possible_groupings[key] = (grouping_option, linac_state_codes_column)
-
-    if not possible_groupings:
-        raise ValueError("Unexpected number of bytes within file.")
-
-    if reference_state_code_keys is None:
-        reference_state_codes = set(
-            np.array(list(CONFIG["linac_state_codes"].keys())).astype(int)
-        )
-    else:
-        reference_state_codes = set(reference_state_code_keys)
-
-    non_reference_state_codes_found = set()
-    decoded_results = []
-    possible_column_adjustment_key = []
-    for key, (line_grouping, linac_state_codes_column) in possible_groupings.items():
-        rows = [
-            trf_table_contents[i : i + line_grouping]
-            for i in range(0, len(trf_table_contents), line_grouping)
-        ]
-
-        result = decode_table_data(rows, line_grouping)
-        tentative_state_codes = result[  # pylint: disable = unsubscriptable-object
-            :, linac_state_codes_column
-        ]
-
-        if set(tentative_state_codes).issubset(reference_state_codes):
-            decoded_results.append(decode_table_data(rows, line_grouping))
-            possible_column_adjustment_key.append(key)
-        else:
-            non_reference_state_codes = set(tentative_state_codes).difference(
-                reference_state_codes
-            )
-            non_reference_state_codes_found = non_reference_state_codes_found.union(
-                non_reference_state_codes
-            )
+    matching_groupings, non_reference_state_codes_found = match_grouping_options(
+        trf_table_contents,
+        grouping_options,
+        get_reference_state_codes(reference_state_code_keys),
+    )
+    decoded_results = list(matching_groupings.values())
+    possible_column_adjustment_key = list(matching_groupings.keys())
 
     if not decoded_results:
         raise ValueError(
@@ -118,6 +113,76 @@ def decode_rows(
     return decoded_rows, column_adjustment_key
 
 
+def get_reference_state_codes(reference_state_code_keys=None):
+    if reference_state_code_keys is None:
+        return set(np.array(list(CONFIG["linac_state_codes"].keys())).astype(int))
+
+    return set(reference_state_code_keys)
+
+
+def match_grouping_options(
+    trf_table_contents, grouping_options, reference_state_codes, is_partial=False
+):
+    """Find the grouping options that are able to decode the table.
+
+    Parameters
+    ----------
+    trf_table_contents : bytes
+        The table portion of a TRF file.
+    grouping_options : dict
+        Grouping options of the same form as ``GROUPING_OPTIONS``.
+    reference_state_codes : set of int
+        The linac state codes that are expected to be found.
+    is_partial : bool, optional
+        Set to ``True`` when ``trf_table_contents`` is only the start of
+        the table. The line groupings are then not required to evenly
+        divide it, and any trailing partial row is ignored.
+
+    Returns
+    -------
+    matching_groupings : dict
+        Zero-copy ``uint16`` views of the table's complete rows, keyed
+        by each grouping option whose linac state codes column only
+        contains reference state codes.
+    non_reference_state_codes_found : set of int
+        The non-reference state codes that caused the other grouping
+        options to be rejected.
+    """
+    if not is_partial:
+        table_byte_length = len(trf_table_contents)
+        grouping_options = {
+            key: item
+            for key, item in grouping_options.items()
+            if table_byte_length % item["line_grouping"] == 0
+        }
+
+        if not grouping_options:
+            raise ValueError("Unexpected number of bytes within file.")
+
+    matching_groupings = {}
+    non_reference_state_codes_found = set()
+
+    for key, item in grouping_options.items():
+        line_grouping = item["line_grouping"]
+        linac_state_codes_column = item["linac_state_codes_column"]
+
+        number_of_complete_rows = len(trf_table_contents) // line_grouping
+        result = view_table_contents(
+            trf_table_contents[0 : number_of_complete_rows * line_grouping],
+            line_grouping,
+        )
+        tentative_state_codes = set(np.unique(result[:, linac_state_codes_column]))
+
+        if tentative_state_codes.issubset(reference_state_codes):
+            matching_groupings[key] = result
+        else:
+            non_reference_state_codes_found = non_reference_state_codes_found.union(
+                tentative_state_codes.difference(reference_state_codes)
+            )
+
+    return matching_groupings, non_reference_state_codes_found
+
+
 def decode_rows_from_file(filepath):
     with open(filepath, "rb") as file:
         trf_contents = file.read()
@@ -155,7 +220,7 @@ def get_column_names(column_adjustment_key):
     return column_names
 
 
-def decode_trf_table(trf_table_contents):
+def decode_trf_table(trf_table_contents, compact=False):
     decoded_rows, column_adjustment_key = decode_rows(trf_table_contents)
 
     column_names = get_column_names(column_adjustment_key)
@@ -173,36 +238,98 @@ def decode_trf_table(trf_table_contents):
         table_dataframe, CONFIG["linac_state_codes"], CONFIG["wedge_codes"]
     )
 
+    if compact:
+        table_dataframe = compact_dataframe(table_dataframe)
+
     return table_dataframe
 
 
-def decode_data_item(row, group, byteorder) -> int:
-    """Converts the bytes of data items into an integer."""
-    return int.from_bytes(row[group], byteorder=byteorder)
+def view_table_contents(trf_table_contents, line_grouping) -> "np.ndarray":
+    """View the table as unsigned integers without copying it.
 
+    Every item within the table is a little-endian unsigned 2 byte
+    integer, so the whole table is able to be read as a single array
+    with one row per ``line_grouping`` bytes.
+    """
+    table = np.frombuffer(trf_table_contents, dtype="<u2")
 
-def decode_column(raw_table_rows: List[str], column_number: int):
-    """Decode all of the items in a given column."""
-    grouping = 2
-    i = column_number * grouping
-    group = slice(i, i + grouping)
-    byteorder = "little"
+    return table.reshape(-1, line_grouping // 2)
 
-    column = np.array(
-        [decode_data_item(row, group, byteorder) for row in raw_table_rows]
-    )
 
-    return column
+def decode_table_contents(trf_table_contents: bytes, line_grouping) -> "np.ndarray":
+    """Decode the table into integer values."""
+    return view_table_contents(trf_table_contents, line_grouping).astype(np.int64)
 
 
-def decode_table_data(raw_table_rows: List[str], line_grouping):
-    """Decode the table into integer values."""
+def decode_table_data(raw_table_rows: List[bytes], line_grouping):
+    """Decode the table, provided as a list of rows, into integer values."""
+    return decode_table_contents(b"".join(raw_table_rows), line_grouping)
 
-    result = []
-    for column_number in range(0, line_grouping // 2):
-        result.append(decode_column(raw_table_rows, column_number))
 
-    return np.array(result).T
+def decode_selected_columns(
+    trf_table_contents, selected_column_names
+) -> Dict[str, "np.ndarray"]:
+    """Decode only the requested numeric columns of a TRF table.
+
+    This skips the creation of a DataFrame and the conversion of the
+    linac state and wedge codes into strings. The values returned are
+    scaled identically to those given by ``decode_trf_table``.
+
+    Parameters
+    ----------
+    trf_table_contents : bytes
+        The table portion of a TRF file.
+    selected_column_names : list of str
+        The names of the columns to decode.
+
+    Returns
+    -------
+    columns : dict
+        The decoded columns as float arrays, keyed by column name.
+    """
+    raw_rows, column_adjustment_key = decode_raw_rows(trf_table_contents)
+
+    column_names = get_column_names(column_adjustment_key)
+    if len(column_names) != raw_rows.shape[1]:
+        raise ValueError("Columns names don't agree with number of columns")
+
+    column_indices = {name: i for i, name in enumerate(column_names)}
+    conversions = get_column_conversions()
+
+    columns = {}
+    for name in selected_column_names:
+        raw_column = raw_rows[:, column_indices[name]]
+
+        try:
+            columns[name] = conversions[name](raw_column)
+        except KeyError:
+            raise ValueError(
+                f"The column `{name}` is not a numeric column that is able "
+                "to be selectively decoded."
+            )
+
+    return columns
+
+
+def get_column_conversions():
+    """The conversion applied to each numeric column within
+    ``convert_data_table``, keyed by column name."""
+    base_column_names = get_base_column_names()
+
+    conversions = {}
+    for key in NEGATIVE_AND_DIVIDE_BY_10_KEYS + base_column_names[14:30]:
+        conversions[key] = negative_and_divide_by_10
+
+    for key in base_column_names[110::]:
+        conversions[key] = negative_and_divide_by_10
+
+    for key in base_column_names[30:110]:
+        conversions[key] = _negated_negative_and_divide_by_10
+
+    for key in APPLY_NEGATIVE_KEYS:
+        conversions[key] = apply_negative
+
+    return conversions
 
 
 def create_dataframe(data, column_names, time_increment):
@@ -250,27 +377,19 @@ def convert_wedge_codes(dataframe, wedge_codes):
 
 
 def apply_negative(column):
-    result = np.ones_like(column).astype(np.float64) * np.nan
-    negative_values = column.values > 2 ** 15
-
-    result[negative_values] = column[negative_values] - 2 ** 16
-    result[np.invert(negative_values)] = column[np.invert(negative_values)]
+    """Interpret values above 2 ** 15 as negative two's complement values.
 
-    if np.any(np.isnan(result)):
-        raise ValueError("Not all column values were converted")
+    Accepts either a single column or a 2D block of columns.
+    """
+    values = np.asarray(column, dtype=np.int64)
 
-    return result
+    return np.where(values > 2 ** 15, values - 2 ** 16, values).astype(np.float64)
 
 
 def convert_applying_negative(dataframe):
-    keys = [
-        "Control point/Actual Value (None)",
-        "Table Isocentric/Scaled Actual (deg)",
-        "Table Isocentric/Positional Error (deg)",
-    ]
+    keys = APPLY_NEGATIVE_KEYS
 
-    for key in keys:
-        dataframe[key] = apply_negative(dataframe[key])
+    dataframe[keys] = apply_negative(dataframe[keys])
 
 
 def negative_and_divide_by_10(column):
@@ -281,16 +400,13 @@ def negative_and_divide_by_10(column):
 
 
 def convert_negative_and_divide_by_10(dataframe):
-    keys = [
-        "Step Dose/Actual Value (Mu)",
-        "Step Gantry/Scaled Actual (deg)",
-        "Step Gantry/Positional Error (deg)",
-        "Step Collimator/Scaled Actual (deg)",
-        "Step Collimator/Positional Error (deg)",
-    ]
+    keys = NEGATIVE_AND_DIVIDE_BY_10_KEYS
+
+    dataframe[keys] = negative_and_divide_by_10(dataframe[keys])
+
 
-    for key in keys:
-        dataframe[key] = negative_and_divide_by_10(dataframe[key])
+def _negated_negative_and_divide_by_10(column):
+    return -negative_and_divide_by_10(column)
 
 
 def convert_remaining(dataframe):
@@ -299,34 +415,71 @@ def convert_remaining(dataframe):
     # change, this logic here will need to be changed.
     base_column_names = get_base_column_names()
 
+    keys = []
     for key in base_column_names[14:30]:
-        try:
-            dataframe[key] = negative_and_divide_by_10(dataframe[key])
-        except KeyError:
-            if "Dlg" in key:
-                # Unity logfile do not have a "Dlg" record
-                pass
-            else:
-                raise
+        if key in dataframe.columns:
+            keys.append(key)
+        elif "Dlg" not in key:
+            # Unity logfile do not have a "Dlg" record
+            raise KeyError(key)
+
+    dataframe[keys] = negative_and_divide_by_10(dataframe[keys])
 
     # Previously a bug crept in due to this choice of logic. When the
     # decoding was adjusted to support Integrity 4 four extra
     # columns were added. This resulted in this logic being applied to
     # the wrong columns (offset by four).
-    for key in base_column_names[30:110]:
+    y2_leaf_keys = base_column_names[30:110]
+    for key in y2_leaf_keys:
         if "Leaf" not in key or "Y2" not in key or "Scaled Actual" not in key:
             raise ValueError("Y2 Leaf Keys were not in their expected positions.")
 
-        # Y2 leaves need to be multiplied by -1
-        dataframe[key] = -negative_and_divide_by_10(dataframe[key])
+    # Y2 leaves need to be multiplied by -1
+    dataframe[y2_leaf_keys] = -negative_and_divide_by_10(dataframe[y2_leaf_keys])
 
-    for key in base_column_names[110::]:
+    remaining_leaf_keys = base_column_names[110::]
+    for key in remaining_leaf_keys:
         if "Leaf" not in key:
             raise ValueError(
                 "The remaining leaf columns were not in their "
                 f"expected positions. Key found was `{key}`."
             )
-        dataframe[key] = negative_and_divide_by_10(dataframe[key])
+
+    dataframe[remaining_leaf_keys] = negative_and_divide_by_10(
+        dataframe[remaining_leaf_keys]
+    )
+
+
+def compact_dataframe(dataframe):
+    """Convert a decoded TRF table to smaller dtypes.
+
+    The scaled floating point columns, such as the mechanical axes,
+    become ``float32``. The unscaled integer columns, such as the dose
+    and pause counters, are stored within the TRF as unsigned 2 byte
+    integers and so become ``uint16`` without any loss. The linac state
+    and wedge columns become ``pandas.Categorical``. Their categories
+    are all of the configured codes, rather than only those present, so
+    that compact tables are able to be concatenated without losing the
+    categorical dtype.
+    """
+    categorical_dtypes = {
+        "Linac State/Actual Value (None)": pd.CategoricalDtype(
+            CONFIG["linac_state_codes"].values()
+        ),
+        "Wedge Position/Actual Value (None)": pd.CategoricalDtype(
+            CONFIG["wedge_codes"].values()
+        ),
+    }
+    float_keys = dataframe.select_dtypes(include=[np.float64]).columns
+    integer_keys = dataframe.select_dtypes(include=[np.int64]).columns
+
+    return dataframe.astype(
+        {
+            **{key: np.float32 for key in float_keys},
+            **{key: np.uint16 for key in integer_keys},
+            **categorical_dtypes,
+        }
+    )
 
 
 def convert_data_table(dataframe, linac_state_codes, wedge_codes):
@@ -28,7 +28,9 @@ from .table import decode_trf_table
 path_or_binary_file = Union[BinaryIO, "os.PathLike[Any]"]
 
 
-def trf2pandas(trf: path_or_binary_file) -> Tuple["pd.DataFrame", "pd.DataFrame"]:
+def trf2pandas(
+    trf: path_or_binary_file, compact: bool = False
+) -> Tuple["pd.DataFrame", "pd.DataFrame"]:
     """Read an Elekta Linac Agility Head TRF into a Pandas DataFrame.
 
     Parameters
@@ -37,6 +39,14 @@ def trf2pandas(trf: path_or_binary_file) -> Tuple["pd.DataFrame", "pd.DataFrame"
         Either a file-like object or a pathlike object pointing to
         either the file location on disk, or the binary contents of a
         given TRF.
+    compact : bool, optional
+        If ``True`` the table is returned with smaller dtypes. The
+        scaled columns, such as the mechanical axes, are ``float32``,
+        the remaining integer columns, such as the counters, are
+        ``uint16``, and the linac state and wedge columns are
+        ``pandas.Categorical``. This reduces the table's memory use by
+        more than half, which is useful when concatenating many logs.
+        By default ``False``.
 
     Returns
     -------
@@ -45,6 +55,19 @@ def trf2pandas(trf: path_or_binary_file) -> Tuple["pd.DataFrame", "pd.DataFrame"
         second being the TRF table content.
 
     """
+    trf_contents = read_trf_contents(trf)
+
+    trf_header_contents, trf_table_contents = split_into_header_table(trf_contents)
+    header_dataframe = header_as_dataframe(trf_header_contents)
+    table_dataframe = decode_trf_table(trf_table_contents, compact=compact)
+
+    return header_dataframe, table_dataframe
+
+
+read_trf = trf2pandas
+
+
+def read_trf_contents(trf: path_or_binary_file) -> bytes:
     binary_file_trf = cast(BinaryIO, trf)
     path_like_trf = cast("os.PathLike[Any]", trf)
 
@@ -55,14 +78,7 @@ def trf2pandas(trf: path_or_binary_file) -> Tuple["pd.DataFrame", "pd.DataFrame"
         with open(path_like_trf, "rb") as f:
             trf_contents = f.read()
 
-    trf_header_contents, trf_table_contents = split_into_header_table(trf_contents)
-    header_dataframe = header_as_dataframe(trf_header_contents)
-    table_dataframe = decode_trf_table(trf_table_contents)
-
-    return header_dataframe, table_dataframe
-
-
-read_trf = trf2pandas
+    return trf_contents
 
 
 def header_as_dataframe(trf_header_contents):
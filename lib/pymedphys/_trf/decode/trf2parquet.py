@@ -0,0 +1,173 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Converts trf files into compact, columnar, parquet files.
+"""
+
+import concurrent.futures
+import json
+import logging
+import os
+import pathlib
+import traceback
+from typing import List, Tuple
+
+from pymedphys._imports import pandas as pd
+from pymedphys._imports import pyarrow
+
+from .header import Header
+from .trf2pandas import trf2pandas
+
+HEADER_METADATA_KEY = b"pymedphys.trf.header"
+
+
+def trf2parquet(trf_filepath, parquet_filepath):
+    """Convert a single TRF into a parquet file.
+
+    The table is stored with compact dtypes, and the header fields are
+    stored within the parquet file's key-value metadata.
+    """
+    header, table = trf2pandas(trf_filepath, compact=True)
+
+    arrow_table = pyarrow.Table.from_pandas(table, preserve_index=True)
+    metadata = {
+        **arrow_table.schema.metadata,
+        HEADER_METADATA_KEY: json.dumps(header.iloc[0].to_dict()).encode(),
+    }
+    arrow_table = arrow_table.replace_schema_metadata(metadata)
+
+    parquet_filepath = pathlib.Path(parquet_filepath)
+    parquet_filepath.parent.mkdir(parents=True, exist_ok=True)
+
+    temp_filepath = parquet_filepath.with_name(f"{parquet_filepath.name}.temp")
+    pyarrow.parquet.write_table(arrow_table, str(temp_filepath))
+    os.replace(temp_filepath, parquet_filepath)
+
+
+def read_trf_parquet(
+    parquet_filepath, columns: List[str] = None
+) -> Tuple["pd.DataFrame", "pd.DataFrame"]:
+    """Read a parquet file created by ``trf2parquet``.
+
+    Parameters
+    ----------
+    parquet_filepath : pathlib.Path
+    columns : list of str, optional
+        If provided, only these table columns are read from disk.
+
+    Returns
+    -------
+    Tuple[pd.DataFrame, pd.DataFrame]
+        The TRF header and table, in the same form as
+        ``pymedphys.trf.read``, but with compact dtypes.
+    """
+    arrow_table = pyarrow.parquet.read_table(str(parquet_filepath), columns=columns)
+
+    header_fields = json.loads(arrow_table.schema.metadata[HEADER_METADATA_KEY])
+    header = pd.DataFrame([header_fields], columns=Header._fields)
+
+    return header, arrow_table.to_pandas()
+
+
+def is_up_to_date(trf_filepath, parquet_filepath):
+    try:
+        parquet_mtime = os.path.getmtime(parquet_filepath)
+    except FileNotFoundError:
+        return False
+
+    return parquet_mtime >= os.path.getmtime(trf_filepath)
+
+
+def _convert_one(paths):
+    trf_filepath, parquet_filepath = paths
+
+    try:
+        trf2parquet(trf_filepath, parquet_filepath)
+    except Exception:  # pylint: disable = broad-except
+        return trf_filepath, traceback.format_exc()
+
+    return trf_filepath, None
+
+
+def trf2parquet_by_directory(input_directory, output_directory, processes=None):
+    """Convert a directory tree of TRF files with a pool of processes.
+
+    The directory structure is mirrored within the output directory.
+    TRF files whose parquet file is newer than the TRF are skipped.
+
+    Parameters
+    ----------
+    input_directory : pathlib.Path
+    output_directory : pathlib.Path
+    processes : int, optional
+        The number of worker processes, defaults to the number of CPUs.
+
+    Returns
+    -------
+    converted : list of pathlib.Path
+    skipped : list of pathlib.Path
+    failed : dict
+        The traceback of each TRF that failed to convert, keyed by its
+        path.
+    """
+    input_directory = pathlib.Path(input_directory)
+    output_directory = pathlib.Path(output_directory)
+
+    to_convert = []
+    skipped = []
+    for trf_filepath in sorted(input_directory.glob("**/*.trf")):
+        parquet_filepath = output_directory.joinpath(
+            trf_filepath.relative_to(input_directory)
+        ).with_suffix(".parquet")
+
+        if is_up_to_date(trf_filepath, parquet_filepath):
+            skipped.append(trf_filepath)
+        else:
+            to_convert.append((trf_filepath, parquet_filepath))
+
+    logging.info(
+        "Converting %(to_convert)s trf files, %(skipped)s are already up to date",
+        {"to_convert": len(to_convert), "skipped": len(skipped)},
+    )
+
+    converted = []
+    failed = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        for trf_filepath, error in executor.map(_convert_one, to_convert, chunksize=8):
+            if error is None:
+                converted.append(trf_filepath)
+            else:
+                logging.warning(
+                    "Failed to convert %(trf_filepath)s:\n%(error)s",
+                    {"trf_filepath": trf_filepath, "error": error},
+                )
+                failed[trf_filepath] = error
+
+    return converted, skipped, failed
+
+
+def trf2parquet_cli(args):
+    converted, skipped, failed = trf2parquet_by_directory(
+        args.input_directory, args.output_directory, processes=args.processes
+    )
+
+    print(
+        f"Converted: {len(converted)}, "
+        f"Already up to date: {len(skipped)}, "
+        f"Failed: {len(failed)}"
+    )
+
+    for trf_filepath in failed:
+        print(f"    Failed: {trf_filepath}")
@@ -0,0 +1,242 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""A memory mapped, lazily decoded, TRF reader.
+"""
+
+import mmap
+import os
+from typing import Any, Dict, List, Optional, Union
+
+from pymedphys._imports import numpy as np
+from pymedphys._imports import pandas as pd
+
+from .constants import CONFIG
+from .header import Header, decode_header, determine_header_length
+from .table import (
+    convert_data_table,
+    create_dataframe,
+    decode_raw_rows,
+    get_column_conversions,
+    get_column_names,
+)
+
+
+class TrfFile:
+    """An Elekta Linac Agility Head TRF that is decoded on demand.
+
+    The file is memory mapped rather than read. Only the header is
+    decoded upon opening, and table columns are decoded the first time
+    they are accessed. The table is stored row by row, so every page of
+    it holds every column. Determining the table layout, done upon the
+    first access to the table, checks the state code column of every
+    row and so reads the whole table from disk. Later accesses are then
+    served from the page cache without copying the table.
+
+    Indexing with a column name returns that column decoded into the
+    same units as ``pymedphys.trf.read``. Indexing with a slice returns
+    a new ``TrfFile`` restricted to that range of rows which shares the
+    same memory map. Only the ``TrfFile`` that opened the file owns the
+    memory map. Closing a slice does not close the file, and slices can
+    no longer be read once the file they were taken from is closed.
+
+    Parameters
+    ----------
+    filepath : os.PathLike
+        The path to the TRF file.
+
+    Examples
+    --------
+    >>> with TrfFile("a/path/goes/here.trf") as trf:  # doctest: +SKIP
+    ...     gantry = trf["Step Gantry/Scaled Actual (deg)"]
+    ...     first_second = trf[0:25].to_pandas()
+    """
+
+    def __init__(self, filepath: "os.PathLike[Any]"):
+        with open(filepath, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self._owner = self
+        self._header_length = determine_header_length(self._mmap)
+        self._header: Optional[Header] = None
+        self._all_raw_rows = None
+        self._column_adjustment_key: Optional[str] = None
+        self._row_slice = slice(None)
+        self._decoded_columns: Dict[str, "np.ndarray"] = {}
+
+    @property
+    def header(self) -> Header:
+        """The decoded TRF header."""
+        owner = self._owner
+        if owner._header is None:
+            owner._header = decode_header(owner._mmap[0 : owner._header_length])
+
+        return owner._header
+
+    @property
+    def column_names(self) -> List[str]:
+        self._determine_layout()
+        return get_column_names(self._owner._column_adjustment_key)
+
+    @property
+    def raw_rows(self) -> "np.ndarray":
+        """A zero-copy ``uint16`` view of the selected table rows.
+
+        This view is only valid for as long as the file remains open.
+        """
+        self._determine_layout()
+        return self._owner._all_raw_rows[self._row_slice]
+
+    def raw_column(self, name: str) -> "np.ndarray":
+        """A zero-copy ``uint16`` view of a single undecoded column."""
+        return self.raw_rows[:, self.column_names.index(name)]
+
+    def column(self, name: str) -> "np.ndarray":
+        """A single column, decoded in the same way as
+        ``pymedphys.trf.read``.
+
+        Columns that have no numerical conversion, such as the linac
+        state codes, are returned as their integer codes.
+        """
+        try:
+            return self._decoded_columns[name]
+        except KeyError:
+            pass
+
+        raw_column = self.raw_column(name)
+
+        try:
+            conversion = get_column_conversions()[name]
+            decoded = conversion(raw_column)
+        except KeyError:
+            decoded = raw_column.astype(np.int64)
+
+        self._decoded_columns[name] = decoded
+
+        return decoded
+
+    def to_pandas(self, columns: List[str] = None) -> "pd.DataFrame":
+        """Decode the selected rows into a DataFrame.
+
+        Parameters
+        ----------
+        columns : list of str, optional
+            If provided, only these columns are decoded and the linac
+            state and wedge codes are left as integers.
+
+        Returns
+        -------
+        pd.DataFrame
+            The same table as given by ``pymedphys.trf.read``,
+            restricted to the selected rows and columns.
+        """
+        self._determine_layout()
+        first_row = range(len(self._owner._all_raw_rows))[self._row_slice].start
+        index = np.round(
+            (np.arange(len(self)) + first_row) * CONFIG["time_increment"], 2
+        )
+
+        if columns is not None:
+            return pd.DataFrame(
+                {name: self.column(name) for name in columns}, index=index
+            )
+
+        table_dataframe = create_dataframe(
+            self.raw_rows.astype(np.int64),
+            self.column_names,
+            CONFIG["time_increment"],
+        )
+        table_dataframe.index = index
+
+        convert_data_table(
+            table_dataframe, CONFIG["linac_state_codes"], CONFIG["wedge_codes"]
+        )
+
+        return table_dataframe
+
+    def close(self):
+        """Close the memory map of the file.
+
+        Closing a row slice only releases its decoded columns.
+
+        Raises
+        ------
+        BufferError
+            If views of the table, such as those returned by
+            ``raw_rows`` or ``raw_column``, are still referenced.
+            Closing can be retried once they have been released.
+        """
+        self._decoded_columns = {}
+
+        if self._owner is not self:
+            return
+
+        self._all_raw_rows = None
+
+        try:
+            self._mmap.close()
+        except BufferError as e:
+            raise BufferError(
+                "Unable to close the TRF file as views of its table are "
+                "still referenced. Copy any raw rows or columns that need "
+                "to outlive the file."
+            ) from e
+
+    def __len__(self):
+        return len(self.raw_rows)
+
+    def __getitem__(self, key: Union[str, slice]):
+        if isinstance(key, slice):
+            return self._slice(key)
+
+        return self.column(key)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _determine_layout(self):
+        owner = self._owner
+        if owner._mmap.closed:
+            raise ValueError("I/O operation on a closed TRF file.")
+
+        if owner._all_raw_rows is not None:
+            return
+
+        table_contents = memoryview(owner._mmap)[owner._header_length : :]
+        owner._all_raw_rows, owner._column_adjustment_key = decode_raw_rows(
+            table_contents
+        )
+
+    def _slice(self, row_slice: slice) -> "TrfFile":
+        if row_slice.step not in (None, 1):
+            raise ValueError("Only contiguous row ranges are supported.")
+
+        self._determine_layout()
+        row_range = range(len(self._owner._all_raw_rows))[self._row_slice][row_slice]
+
+        # Slices only reference the file's owner, and hold no views of
+        # the memory map themselves, so that the owner can still close
+        # it while slices exist.
+        sliced = object.__new__(type(self))
+        sliced._owner = self._owner  # pylint: disable = protected-access
+        sliced._row_slice = slice(  # pylint: disable = protected-access
+            row_range.start, row_range.stop
+        )
+        sliced._decoded_columns = {}  # pylint: disable = protected-access
+
+        return sliced
@@ -20,3 +20,4 @@
 from .diagnostics_zips import already_indexed_path
 from .identify import identify_logfile
 from .index import index_logfiles
+from .index_store import LogfileIndex, open_logfile_index
@@ -13,12 +13,16 @@
 # limitations under the License.
 
 
+import concurrent.futures
 import os
 import pathlib
 import shutil
+import traceback
 import zipfile
 from glob import glob
 
+from .index_store import open_logfile_index
+
 
 def fetch_system_diagnostics(ip, storage_directory, other_directory=None):
     r"""Fetches and stores locally Linac system diagnostic files.
@@ -51,7 +55,12 @@ def fetch_system_diagnostics(ip, storage_directory, other_directory=None):
 
         if doesnt_exist_in_either_directory:
             print("    Copying {}...".format(basename))
-            shutil.copyfile(nss_filepath, storage_filepath)
+
+            # Copy to a temporary name first so that an interrupted copy
+            # is not mistaken for a complete one on the next run.
+            temp_filepath = "{}.part".format(storage_filepath)
+            shutil.copyfile(nss_filepath, temp_filepath)
+            os.replace(temp_filepath, storage_filepath)
         else:
             print("    {} has already been copied.".format(basename))
 
@@ -61,6 +70,7 @@ def fetch_system_diagnostics_multi_linac(
     storage_directory,
     to_be_indexed="to_be_indexed",
     already_indexed="already_indexed",
+    max_workers=8,
 ):
     """Run `fetch_system_diagnostics` for a set of machines and corresponding
     IPs.
@@ -68,6 +78,9 @@ def fetch_system_diagnostics_multi_linac(
     Won't redownload the diagnostic files if that diagnostics zip filename
     exists in either to_be_indexed or already_indexed.
 
+    Up to ``max_workers`` machines are fetched from concurrently. A
+    machine that fails to be fetched from does not stop the others.
+
     Example
     -------
 
@@ -81,7 +94,7 @@ def fetch_system_diagnostics_multi_linac(
     fetch_system_diagnostics_multi_linac(machine_ip_map, storage_directory)
     """
 
-    for machine, ip in machine_ip_map.items():
+    def fetch_one_machine(machine, ip):
         print("\nFetching diagnostic zip files from {} @ {}".format(machine, ip))
         machine_storage_directory = os.path.join(
             storage_directory, to_be_indexed, machine
@@ -96,6 +109,19 @@ def fetch_system_diagnostics_multi_linac(
             ip, machine_storage_directory, already_indexed_directory
         )
 
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(fetch_one_machine, machine, ip): machine
+            for machine, ip in machine_ip_map.items()
+        }
+
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                future.result()
+            except Exception:  # pylint: disable = broad-except
+                print("\nFailed to fetch from {}:".format(futures[future]))
+                traceback.print_exc()
+
     print("")
 
 
@@ -108,6 +134,13 @@ def already_indexed_path(current_location, to_be_indexed, already_indexed):
 
 
 def extract_diagnostic_zips_and_archive(logfile_data_directory):
+    """Extract the logfiles within the diagnostic zips to be indexed,
+    skipping those already extracted, and archive the zips.
+
+    The extracted zip members are recorded within the logfile index.
+    As with every use of ``open_logfile_index``, an ``index.json``
+    within the data directory is first migrated into ``index.db``.
+    """
     diagnostics_directory = os.path.join(logfile_data_directory, "diagnostics")
     diagnostics_to_be_indexed = os.path.join(diagnostics_directory, "to_be_indexed")
     diagnostics_already_indexed = os.path.join(diagnostics_directory, "already_indexed")
@@ -124,20 +157,74 @@ def extract_diagnostic_zips_and_archive(logfile_data_directory):
         )
     )
 
-    for diagnostic_filepath in diagnostics_filepaths:
-        path_to_be_moved_to = already_indexed_path(
-            diagnostic_filepath, diagnostics_to_be_indexed, diagnostics_already_indexed
-        )
+    with open_logfile_index(logfile_data_directory) as logfile_index:
+        for diagnostic_filepath in diagnostics_filepaths:
+            _extract_and_archive(
+                diagnostic_filepath,
+                diagnostics_to_be_indexed,
+                diagnostics_already_indexed,
+                logfiles_to_be_indexed,
+                logfile_index,
+            )
+
+
+def _extract_and_archive(
+    diagnostic_filepath,
+    diagnostics_to_be_indexed,
+    diagnostics_already_indexed,
+    logfiles_to_be_indexed,
+    logfile_index,
+):
+    path_to_be_moved_to = already_indexed_path(
+        diagnostic_filepath, diagnostics_to_be_indexed, diagnostics_already_indexed
+    )
+
+    pathlib.Path(os.path.dirname(path_to_be_moved_to)).mkdir(
+        parents=True, exist_ok=True
+    )
+
+    print("    Extracting {}".format(diagnostic_filepath))
+
+    with zipfile.ZipFile(diagnostic_filepath, "r") as zip_file:
+        trf_members = [
+            zip_info
+            for zip_info in zip_file.infolist()
+            if zip_info.filename.endswith(".trf")
+        ]
+        new_trf_members = logfile_index.new_zip_members(trf_members)
 
-        pathlib.Path(os.path.dirname(path_to_be_moved_to)).mkdir(
-            parents=True, exist_ok=True
+        print(
+            "        {} of {} logfiles have not previously been "
+            "extracted".format(len(new_trf_members), len(trf_members))
         )
 
-        print("    Extracting {}".format(diagnostic_filepath))
+        for zip_info in new_trf_members:
+            extract_zip_member(zip_file, zip_info, logfiles_to_be_indexed)
 
-        with zipfile.ZipFile(diagnostic_filepath, "r") as zip_file:
-            for file_name in zip_file.namelist():
-                if file_name.endswith(".trf"):
-                    zip_file.extract(file_name, logfiles_to_be_indexed)
+    logfile_index.add_zip_members(new_trf_members)
 
-        shutil.move(diagnostic_filepath, path_to_be_moved_to)
+    shutil.move(diagnostic_filepath, path_to_be_moved_to)
+
+
+def extract_zip_member(zip_file: zipfile.ZipFile, zip_info, output_directory):
+    """Stream a single zip member to its location within the output
+    directory.
+
+    The member is written to a temporary file which is then renamed, so
+    that an interrupted extraction never leaves a truncated file behind.
+    """
+    # As within ``zipfile.ZipFile.extract``, absolute paths and parent
+    # directory references are stripped from the member's path.
+    member_path_parts = [
+        part
+        for part in pathlib.PurePosixPath(zip_info.filename.replace("\\", "/")).parts
+        if part not in ("/", ".", "..")
+    ]
+    output_filepath = pathlib.Path(output_directory).joinpath(*member_path_parts)
+    output_filepath.parent.mkdir(parents=True, exist_ok=True)
+
+    temp_filepath = output_filepath.with_name(output_filepath.name + ".part")
+    with zip_file.open(zip_info) as member, open(temp_filepath, "wb") as f:
+        shutil.copyfileobj(member, f)
+
+    os.replace(temp_filepath, output_filepath)
@@ -0,0 +1,242 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""A persistent index of TRF header fields.
+"""
+
+import os
+import pathlib
+import sqlite3
+from datetime import datetime, timezone
+
+from pymedphys._imports import pandas as pd
+
+from pymedphys._trf.decode.header import Header, decode_header_from_file
+
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS headers (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        utc_datetime TEXT,
+        machine TEXT,
+        date TEXT,
+        timezone TEXT,
+        field_label TEXT,
+        field_name TEXT,
+        error TEXT
+    )
+"""
+
+CREATE_INDICES = [
+    "CREATE INDEX IF NOT EXISTS headers_machine_datetime "
+    "ON headers (machine, utc_datetime)",
+    "CREATE INDEX IF NOT EXISTS headers_datetime ON headers (utc_datetime)",
+]
+
+HEADER_COLUMNS = ["utc_datetime"] + list(Header._fields)
+
+
+class HeaderIndex:
+    """A persistent SQLite index of the headers of many TRF files.
+
+    Each file's header is only decoded when the file is new, or when
+    its size or modification time has changed since it was last
+    indexed. Queries by machine, date, and field are then answered from
+    the index without touching the TRF files.
+
+    Parameters
+    ----------
+    database_path : os.PathLike
+        The SQLite database to store the index within. It is created if
+        it does not yet exist.
+
+    Examples
+    --------
+    >>> with HeaderIndex("trf_headers.db") as index:  # doctest: +SKIP
+    ...     index.update("path/to/trf/archive")
+    ...     logfiles = index.query(
+    ...         machine="2619", start="2021-01-01", end="2021-02-01"
+    ...     )
+    """
+
+    def __init__(self, database_path):
+        self._connection = sqlite3.connect(str(database_path))
+
+        with self._connection:
+            self._connection.execute(CREATE_TABLE)
+            for create_index in CREATE_INDICES:
+                self._connection.execute(create_index)
+
+    def update(self, directory, pattern="**/*.trf"):
+        """Bring the index up to date with the TRF files within a
+        directory.
+
+        Files that no longer exist within the directory are removed
+        from the index.
+
+        Parameters
+        ----------
+        directory : os.PathLike
+            The directory to search.
+        pattern : str, optional
+            The glob pattern used to find TRF files, by default
+            ``"**/*.trf"``.
+
+        Returns
+        -------
+        number_decoded : int
+            The number of headers that needed to be decoded.
+        """
+        directory = pathlib.Path(directory).resolve()
+        directory_prefix = os.path.join(str(directory), "")
+
+        # A range over the path's primary key index, rather than a
+        # prefix comparison, so that the whole table isn't scanned.
+        indexed = {
+            path: (size, mtime_ns)
+            for path, size, mtime_ns in self._connection.execute(
+                "SELECT path, size, mtime_ns FROM headers WHERE path >= ? AND path < ?",
+                (directory_prefix, _prefix_successor(directory_prefix)),
+            )
+        }
+
+        rows = []
+        found = set()
+        for filepath in directory.glob(pattern):
+            path = str(filepath)
+            found.add(path)
+
+            stat = filepath.stat()
+            if indexed.get(path) == (stat.st_size, stat.st_mtime_ns):
+                continue
+
+            rows.append((path, stat.st_size, stat.st_mtime_ns, *_header_row(filepath)))
+
+        removed = [(path,) for path in set(indexed).difference(found)]
+
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO headers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._connection.executemany("DELETE FROM headers WHERE path = ?", removed)
+
+        return len(rows)
+
+    def query(
+        self,
+        machine: str = None,
+        start=None,
+        end=None,
+        field_label: str = None,
+        field_name: str = None,
+    ) -> "pd.DataFrame":
+        """Find the indexed TRF files that match the provided criteria.
+
+        Parameters
+        ----------
+        machine : str, optional
+            The machine ID as it appears within the TRF header.
+        start, end : datetime-like, optional
+            Only include files whose UTC header date is within
+            ``[start, end)``. Any value accepted by ``pd.Timestamp`` can
+            be provided. Timezone aware values are converted to UTC,
+            and naive values are taken to already be in UTC.
+        field_label : str, optional
+        field_name : str, optional
+
+        Returns
+        -------
+        pd.DataFrame
+            The path, UTC datetime and header fields of each matching
+            file, sorted by datetime.
+        """
+        conditions = ["error IS NULL"]
+        parameters = []
+
+        for column, value in [
+            ("machine", machine),
+            ("field_label", field_label),
+            ("field_name", field_name),
+        ]:
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                parameters.append(value)
+
+        if start is not None:
+            conditions.append("utc_datetime >= ?")
+            parameters.append(_format_datetime(pd.Timestamp(start)))
+
+        if end is not None:
+            conditions.append("utc_datetime < ?")
+            parameters.append(_format_datetime(pd.Timestamp(end)))
+
+        columns = ", ".join(["path"] + HEADER_COLUMNS)
+        sql = (
+            f"SELECT {columns} FROM headers WHERE {' AND '.join(conditions)} "
+            "ORDER BY utc_datetime, path"
+        )
+
+        results = pd.DataFrame(
+            self._connection.execute(sql, parameters).fetchall(),
+            columns=["path"] + HEADER_COLUMNS,
+        )
+        results["utc_datetime"] = pd.to_datetime(results["utc_datetime"])
+
+        return results
+
+    def errors(self) -> "pd.DataFrame":
+        """The indexed files whose header could not be decoded."""
+        return pd.DataFrame(
+            self._connection.execute(
+                "SELECT path, error FROM headers WHERE error IS NOT NULL ORDER BY path"
+            ).fetchall(),
+            columns=["path", "error"],
+        )
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def _header_row(filepath):
+    try:
+        header = decode_header_from_file(filepath)
+        utc_datetime = datetime.strptime(
+            header.date.replace("-", "/"), "%y/%m/%d %H:%M:%S Z"
+        )
+    except ValueError as e:
+        return (None,) * len(HEADER_COLUMNS) + (str(e),)
+
+    return (_format_datetime(utc_datetime), *header, None)
+
+
+def _prefix_successor(prefix: str) -> str:
+    """The smallest string greater than every string starting with
+    ``prefix``."""
+    return prefix[0:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _format_datetime(a_datetime):
+    if a_datetime.tzinfo is not None:
+        a_datetime = a_datetime.astimezone(timezone.utc)
+
+    return a_datetime.strftime("%Y-%m-%d %H:%M:%S")
@@ -23,11 +23,11 @@ from pymedphys._mosaiq import api as _msq_api
 from pymedphys._mosaiq import delivery as _delivery
 from pymedphys._trf.decode import header as _header
 
-# TODO Make the field identification run one whole day at a time, searching
-# for all logfiles on that day and then attempting to align the logfiles
-# to the full day's machine schedule.
-# This will allow for the code to be more flexible on time differences and
-# result in greater robustness to time differences between TCS and Mosaiq.
+# ``identify_logfile`` queries Mosaiq once for a single logfile. When
+# indexing an archive, each day's logfiles are instead identified
+# together against that day's machine schedule, see
+# ``get_mosaiq_delivery_candidates_for_day`` and
+# ``find_mosaiq_delivery_details`` within ``pymedphys._mosaiq.delivery``.
 
 
 def _date_convert_using_dateutil(date, timezone):
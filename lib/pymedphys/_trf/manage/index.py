@@ -16,7 +16,9 @@
 """Index logfiles.
 """
 
-import json
+import collections
+import concurrent.futures
+import contextlib
 import os
 import pathlib
 import traceback
@@ -25,12 +27,18 @@ from glob import glob
 from pymedphys._imports import attr
 
 import pymedphys._mosaiq.api as _pp_mosaiq
-from pymedphys._mosaiq.delivery import NoMosaiqEntries, get_mosaiq_delivery_details
+from pymedphys._mosaiq.delivery import (
+    NoMosaiqEntries,
+    find_mosaiq_delivery_details,
+    get_mosaiq_delivery_candidates_for_day,
+    get_mosaiq_delivery_details,
+)
 from pymedphys._trf.decode.header import Header, decode_header_from_file
-from pymedphys._utilities.filehash import hash_file
+from pymedphys._utilities.filehash import HashCache, hash_file
 from pymedphys._utilities.filesystem import make_a_valid_directory_name
 
 from .identify import date_convert
+from .index_store import open_logfile_index
 
 
 def create_logfile_directory_name(
@@ -92,9 +100,11 @@ def create_index_entry(
 # unnecessarily duplicated.
 
 
-def file_already_in_index(indexed_filepath, to_be_indexed_filepath, filehash):
+def file_already_in_index(
+    indexed_filepath, to_be_indexed_filepath, filehash, hash_cache=None
+):
     try:
-        new_hash = hash_file(indexed_filepath)
+        new_hash = hash_file(indexed_filepath, cache=hash_cache)
     except FileNotFoundError:
         raise FileNotFoundError(
             "Indexed logfile can't be found in its declared location."
@@ -145,31 +155,64 @@ def get_logfile_mosaiq_info(
     return attr.asdict(delivery_details)
 
 
-# TODO Split this function up into smaller functions for easier reuse.
-def file_ready_to_be_indexed(
-    connections,
-    filehash_list,
-    to_be_indexed_dict,
+def hash_and_read_headers(filepaths, hash_cache=None, max_workers=None):
+    """Hash and decode the header of each logfile using a pool of threads.
+
+    Returns
+    -------
+    results : list of tuple
+        A ``(filepath, filehash, header)`` tuple for each logfile. If the
+        header could not be decoded, the exception is given in place of
+        the header.
+    """
+
+    def hash_and_read_header(filepath):
+        filehash = hash_file(filepath, dot_feedback=True, cache=hash_cache)
+
+        try:
+            header = decode_header_from_file(filepath)
+        except Exception as e:  # pylint: disable = broad-except
+            header = e
+
+        return filepath, filehash, header
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(hash_and_read_header, filepaths))
+
+    print(" ")
+
+    return results
+
+
+def group_by_machine_and_day(
+    logfiles,
     unknown_error_in_logfile,
-    no_mosaiq_record_found,
     no_field_label_in_logfile,
-    indexed_directory,
-    index_filepath,
-    index,
     machine_map,
     centre_details,
     centre_server_map,
 ):
-    for filehash in filehash_list:
-        logfile_basename = os.path.basename(to_be_indexed_dict[filehash])
+    """Group the logfiles by the Mosaiq server, machine and local day
+    that they need to be identified against.
+
+    Logfiles that are not able to be identified are moved into either
+    the ``no_field_label_in_logfile`` or ``unknown_error_in_logfile``
+    directories.
+    """
+    groups = collections.defaultdict(list)
+
+    for filepath, filehash, header in logfiles:
+        logfile_basename = os.path.basename(filepath)
 
         try:
-            header = decode_header_from_file(to_be_indexed_dict[filehash])
+            if isinstance(header, Exception):
+                raise header
+
             print("\n{}".format(header))
             if header.field_label == "":
                 print("No field label in logfile")
                 new_filepath = os.path.join(no_field_label_in_logfile, logfile_basename)
-                rename_and_handle_fileexists(to_be_indexed_dict[filehash], new_filepath)
+                rename_and_handle_fileexists(filepath, new_filepath)
                 continue
 
             centre = machine_map[header.machine]["centre"]
@@ -178,25 +221,61 @@ def file_ready_to_be_indexed(
             mosaiq_string_time, path_string_time = date_convert(
                 header.date, centre_details[centre]["timezone"]
             )
-        except Exception as e:  # pylint: disable = broad-except
+        except Exception:  # pylint: disable = broad-except
             traceback.print_exc()
             new_filepath = os.path.join(unknown_error_in_logfile, logfile_basename)
-            rename_and_handle_fileexists(to_be_indexed_dict[filehash], new_filepath)
+            rename_and_handle_fileexists(filepath, new_filepath)
             continue
 
+        day = mosaiq_string_time[0:10]
+        groups[(server, header.machine, day)].append(
+            (filepath, filehash, header, centre, mosaiq_string_time, path_string_time)
+        )
+
+    return groups
+
+
+def index_machine_day(
+    connection,
+    machine,
+    day,
+    group,
+    no_mosaiq_record_found,
+    indexed_directory,
+    logfile_index,
+    buffer=240,
+):
+    """Identify all of the logfiles delivered on one machine within one
+    day using a single Mosaiq query, and then move them into the
+    indexed directory."""
+    candidates = get_mosaiq_delivery_candidates_for_day(
+        connection, machine, day, buffer=buffer
+    )
+
+    entries = {}
+    to_be_moved = []
+    for (
+        filepath,
+        filehash,
+        header,
+        centre,
+        mosaiq_string_time,
+        path_string_time,
+    ) in group:
+        logfile_basename = os.path.basename(filepath)
+
         try:
-            delivery_details = get_mosaiq_delivery_details(
-                connections[server],
-                header.machine,
+            delivery_details = find_mosaiq_delivery_details(
+                candidates,
                 mosaiq_string_time,
                 header.field_label,
                 header.field_name,
-                buffer=240,
+                buffer=buffer,
             )
         except NoMosaiqEntries as e:
             print(e)
             new_filepath = os.path.join(no_mosaiq_record_found, logfile_basename)
-            rename_and_handle_fileexists(to_be_indexed_dict[filehash], new_filepath)
+            rename_and_handle_fileexists(filepath, new_filepath)
             continue
 
         logfile_directory_name = create_logfile_directory_name(
@@ -211,31 +290,21 @@ def file_ready_to_be_indexed(
 
         new_filepath = os.path.join(logfile_directory_name, logfile_basename)
 
-        index[filehash] = create_index_entry(
+        entries[filehash] = create_index_entry(
             new_filepath, delivery_details, header, mosaiq_string_time
         )
 
         abs_new_filepath = os.path.abspath(
             os.path.join(indexed_directory, new_filepath)
         )
+        to_be_moved.append((filepath, abs_new_filepath))
 
-        index_extension_split = os.path.splitext(index_filepath)
-        temp_index_path = "{}_temp{}".format(
-            index_extension_split[0], index_extension_split[1]
-        )
+    logfile_index.add(entries)
 
-        with open(temp_index_path, "w") as json_data_file:
-            json.dump(index, json_data_file, indent=2)
+    for filepath, abs_new_filepath in to_be_moved:
+        os.rename(filepath, abs_new_filepath)
 
-        os.replace(temp_index_path, index_filepath)
-
-        os.rename(to_be_indexed_dict[filehash], abs_new_filepath)
-
-        print(
-            "Indexed logfile:\n    {} -->\n    {}".format(
-                to_be_indexed_dict[filehash], abs_new_filepath
-            )
-        )
+        print("Indexed logfile:\n    {} -->\n    {}".format(filepath, abs_new_filepath))
 
 
 def _separate_server_port_string(sql_server_and_port):
@@ -268,9 +337,25 @@ def _separate_server_port_string(sql_server_and_port):
     return server, port
 
 
-def index_logfiles(centre_map, machine_map, logfile_data_directory):
+def index_logfiles(
+    centre_map,
+    machine_map,
+    logfile_data_directory,
+    hash_cache_filepath=None,
+    max_workers=None,
+):
+    """Identify and move the logfiles within the ``to_be_indexed``
+    directory, recording them within the ``index.db`` logfile index.
+
+    The logfiles are hashed and their headers read concurrently, using
+    up to ``max_workers`` threads. They are then identified with one
+    Mosaiq query per machine and day, rather than one per logfile.
+
+    If ``hash_cache_filepath`` is provided, file hashes are stored
+    within a persistent ``HashCache`` at that path, so that unchanged
+    files are not re-read on subsequent runs.
+    """
     data_directory = logfile_data_directory
-    index_filepath = os.path.abspath(os.path.join(data_directory, "index.json"))
     to_be_indexed_directory = os.path.abspath(
         os.path.join(data_directory, "to_be_indexed")
     )
@@ -297,68 +382,76 @@ def index_logfiles(centre_map, machine_map, logfile_data_directory):
         for _, details in centre_details.items()
     ]
 
-    try:
-        with open(index_filepath, "r") as json_data_file:
-            index = json.load(json_data_file)
-    except FileNotFoundError:
-        index = {}
+    with contextlib.ExitStack() as stack:
+        logfile_index = stack.enter_context(open_logfile_index(data_directory))
 
-    indexset = set(index.keys())
-
-    print("\nConnecting to Mosaiq SQL servers...")
+        if hash_cache_filepath is None:
+            hash_cache = None
+        else:
+            hash_cache = stack.enter_context(HashCache(hash_cache_filepath))
 
-    connections = {
-        server_port: _pp_mosaiq.connect(*_separate_server_port_string(server_port))
-        for server_port in sql_server_and_ports
-    }
+        print("\nConnecting to Mosaiq SQL servers...")
 
-    print("Globbing index directory...")
-    to_be_indexed = glob(
-        os.path.join(to_be_indexed_directory, "**/*.trf"), recursive=True
-    )
+        connections = {
+            server_port: _pp_mosaiq.connect(*_separate_server_port_string(server_port))
+            for server_port in sql_server_and_ports
+        }
 
-    chunk_size = 50
-    number_to_be_indexed = len(to_be_indexed)
-    to_be_indexed_chunked = [
-        to_be_indexed[i : i + chunk_size]
-        for i in range(0, number_to_be_indexed, chunk_size)
-    ]
+        print("Globbing index directory...")
+        to_be_indexed = glob(
+            os.path.join(to_be_indexed_directory, "**/*.trf"), recursive=True
+        )
 
-    for i, a_to_be_indexed_chunk in enumerate(to_be_indexed_chunked):
         print(
-            "\nHashing a chunk of logfiles ({}/{})".format(
-                i + 1, len(to_be_indexed_chunked)
+            "\nHashing and reading the headers of {} logfiles".format(
+                len(to_be_indexed)
             )
         )
-        hashlist = [
-            hash_file(filename, dot_feedback=True) for filename in a_to_be_indexed_chunk
-        ]
-
-        print(" ")
-
-        to_be_indexed_dict = dict(zip(hashlist, a_to_be_indexed_chunk))
+        logfiles = hash_and_read_headers(
+            to_be_indexed, hash_cache=hash_cache, max_workers=max_workers
+        )
 
-        hashset = set(hashlist)
+        # Where two logfiles to be indexed are identical, only the last one
+        # found is indexed. The others are left in place.
+        to_be_indexed_dict = {
+            filehash: (filepath, filehash, header)
+            for filepath, filehash, header in logfiles
+        }
 
-        for filehash in list(hashset.intersection(indexset)):
+        already_indexed = [
+            filehash for filehash in to_be_indexed_dict if filehash in logfile_index
+        ]
+        for filehash in already_indexed:
             file_already_in_index(
-                os.path.join(indexed_directory, index[filehash]["filepath"]),
-                to_be_indexed_dict[filehash],
+                os.path.join(indexed_directory, logfile_index[filehash]["filepath"]),
+                to_be_indexed_dict.pop(filehash)[0],
                 filehash,
+                hash_cache=hash_cache,
             )
 
-        file_ready_to_be_indexed(
-            connections,
-            list(hashset.difference(indexset)),
-            to_be_indexed_dict,
+        groups = group_by_machine_and_day(
+            to_be_indexed_dict.values(),
             unknown_error_in_logfile,
-            no_mosaiq_record_found,
             no_field_label_in_logfile,
-            indexed_directory,
-            index_filepath,
-            index,
             machine_map,
             centre_details,
             centre_server_map,
         )
+
+        for i, ((server, machine, day), group) in enumerate(sorted(groups.items())):
+            print(
+                "\nIndexing {} logfiles from {} on {} ({}/{})".format(
+                    len(group), machine, day, i + 1, len(groups)
+                )
+            )
+            index_machine_day(
+                connections[server],
+                machine,
+                day,
+                group,
+                no_mosaiq_record_found,
+                indexed_directory,
+                logfile_index,
+            )
+
     print("Complete")
@@ -0,0 +1,285 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""A SQLite store of the logfile index.
+"""
+
+import json
+import os
+import sqlite3
+from typing import TYPE_CHECKING, Dict, Iterable
+
+if TYPE_CHECKING:
+    import zipfile
+
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS logfiles (
+        filehash TEXT PRIMARY KEY,
+        filepath TEXT NOT NULL,
+        machine TEXT,
+        local_time TEXT,
+        patient_id TEXT,
+        field_label TEXT,
+        field_name TEXT,
+        entry TEXT NOT NULL
+    )
+"""
+
+CREATE_ZIP_MEMBERS_TABLE = """
+    CREATE TABLE IF NOT EXISTS extracted_zip_members (
+        filename TEXT NOT NULL,
+        crc32 INTEGER NOT NULL,
+        file_size INTEGER NOT NULL,
+        PRIMARY KEY (filename, crc32, file_size)
+    )
+"""
+
+CREATE_INDICES = [
+    "CREATE INDEX IF NOT EXISTS logfiles_machine_time ON logfiles (machine, local_time)",
+    "CREATE INDEX IF NOT EXISTS logfiles_time ON logfiles (local_time)",
+    "CREATE INDEX IF NOT EXISTS logfiles_patient_id ON logfiles (patient_id)",
+]
+
+
+class LogfileIndex:
+    """The index of identified logfiles, stored within SQLite.
+
+    Each entry has the same form as those previously stored within
+    ``index.json``, keyed by the logfile's hash. The entries are indexed
+    by machine, local delivery time and patient ID so that they are
+    able to be queried without loading the whole index.
+
+    Parameters
+    ----------
+    database_path : os.PathLike
+        The SQLite database to store the index within. It is created if
+        it does not yet exist.
+    """
+
+    def __init__(self, database_path):
+        self._connection = sqlite3.connect(str(database_path))
+
+        with self._connection:
+            self._connection.execute(CREATE_TABLE)
+            self._connection.execute(CREATE_ZIP_MEMBERS_TABLE)
+            for create_index in CREATE_INDICES:
+                self._connection.execute(create_index)
+
+    def __contains__(self, filehash):
+        return (
+            self._connection.execute(
+                "SELECT 1 FROM logfiles WHERE filehash = ?", (filehash,)
+            ).fetchone()
+            is not None
+        )
+
+    def __getitem__(self, filehash) -> Dict:
+        row = self._connection.execute(
+            "SELECT entry FROM logfiles WHERE filehash = ?", (filehash,)
+        ).fetchone()
+
+        if row is None:
+            raise KeyError(filehash)
+
+        return json.loads(row[0])
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM logfiles").fetchone()[0]
+
+    def add(self, entries: Dict[str, Dict]):
+        """Add, or replace, a batch of entries within a single
+        transaction.
+
+        Parameters
+        ----------
+        entries : dict
+            Index entries, as created by ``create_index_entry``, keyed
+            by the logfile's hash.
+        """
+        rows = [_entry_to_row(filehash, entry) for filehash, entry in entries.items()]
+
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO logfiles VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+
+    def query(
+        self,
+        machine: str = None,
+        patient_id: str = None,
+        start: str = None,
+        end: str = None,
+        field_label: str = None,
+        field_name: str = None,
+    ) -> Dict[str, Dict]:
+        """Find the index entries that match all of the provided criteria.
+
+        Parameters
+        ----------
+        machine : str, optional
+        patient_id : str, optional
+        start, end : str, optional
+            Only include deliveries whose Mosaiq local time is within
+            ``[start, end)``. Given in the form
+            ``'YYYY-MM-DD HH:MM:SS'``, or any prefix of it such as
+            ``'YYYY-MM-DD'``.
+        field_label : str, optional
+        field_name : str, optional
+
+        Returns
+        -------
+        entries : dict
+            The matching entries, keyed by the logfile's hash, in order
+            of delivery time.
+        """
+        conditions = []
+        parameters = []
+
+        for column, value in [
+            ("machine", machine),
+            ("patient_id", patient_id),
+            ("field_label", field_label),
+            ("field_name", field_name),
+        ]:
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                parameters.append(value)
+
+        if start is not None:
+            conditions.append("local_time >= ?")
+            parameters.append(start)
+
+        if end is not None:
+            conditions.append("local_time < ?")
+            parameters.append(end)
+
+        sql = "SELECT filehash, entry FROM logfiles"
+        if conditions:
+            sql += f" WHERE {' AND '.join(conditions)}"
+        sql += " ORDER BY local_time, filehash"
+
+        return {
+            filehash: json.loads(entry)
+            for filehash, entry in self._connection.execute(sql, parameters)
+        }
+
+    def new_zip_members(self, zip_infos: Iterable["zipfile.ZipInfo"]):
+        """The members of a diagnostics zip that have not previously
+        been extracted for indexing.
+
+        Members are compared using only the details within the zip's
+        central directory, their filename, CRC-32 and size, so that this
+        does not require them to be decompressed.
+        """
+        return [
+            zip_info
+            for zip_info in zip_infos
+            if self._connection.execute(
+                "SELECT 1 FROM extracted_zip_members "
+                "WHERE filename = ? AND crc32 = ? AND file_size = ?",
+                _zip_member_key(zip_info),
+            ).fetchone()
+            is None
+        ]
+
+    def add_zip_members(self, zip_infos: Iterable["zipfile.ZipInfo"]):
+        """Record that these zip members have been extracted for
+        indexing."""
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO extracted_zip_members VALUES (?, ?, ?)",
+                [_zip_member_key(zip_info) for zip_info in zip_infos],
+            )
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def open_logfile_index(data_directory) -> LogfileIndex:
+    """Open the logfile index within a logfile data directory.
+
+    If the directory still has an ``index.json`` from before the index
+    was stored within SQLite, its entries are migrated into
+    ``index.db`` and it is renamed to ``index.json.migrated``.
+    """
+    json_index_filepath = os.path.join(data_directory, "index.json")
+    database_path = os.path.join(data_directory, "index.db")
+    logfile_index = LogfileIndex(database_path)
+
+    if os.path.exists(json_index_filepath):
+        print(
+            f"Migrating {json_index_filepath} into {database_path}. Once "
+            "migrated, index.json is renamed to index.json.migrated..."
+        )
+        migrate_json_index(json_index_filepath, logfile_index)
+        os.replace(json_index_filepath, f"{json_index_filepath}.migrated")
+
+    return logfile_index
+
+
+def migrate_json_index(json_index_filepath, logfile_index: LogfileIndex):
+    """Add the entries of a legacy ``index.json`` to the logfile index.
+
+    Entries missing any of the fields that the index is queried by are
+    skipped and reported.
+    """
+    with open(json_index_filepath, "r") as json_data_file:
+        index = json.load(json_data_file)
+
+    entries = {}
+    skipped = []
+    for filehash, entry in index.items():
+        try:
+            _entry_to_row(filehash, entry)
+        except (KeyError, TypeError) as e:
+            skipped.append((filehash, e))
+            continue
+
+        entries[filehash] = entry
+
+    logfile_index.add(entries)
+
+    if skipped:
+        print(
+            f"Skipped {len(skipped)} of the {len(index)} entries within "
+            f"{json_index_filepath} as they were incomplete:"
+        )
+        for filehash, e in skipped:
+            print(f"    {filehash}: {type(e).__name__} {e}")
+
+
+def _zip_member_key(zip_info: "zipfile.ZipInfo"):
+    return (zip_info.filename, zip_info.CRC, zip_info.file_size)
+
+
+def _entry_to_row(filehash, entry: Dict) -> Iterable:
+    header = entry["logfile_header"]
+
+    return (
+        filehash,
+        entry["filepath"],
+        header["machine"],
+        entry["local_time"],
+        str(entry["delivery_details"]["patient_id"]),
+        header["field_label"],
+        header["field_name"],
+        json.dumps(entry),
+    )
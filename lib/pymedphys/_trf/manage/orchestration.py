@@ -74,7 +74,12 @@ def orchestration(config):
     extract_diagnostic_zips_and_archive(logfile_data_directory)
 
     print("Indexing logfiles...")
-    index_logfiles(mosaiq_sql, linac_details, logfile_data_directory)
+    index_logfiles(
+        mosaiq_sql,
+        linac_details,
+        logfile_data_directory,
+        hash_cache_filepath=logfile_data_directory.joinpath("filehash_cache.db"),
+    )
 
 
 def orchestration_cli(_):
@@ -13,8 +13,11 @@
 # limitations under the License.
 
 
-import json
 import os
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pymedphys._trf.manage.index_store import LogfileIndex
 
 
 def get_gantry_tolerance(index, file_hash, config):
@@ -50,12 +53,17 @@ def get_metersetmap_parameters(config):
     return grid_resolution, ram_fraction
 
 
-def get_index(config):
-    index_filepath = os.path.join(get_data_directory(config), "index.json")
-    with open(index_filepath) as json_data_file:
-        index = json.load(json_data_file)
+def get_index(config) -> "LogfileIndex":
+    """Open the logfile index of the configured data directory.
+
+    The returned index supports lookup by file hash in the same way as
+    the dictionary previously loaded from ``index.json``, and should be
+    closed once it is no longer needed.
+    """
+    # pylint: disable = import-outside-toplevel
+    from pymedphys._trf.manage.index_store import open_logfile_index
 
-    return index
+    return open_logfile_index(get_data_directory(config))
 
 
 def get_centre(config, file_info):
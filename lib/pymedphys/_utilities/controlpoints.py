@@ -48,9 +48,122 @@ def remove_irrelevant_control_points(monitor_units, *args):
     return result
 
 
+def _is_segment_within_tolerance(
+    trajectories, tolerances, positions, by_index, start, end
+):
+    index_fraction = np.linspace(0, 1, end - start + 1)[1:-1, None]
+
+    position_change = positions[end] - positions[start]
+    if position_change == 0:
+        fraction = index_fraction
+    else:
+        position_fraction = (
+            positions[start + 1 : end, None] - positions[start]
+        ) / position_change
+        fraction = np.where(by_index, index_fraction, position_fraction)
+
+    interpolated = trajectories[start] + fraction * (
+        trajectories[end] - trajectories[start]
+    )
+
+    return np.all(np.abs(interpolated - trajectories[start + 1 : end]) <= tolerances)
+
+
+def find_control_points_within_tolerance(
+    trajectories, tolerances, positions=None, by_index=None
+):
+    """Returns the control points needed to reproduce the provided
+    trajectories within tolerance by linear interpolation.
+
+    Segments are grown greedily from each retained control point, first
+    doubling their length and then bisecting, so that every dropped
+    control point is verified against the segment that replaces it.
+
+    Parameters
+    ----------
+    trajectories : np.ndarray
+        A 2D array with one row per control point and one column per
+        trajectory.
+    tolerances : np.ndarray
+        The maximum allowed interpolation error for each trajectory
+        column.
+    positions : np.ndarray, optional
+        The value that the trajectories are interpolated against at
+        each control point, such as the cumulative MU. Defaults to the
+        control point index. Segments over which it doesn't change,
+        such as beam-off moves, are interpolated by control point index.
+    by_index : np.ndarray, optional
+        A boolean for each trajectory column, true for those that are
+        always interpolated by control point index.
+
+    Returns
+    -------
+    relevant_control_points : np.ndarray
+        A boolean mask of the control points to keep.
+    """
+    trajectories = np.asarray(trajectories, dtype=float)
+    tolerances = np.asarray(tolerances, dtype=float)
+    if positions is None:
+        positions = np.arange(len(trajectories))
+    positions = np.asarray(positions, dtype=float)
+    if by_index is None:
+        by_index = np.zeros(trajectories.shape[1], dtype=bool)
+    by_index = np.asarray(by_index, dtype=bool)
+
+    number_of_control_points = len(trajectories)
+    relevant_control_points = np.zeros(number_of_control_points, dtype=bool)
+    if number_of_control_points == 0:
+        return relevant_control_points
+
+    last = number_of_control_points - 1
+    relevant_control_points[0] = True
+    relevant_control_points[last] = True
+
+    start = 0
+    while start < last:
+        valid = start + 1
+        step = 2
+        while start + step <= last and _is_segment_within_tolerance(
+            trajectories, tolerances, positions, by_index, start, start + step
+        ):
+            valid = start + step
+            step *= 2
+
+        invalid = min(start + step, last + 1)
+        while invalid - valid > 1:
+            middle = (valid + invalid) // 2
+            if _is_segment_within_tolerance(
+                trajectories, tolerances, positions, by_index, start, middle
+            ):
+                valid = middle
+            else:
+                invalid = middle
+
+        relevant_control_points[valid] = True
+        start = valid
+
+    return relevant_control_points
+
+
 def to_tuple(a):
+    if isinstance(a, np.ndarray) and a.ndim > 0:
+        return _ndarray_to_tuple(a)
+
     # https://stackoverflow.com/a/10016613/3912576
     try:
         return tuple(to_tuple(i) for i in a)
     except TypeError:
         return a
+
+
+def _ndarray_to_tuple(a):
+    # Iterating over the array directly, rather than recursing down to
+    # each scalar and catching the resulting TypeError, is several times
+    # faster for large arrays such as the MLC positions of a logfile.
+    if a.ndim == 1:
+        return tuple(a)
+
+    if a.ndim == 2:
+        return tuple(map(tuple, a))
+
+    return tuple(_ndarray_to_tuple(item) for item in a)
@@ -17,4 +17,5 @@
 """
 
 
+from .cache import HashCache
 from .core import hash_file
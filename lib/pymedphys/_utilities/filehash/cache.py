@@ -0,0 +1,113 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A persistent cache of file hashes.
+"""
+
+import os
+import sqlite3
+import threading
+
+from .core import hash_file
+
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS filehashes (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        inode INTEGER NOT NULL,
+        digest TEXT NOT NULL
+    )
+"""
+
+COMMIT_EVERY = 100
+
+
+class HashCache:
+    """A persistent SQLite cache of ``hash_file`` results.
+
+    A stored digest is only reused when the file's absolute path, size,
+    modification time and inode all match those recorded when it was
+    hashed. Otherwise the file is re-hashed and the record replaced.
+
+    A single cache may be shared between threads. Files are hashed
+    outside of the database lock, so they are able to be hashed
+    concurrently.
+
+    Parameters
+    ----------
+    database_path : os.PathLike
+        The SQLite database to store the cache within. It is created if
+        it does not yet exist.
+    """
+
+    def __init__(self, database_path):
+        self._connection = sqlite3.connect(str(database_path), check_same_thread=False)
+        self._lock = threading.Lock()
+        self._number_uncommitted = 0
+
+        with self._connection:
+            self._connection.execute(CREATE_TABLE)
+
+    def hash_file(self, filename, dot_feedback=False):
+        """The same as ``hash_file``, but reusing the cached digest of
+        unchanged files."""
+        path = os.path.abspath(filename)
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+        with self._lock:
+            cached = self._connection.execute(
+                "SELECT digest FROM filehashes "
+                "WHERE path = ? AND size = ? AND mtime_ns = ? AND inode = ?",
+                key,
+            ).fetchone()
+
+        if cached is not None:
+            if dot_feedback:
+                print(".", end="", flush=True)
+
+            return cached[0]
+
+        digest = hash_file(path, dot_feedback=dot_feedback)
+
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO filehashes VALUES (?, ?, ?, ?, ?)",
+                (*key, digest),
+            )
+            self._number_uncommitted += 1
+            if self._number_uncommitted >= COMMIT_EVERY:
+                self._commit()
+
+        return digest
+
+    def commit(self):
+        with self._lock:
+            self._commit()
+
+    def close(self):
+        with self._lock:
+            self._commit()
+            self._connection.close()
+
+    def _commit(self):
+        self._connection.commit()
+        self._number_uncommitted = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
@@ -18,7 +18,16 @@
 import hashlib
 
 
-def hash_file(filename, dot_feedback=False):
+def hash_file(filename, dot_feedback=False, cache=None):
+    """The SHA-1 hex digest of a file's contents.
+
+    If a ``HashCache`` is provided as ``cache``, the digest stored
+    within it is returned for files that have not changed since they
+    were last hashed.
+    """
+    if cache is not None:
+        return cache.hash_file(filename, dot_feedback=dot_feedback)
+
     BLOCKSIZE = 65536
     hasher = hashlib.sha1()
     with open(filename, "rb") as afile:
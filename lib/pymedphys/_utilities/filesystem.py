@@ -55,8 +55,8 @@ def get_detached_file_descriptor(filepath):
 def open_no_lock(filepath, *args, **kwargs):
     file_descriptor = get_detached_file_descriptor(filepath)
 
+    a_file = open(file_descriptor, *args, **kwargs)
     try:
-        a_file = open(file_descriptor, *args, **kwargs)
         yield a_file
     finally:
         a_file.close()
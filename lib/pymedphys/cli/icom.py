@@ -12,7 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import pymedphys._icom.convert
 import pymedphys._icom.listener
+import pymedphys._icom.multilistener
+import pymedphys._icom.replay
 
 
 def icom_cli(subparsers):
@@ -22,6 +25,9 @@ def icom_cli(subparsers):
     icom_subparsers = icom_parser.add_subparsers(dest="icom")
 
     icom_listen(icom_subparsers)
+    icom_convert(icom_subparsers)
+    icom_replay(icom_subparsers)
+    icom_benchmark(icom_subparsers)
 
     return icom_parser
 
@@ -35,15 +41,157 @@ def icom_listen(icom_subparsers):
             "these records will be indexed by Patient ID and name. "
             "Anytime MV radiation is not delivered, these records are "
             "discarded. "
+            "Multiple Linacs can be listened to at once. "
             "WARNING: This listener is susceptible to the bug "
             "documented at <https://github.com/pymedphys/pymedphys/issues/849>."
         ),
     )
 
-    parser.add_argument("ip", help="The IP address of the Linac.")
+    parser.add_argument("ip", nargs="+", help="The IP address of each Linac.")
     parser.add_argument(
         "directory", help="The output directory to store the iCom records."
     )
+    parser.add_argument(
+        "--live-storage",
+        choices=["files", "segments"],
+        default="files",
+        help=(
+            "How to store every received record. Either as one file per "
+            "record counter, or appended to compressed hourly segments."
+        ),
+    )
+    parser.set_defaults(
+        func=pymedphys._icom.multilistener.listen_cli  # pylint: disable = protected-access
+    )
+
+
+def icom_convert(icom_subparsers):
+    parser = icom_subparsers.add_parser(
+        "convert",
+        help=(
+            "Converts a directory tree of iCom patient archives (``.xz``) "
+            "into saved deliveries (``.npz``) using a pool of processes. "
+            "Archives that fail to convert are reported at the end."
+        ),
+    )
+
+    parser.add_argument(
+        "input_directory",
+        type=str,
+        help="The directory to recursively search for ``.xz`` archives.",
+    )
+    parser.add_argument(
+        "output_directory",
+        type=str,
+        help=(
+            "The directory to write the ``.npz`` deliveries to. The input "
+            "directory structure is mirrored. Files that are already up "
+            "to date are skipped."
+        ),
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=None,
+        help="The number of worker processes. Defaults to the number of CPUs.",
+    )
+
+    parser.set_defaults(
+        func=pymedphys._icom.convert.icom2npz_cli  # pylint: disable = protected-access
+    )
+
+
+def icom_replay(icom_subparsers):
+    parser = icom_subparsers.add_parser(
+        "replay",
+        help=(
+            "Serve the timesteps of iCom archives over TCP in the place of "
+            "Linacs, so that a listener can be tested without one. Each "
+            "archive is served from its own port of 127.0.0.1, starting at "
+            "``--port``."
+        ),
+    )
+
+    parser.add_argument(
+        "archives", nargs="+", help="An iCom archive (``.xz``) for each Linac."
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=pymedphys._icom.listener.ICOM_PORT,  # pylint: disable = protected-access
+        help="The port of the first archive, by default the iCom port.",
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1,
+        help="The multiple of real time to replay at. Use ``inf`` for no limit.",
+    )
+    parser.add_argument(
+        "--repeat",
+        action="store_true",
+        help="Restart from the first timestep once the archive is exhausted.",
+    )
+    _add_fault_arguments(parser)
+
+    parser.set_defaults(
+        func=pymedphys._icom.replay.replay_cli  # pylint: disable = protected-access
+    )
+
+
+def icom_benchmark(icom_subparsers):
+    parser = icom_subparsers.add_parser(
+        "benchmark",
+        help=(
+            "Replay synthetic iCom streams to the listener and report its "
+            "throughput, latency and peak memory."
+        ),
+    )
+
+    parser.add_argument(
+        "--linacs", type=int, default=4, help="The number of simulated Linacs."
+    )
+    parser.add_argument(
+        "--frames", type=int, default=2000, help="The timesteps sent per Linac."
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=float("inf"),
+        help="The multiple of real time to replay at. By default no limit.",
+    )
+    parser.add_argument(
+        "--no-trace-memory",
+        dest="trace_memory",
+        action="store_false",
+        help="Don't trace memory, which otherwise slows the listener.",
+    )
+    _add_fault_arguments(parser)
+
     parser.set_defaults(
-        func=pymedphys._icom.listener.listen_cli  # pylint: disable = protected-access
+        func=pymedphys._icom.replay.benchmark_cli  # pylint: disable = protected-access
+    )
+
+
+def _add_fault_arguments(parser):
+    parser.add_argument(
+        "--disconnect",
+        type=float,
+        default=0,
+        help="The probability of disconnecting after each timestep.",
+    )
+    parser.add_argument(
+        "--partial-frame",
+        type=float,
+        default=0,
+        help=(
+            "The probability of sending only part of a timestep and then "
+            "disconnecting."
+        ),
+    )
+    parser.add_argument(
+        "--split-frame",
+        type=float,
+        default=0,
+        help="The probability of sending a timestep in two separate writes.",
     )
@@ -19,6 +19,7 @@
 
 from pymedphys._trf.decode.detect import detect_cli
 from pymedphys._trf.decode.trf2csv import trf2csv_cli
+from pymedphys._trf.decode.trf2parquet import trf2parquet_cli
 from pymedphys._trf.manage.orchestration import orchestration_cli
 
 
@@ -29,6 +30,7 @@ def trf_cli(subparsers):
     )
     trf_subparsers = trf_parser.add_subparsers(dest="trf")
     trf_to_csv(trf_subparsers)
+    trf_convert(trf_subparsers)
     trf_detect(trf_subparsers)
     trf_orchestration(trf_subparsers)
 
@@ -55,6 +57,39 @@ def trf_to_csv(trf_subparsers):
     parser.set_defaults(func=trf2csv_cli)
 
 
+def trf_convert(trf_subparsers):
+    parser = trf_subparsers.add_parser(
+        "convert",
+        help=(
+            "Converts a directory tree of ``.trf`` files into compact "
+            "``.parquet`` files using a pool of processes."
+        ),
+    )
+
+    parser.add_argument(
+        "input_directory",
+        type=str,
+        help="The directory to recursively search for ``.trf`` files.",
+    )
+    parser.add_argument(
+        "output_directory",
+        type=str,
+        help=(
+            "The directory to write the ``.parquet`` files to. The input "
+            "directory structure is mirrored. Files that are already up "
+            "to date are skipped."
+        ),
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=None,
+        help="The number of worker processes. Defaults to the number of CPUs.",
+    )
+
+    parser.set_defaults(func=trf2parquet_cli)
+
+
 def trf_detect(trf_subparsers):
     parser = trf_subparsers.add_parser(
         "detect", help="Attempts to detect trf encoding method."
@@ -0,0 +1,99 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from pymedphys._imports import numpy as np
+
+from pymedphys import Delivery
+from pymedphys._base import cache
+
+# pylint: disable = protected-access
+
+
+def _create_delivery(number_of_control_points=5):
+    mu = np.linspace(0, 10, number_of_control_points)
+    gantry = np.linspace(-180, 180, number_of_control_points)
+    collimator = np.zeros(number_of_control_points)
+    mlc = np.random.uniform(-20, 20, size=(number_of_control_points, 80, 2))
+    jaw = np.ones((number_of_control_points, 2)) * 50
+
+    return Delivery(mu, gantry, collimator, mlc, jaw)
+
+
+def test_save_load_round_trip(tmp_path):
+    delivery = _create_delivery()
+    filepath = tmp_path.joinpath("delivery.npz")
+
+    delivery.save(filepath)
+    loaded = Delivery.load(filepath)
+
+    assert isinstance(loaded, Delivery)
+    assert loaded == delivery
+
+    empty = Delivery._empty()
+    empty.save(filepath)
+    assert Delivery.load(filepath) == empty
+
+
+def test_cache_only_creates_once(tmp_path):
+    source = tmp_path.joinpath("source.trf")
+    source.write_bytes(b"some logfile contents")
+
+    calls = []
+
+    def create():
+        calls.append(None)
+        return _create_delivery()
+
+    Delivery.enable_cache(tmp_path.joinpath("cache"))
+    try:
+        first = cache.retrieve_or_create(Delivery, "trf", source, create)
+        second = cache.retrieve_or_create(Delivery, "trf", source, create)
+
+        assert len(calls) == 1
+        assert first == second
+
+        source.write_bytes(b"different logfile contents")
+        cache.retrieve_or_create(Delivery, "trf", source, create)
+        assert len(calls) == 2
+    finally:
+        Delivery.disable_cache()
+
+    cache.retrieve_or_create(Delivery, "trf", source, create)
+    assert len(calls) == 3
+
+
+def test_unreadable_cache_entries_are_recreated(tmp_path):
+    source = tmp_path.joinpath("source.trf")
+    source.write_bytes(b"some logfile contents")
+    delivery = _create_delivery()
+
+    Delivery.enable_cache(tmp_path.joinpath("cache"))
+    try:
+        cache.retrieve_or_create(Delivery, "trf", source, lambda: delivery)
+
+        filepath = cache.cache_filepath("trf", source)
+        contents = filepath.read_bytes()
+
+        for corrupted in [contents[0 : len(contents) // 2], b"not a zip file", b""]:
+            filepath.write_bytes(corrupted)
+            assert (
+                cache.retrieve_or_create(Delivery, "trf", source, lambda: delivery)
+                == delivery
+            )
+            assert Delivery.load(filepath) == delivery
+
+        assert [path.name for path in filepath.parent.iterdir()] == [filepath.name]
+    finally:
+        Delivery.disable_cache()
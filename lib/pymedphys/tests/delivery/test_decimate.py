@@ -0,0 +1,133 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from pymedphys._imports import numpy as np
+
+from pymedphys import Delivery
+
+# pylint: disable = protected-access
+
+
+def _sampled_delivery():
+    time = np.arange(0, 60, 0.04)
+    breakpoints = [0, 10, 25, 40, 60]
+
+    # The beam is off for the first 10 seconds, and then the dose rate
+    # ramps up while the leaves move quickly.
+    mu = np.interp(time, breakpoints, [0, 0, 2, 80, 100])
+    ramping = (time > 10) & (time < 25)
+    mu[ramping] = 2 * ((time[ramping] - 10) / 15) ** 2
+    gantry = np.interp(time, breakpoints, [-180, -180, 0, 90, 180])
+    collimator = np.interp(time, breakpoints, [0, 0, 10, 10, -5])
+
+    leaf_positions = np.interp(time, breakpoints, [0, 20, -10, 5, 5])
+    mlc = np.tile(leaf_positions[:, None, None], (1, 80, 2))
+    mlc[:, 40:, :] += np.sin(time / 10)[:, None, None]
+
+    jaw = np.tile(np.interp(time, breakpoints, [50, 50, 20, 20, 60])[:, None], (1, 2))
+
+    return time, Delivery(mu, gantry, collimator, mlc, jaw)
+
+
+def _mechanical_trajectories(delivery):
+    number_of_control_points = len(delivery.mu)
+
+    return np.concatenate(
+        [
+            np.array(delivery.gantry)[:, None],
+            np.array(delivery.collimator)[:, None],
+            np.array(delivery.mlc).reshape(number_of_control_points, -1),
+            np.array(delivery.jaw).reshape(number_of_control_points, -1),
+        ],
+        axis=1,
+    )
+
+
+def _decimate(delivery):
+    decimated = delivery.decimate(
+        tolerance_mm=0.1, tolerance_mu=0.01, tolerance_deg=0.1
+    )
+
+    assert len(decimated.mu) < len(delivery.mu) / 10
+    assert decimated.mu[0] == delivery.mu[0]
+    assert decimated.mu[-1] == delivery.mu[-1]
+
+    return decimated
+
+
+def test_decimate_is_within_tolerance_when_interpolated_by_mu():
+    _, delivery = _sampled_delivery()
+    decimated = _decimate(delivery)
+
+    original = _mechanical_trajectories(delivery)
+    retained = _mechanical_trajectories(decimated)
+
+    # Interpolating by MU is ambiguous at the MU of a beam-off move.
+    mu = np.array(delivery.mu)
+    retained_mu = np.array(decimated.mu)
+    beam_off_mu = retained_mu[1:][np.diff(retained_mu) == 0]
+    beam_on = ~np.isin(mu, beam_off_mu)
+    assert np.sum(beam_on) > len(mu) / 2
+
+    for original_column, retained_column in zip(original.T, retained.T):
+        reconstructed = np.interp(mu[beam_on], retained_mu, retained_column)
+        assert np.all(np.abs(reconstructed - original_column[beam_on]) <= 0.1 + 1e-9)
+
+
+def test_decimated_mu_is_within_tolerance_by_control_point():
+    _, delivery = _sampled_delivery()
+    decimated = _decimate(delivery)
+
+    original = np.concatenate(
+        [np.array(delivery.mu)[:, None], _mechanical_trajectories(delivery)], axis=1
+    )
+    retained = np.concatenate(
+        [np.array(decimated.mu)[:, None], _mechanical_trajectories(decimated)], axis=1
+    )
+    retained_indices = [
+        np.where(np.all(original == row, axis=1))[0][0] for row in retained
+    ]
+
+    reconstructed = np.interp(np.arange(len(original)), retained_indices, decimated.mu)
+    assert np.all(np.abs(reconstructed - delivery.mu) <= 0.01 + 1e-9)
+
+
+def test_decimate_keeps_beam_off_moves():
+    _, delivery = _sampled_delivery()
+    decimated = _decimate(delivery)
+
+    beam_off = np.array(delivery.mu) == 0
+    original = _mechanical_trajectories(delivery)[beam_off]
+    retained = _mechanical_trajectories(decimated)[np.array(decimated.mu) == 0]
+
+    retained_indices = [
+        np.where(np.all(original == row, axis=1))[0][0] for row in retained
+    ]
+    assert retained_indices[0] == 0
+    assert retained_indices[-1] == len(original) - 1
+
+    all_indices = np.arange(len(original))
+    for original_column, retained_column in zip(original.T, retained.T):
+        reconstructed = np.interp(all_indices, retained_indices, retained_column)
+        assert np.all(np.abs(reconstructed - original_column) <= 0.1 + 1e-9)
+
+
+def test_decimate_short_deliveries():
+    empty = Delivery._empty()
+    assert empty.decimate() == empty
+
+    _, delivery = _sampled_delivery()
+    two_control_points = delivery._strip_delivery_data(len(delivery.mu) - 1)
+    assert two_control_points.decimate() == two_control_points
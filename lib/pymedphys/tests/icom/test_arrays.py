@@ -0,0 +1,77 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import datetime
+
+from pymedphys._imports import numpy as np
+
+from pymedphys._icom import arrays, delivery, extract, mappings, synthetic
+
+
+def _per_frame_delivery(icom_stream):
+    items = [
+        delivery.get_delivery_data_items_from_frame(frame)
+        for frame in extract.tokenise_stream(icom_stream)
+    ]
+    return [np.array([item[i] for item in items]) for i in range(5)]
+
+
+def test_parse_decimals():
+    values = [b"0.00", b"-179.90", b"12", b"-.5", b"5.", b"1.2.3", b"-", b"1e5", b""]
+    data = np.frombuffer(b"\n".join(values) + b"\n", dtype=np.uint8)
+    lengths = np.array([len(value) for value in values])
+    starts = np.concatenate([[0], np.cumsum(lengths + 1)[:-1]])
+
+    parsed, is_valid = arrays.parse_decimals(data, starts, lengths)
+
+    assert is_valid.tolist() == [True] * 5 + [False] * 4
+    assert parsed[is_valid].tolist() == [float(value) for value in values[0:5]]
+
+    _, is_valid = arrays.parse_decimals(data, starts, lengths, require_point=True)
+    assert is_valid.tolist() == [True, True] + [False] * 7
+
+
+def test_delivery_items_from_stream():
+    frames = synthetic.create_frames(30, seed=2)
+
+    frames[3] = synthetic.encode_frame(
+        datetime.datetime(2021, 1, 1, 8, 0, 0),
+        3,
+        {"Delivery MU": "1.5", "Gantry": "12", "Collimator": "-.5"},
+        {"MLCX": np.linspace(-2, 2, 160), "ASYMY": [1.5, -0.5]},
+    )
+
+    # A gantry length that disagrees with its value
+    gantry_key = mappings.ICOM["Gantry"][0]
+    length_offset = frames[5].index(b"0" + gantry_key) + 7
+    frames[5] = (
+        frames[5][0:length_offset]
+        + bytes([frames[5][length_offset] + 1])
+        + frames[5][length_offset + 1 : :]
+    )
+
+    icom_stream = b"".join(frames)
+
+    spans, _, is_regular = arrays.delivery_items_from_stream(icom_stream)
+    assert spans == [
+        (max(start, 0), end) for start, end in extract.get_data_point_spans(icom_stream)
+    ]
+    assert np.flatnonzero(~is_regular).tolist() == [5]
+
+    vectorised = delivery.delivery_from_icom_stream(icom_stream)
+    per_frame = _per_frame_delivery(icom_stream)
+
+    for vectorised_item, per_frame_item in zip(vectorised[1::], per_frame[1::]):
+        assert np.array_equal(vectorised_item, per_frame_item)
@@ -0,0 +1,47 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import lzma
+
+from pymedphys._imports import numpy as np
+
+import pymedphys
+from pymedphys._icom import columns, synthetic
+from pymedphys._trf.decode.synthetic import create_synthetic_delivery
+
+
+def test_load_icom_columns(tmp_path):
+    delivery = create_synthetic_delivery(number_of_rows=20, seed=1)
+    icom_stream = synthetic.create_icom_stream(delivery, machine_id="2619")
+
+    archive = tmp_path.joinpath("20210101_080000.xz")
+    with lzma.open(archive, "w") as f:
+        f.write(icom_stream)
+
+    built = columns.load_icom_columns(archive)
+    assert columns.get_columns_filepath(archive).exists()
+
+    reference = pymedphys.Delivery.from_icom(icom_stream)
+    assert np.allclose(built["meterset"], reference.monitor_units)
+    assert np.allclose(built["gantry"], reference.gantry)
+    assert np.allclose(built["mlc"], reference.mlc)
+    assert np.allclose(built["jaw"], reference.jaw)
+    assert np.all(built["machine_id"] == "2619")
+    assert built["timestamp"][0] == np.datetime64("2021-01-01T08:00:00")
+
+    loaded = columns.load_icom_columns(archive, ["timestamp", "meterset"])
+    assert list(loaded) == ["timestamp", "meterset"]
+    assert np.array_equal(loaded["timestamp"], built["timestamp"])
+    assert np.array_equal(loaded["meterset"], built["meterset"])
@@ -0,0 +1,71 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import lzma
+
+from pymedphys._imports import numpy as np
+
+import pymedphys
+from pymedphys._icom import convert, synthetic
+
+
+def test_icom2npz_by_directory(tmp_path):
+    input_directory = tmp_path.joinpath("patients")
+    output_directory = tmp_path.joinpath("deliveries")
+
+    for seed in range(2):
+        archive = input_directory.joinpath(f"{seed}_PATIENT", "20210101_080000.xz")
+        archive.parent.mkdir(parents=True)
+        with lzma.open(archive, "w") as f:
+            f.write(b"".join(synthetic.create_frames(20, seed=seed)))
+
+    truncated = input_directory.joinpath("0_PATIENT", "20210101_090000.xz")
+    truncated.write_bytes(
+        input_directory.joinpath("0_PATIENT", "20210101_080000.xz").read_bytes()[:-50]
+    )
+    input_directory.joinpath("1_PATIENT", "20210101_090000.xz").write_bytes(b"corrupt")
+
+    converted, skipped, failed = convert.icom2npz_by_directory(
+        input_directory, output_directory, processes=2
+    )
+
+    assert [path.relative_to(input_directory).as_posix() for path in converted] == [
+        "0_PATIENT/20210101_080000.xz",
+        "1_PATIENT/20210101_080000.xz",
+    ]
+    assert skipped == []
+    assert sorted(failed) == [
+        truncated,
+        input_directory.joinpath("1_PATIENT", "20210101_090000.xz"),
+    ]
+
+    deliveries, _ = convert.deliveries_from_icom_archives(converted, processes=2)
+    for archive in converted:
+        saved = pymedphys.Delivery.load(
+            output_directory.joinpath(archive.relative_to(input_directory)).with_suffix(
+                ".npz"
+            )
+        )
+        for field in saved._fields:
+            assert np.allclose(
+                getattr(saved, field), getattr(deliveries[archive], field)
+            )
+
+    converted, skipped, failed = convert.icom2npz_by_directory(
+        input_directory, output_directory, processes=2
+    )
+    assert converted == []
+    assert len(skipped) == 2
+    assert len(failed) == 2
@@ -0,0 +1,127 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import datetime
+import lzma
+import pathlib
+
+from pymedphys._imports import numpy as np
+
+import pymedphys
+from pymedphys._icom import delivery, extract, mappings, synthetic
+from pymedphys._trf.decode.synthetic import create_synthetic_delivery
+
+FIELDS = {
+    "Patient ID": "123456",
+    "Patient Name": "DOE, JANE",
+    "Machine ID": "2619",
+    "Energy": "6 MV",
+    "Segment": 3,
+    "Delivery MU": 12.5,
+    "Gantry": -179.5,
+    "Collimator": 10.0,
+    "Table Isocentric": 0,
+    "Table Lateral": -1.25,
+    "Interlocks": ["Dose rate", "Door"],
+}
+
+
+def _legacy_extract_all(frame):
+    return {label: extract.extract(frame, label)[1] for label in mappings.ICOM}
+
+
+def test_tokenise_frame_matches_extract():
+    frame = synthetic.encode_frame(
+        datetime.datetime(2021, 3, 4, 5, 6, 7),
+        200,
+        {**FIELDS, "Beam Timer": "-32767"},
+        {"MLCX": np.linspace(-2, 2, 160), "ASYMY": [1.5, -0.5]},
+    )
+
+    tokenised = extract.tokenise_frame(frame)
+
+    assert tokenised.timestamp == "2021-03-0405:06:07"
+    assert tokenised.counter == 200
+    assert tokenised.fields == _legacy_extract_all(frame)
+    assert tokenised.fields["Beam Timer"] is None
+    assert tokenised.fields["Interlocks"] == ["Dose rate", "Door"]
+
+    for label, number in [("MLCX", 160), ("ASYMY", 2)]:
+        assert (
+            tokenised.collimation[label]
+            == extract.extract_coll(frame, label.encode(), number)[1]
+        )
+
+
+def test_tokenise_stream_in_place():
+    expected = create_synthetic_delivery(number_of_rows=20, seed=1)
+    icom_stream = synthetic.create_icom_stream(expected)
+
+    frames = list(extract.tokenise_stream(memoryview(icom_stream)))
+    assert [frame.counter for frame in frames] == list(range(20))
+    assert frames == [
+        extract.tokenise_frame(item) for item in extract.get_data_points(icom_stream)
+    ]
+
+    mu, gantry, collimator, mlc, jaw = delivery.delivery_from_icom_stream(icom_stream)
+    assert np.allclose(
+        mu, expected.monitor_units - expected.monitor_units[0], atol=0.02
+    )
+    assert np.allclose(gantry, expected.gantry, atol=0.006)
+    assert np.allclose(collimator, expected.collimator, atol=0.006)
+    assert np.allclose(mlc, expected.mlc, atol=0.06)
+    assert np.allclose(jaw, expected.jaw, atol=0.06)
+
+
+def _read_icom_streams(paths):
+    for path in map(pathlib.Path, paths):
+        if not path.is_file():
+            continue
+
+        data = path.read_bytes()
+        if path.suffix == ".xz":
+            data = lzma.decompress(data)
+
+        if extract.DATE_PATTERN.search(data):
+            yield data
+
+
+def _legacy_extract_coll(frame, label, number):
+    try:
+        return extract.extract_coll(frame, label.encode(), number)[1]
+    except AttributeError:
+        return None
+
+
+def test_tokenise_stream_matches_extract_on_recorded_data():
+    paths = pymedphys.zip_data_paths("alphanumeric-machine-id-icom.zip")
+
+    number_of_frames = 0
+    for icom_stream in _read_icom_streams(paths):
+        frames = extract.get_data_points(icom_stream)
+        tokenised = list(extract.tokenise_stream(icom_stream))
+        assert len(tokenised) == len(frames)
+
+        for frame, tokenised_frame in zip(frames, tokenised):
+            assert tokenised_frame.fields == _legacy_extract_all(frame)
+
+            for label, number in [("MLCX", 160), ("ASYMY", 2)]:
+                assert tokenised_frame.collimation.get(label) == (
+                    _legacy_extract_coll(frame, label, number)
+                )
+
+        number_of_frames += len(frames)
+
+    assert number_of_frames > 0
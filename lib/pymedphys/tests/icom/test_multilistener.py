@@ -0,0 +1,151 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import asyncio
+import threading
+
+from pymedphys._icom import extract, multilistener, synthetic
+
+
+def test_frame_splitter():
+    frames = synthetic.create_frames(10, seed=0)
+    icom_stream = b"partial frame" + b"".join(frames)
+
+    splitter = extract.FrameSplitter()
+    split_frames = []
+    for i in range(0, len(icom_stream), 7):
+        split_frames += splitter.feed(icom_stream[i : i + 7])
+
+    assert split_frames == frames[:-1]
+    assert len(splitter) == len(frames[-1])
+
+
+def test_reconnects_and_counts():
+    frames = synthetic.create_frames(20, seed=0)
+    handled = []
+    connection_number = iter(range(100))
+
+    async def serve_then_disconnect(_, writer):
+        start = next(connection_number) * 10
+        for frame in frames[start : start + 10]:
+            writer.write(frame)
+            await writer.drain()
+
+        writer.close()
+
+    async def listen():
+        server = await asyncio.start_server(serve_then_disconnect, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+
+        connection = multilistener.IcomConnection(
+            "127.0.0.1",
+            lambda ip, frame: handled.append(frame),
+            port=port,
+            initial_backoff=0.01,
+        )
+        task = asyncio.ensure_future(connection.run())
+
+        while connection.stats.connections < 3:
+            await asyncio.sleep(0.01)
+
+        task.cancel()
+        server.close()
+
+        return connection.stats
+
+    stats = asyncio.run(listen())
+
+    # The final timestep of each connection is never completed.
+    assert handled == frames[0:9] + frames[10:19]
+    assert stats.frames_handled >= 18
+    assert stats.disconnections >= 2
+    assert stats.bytes_received >= sum(len(frame) for frame in frames[0:19])
+
+
+def _serve_frames(frames):
+    async def serve(_, writer):
+        for frame in frames:
+            writer.write(frame)
+            await writer.drain()
+
+        writer.close()
+
+    return serve
+
+
+def test_handling_errors_do_not_stop_listening():
+    frames = synthetic.create_frames(10, seed=0)
+    handled = []
+
+    def handle_frame(_, frame):
+        if frame in (frames[2], frames[5]):
+            raise ValueError("Unexpected iCOM stream format")
+
+        handled.append(frame)
+
+    async def listen():
+        server = await asyncio.start_server(_serve_frames(frames), "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+
+        task = asyncio.ensure_future(
+            multilistener.listen_many(
+                ["127.0.0.1"], handle_frame, port=port, initial_backoff=0.01
+            )
+        )
+
+        while len(handled) < 7:
+            await asyncio.sleep(0.01)
+            assert not task.done()
+
+        task.cancel()
+        server.close()
+
+    asyncio.run(listen())
+
+    assert handled == [frame for i, frame in enumerate(frames[:-1]) if i not in (2, 5)]
+
+
+def test_slow_handling_does_not_stall_other_linacs():
+    frames = synthetic.create_frames(10, seed=0)
+    release_slow_linac = threading.Event()
+
+    # Both reach the one server, as only 127.0.0.1 is available by
+    # default on macOS.
+    handled = {"127.0.0.1": [], "localhost": []}
+
+    def handle_frame(ip, frame):
+        if ip == "127.0.0.1":
+            release_slow_linac.wait(5)
+
+        handled[ip].append(frame)
+
+    async def listen():
+        server = await asyncio.start_server(_serve_frames(frames), "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+
+        task = asyncio.ensure_future(
+            multilistener.listen_many(list(handled), handle_frame, port=port)
+        )
+
+        while len(handled["localhost"]) < 9:
+            await asyncio.sleep(0.01)
+
+        assert not handled["127.0.0.1"]
+        release_slow_linac.set()
+
+        task.cancel()
+        server.close()
+
+    asyncio.run(listen())
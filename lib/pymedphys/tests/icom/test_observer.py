@@ -0,0 +1,189 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import threading
+import time
+
+from pymedphys._imports import watchdog
+
+from pymedphys._icom import observer, segments, synthetic
+
+
+def _record_burst(batched_file_reader, paths, now):
+    for path in paths:
+        for _ in range(5):
+            batched_file_reader.record(str(path), now=now)
+
+
+def test_batched_file_reader(tmp_path):
+    frames = synthetic.create_frames(5, seed=1)
+
+    received = []
+    batched_file_reader = observer.BatchedFileReader(
+        lambda ip, frame: received.append((ip, frame)), debounce=0.1
+    )
+
+    live_directory = tmp_path.joinpath("live", "127.0.0.1")
+    live_directory.mkdir(parents=True)
+    paths = []
+    for counter, frame in enumerate(frames[0:3]):
+        path = live_directory.joinpath(f"{str(counter).zfill(3)}.txt")
+        path.write_bytes(frame)
+        paths.append(path)
+
+    _record_burst(batched_file_reader, paths, now=0)
+
+    assert batched_file_reader.process_pending(now=0.05) == 0
+    assert batched_file_reader.process_pending(now=1) == 3
+    assert received == [("127.0.0.1", frame) for frame in frames[0:3]]
+
+    # Events without any change to the files are ignored
+    _record_burst(batched_file_reader, paths, now=2)
+    assert batched_file_reader.process_pending(now=3) == 0
+
+    received.clear()
+    with segments.SegmentStore(tmp_path.joinpath("segments")) as segment_store:
+        segment_store.append("127.0.0.2", frames[0])
+        segment_store.append("127.0.0.2", frames[1])
+
+        (segment_path,) = tmp_path.joinpath("segments", "127.0.0.2").glob("*.seg")
+        _record_burst(batched_file_reader, [segment_path], now=4)
+        assert batched_file_reader.process_pending(now=5) == 2
+
+        segment_store.append("127.0.0.2", frames[2])
+        segment_store.append("127.0.0.2", frames[3])
+
+        # A partially written timestep is left until it is complete
+        with open(segment_path, "ab") as f:
+            f.write(segments.LENGTH.pack(len(frames[4])) + frames[4][0:10])
+
+        _record_burst(batched_file_reader, [segment_path], now=6)
+        assert batched_file_reader.process_pending(now=7) == 2
+
+        with open(segment_path, "ab") as f:
+            f.write(frames[4][10::])
+
+        _record_burst(batched_file_reader, [segment_path], now=8)
+        assert batched_file_reader.process_pending(now=9) == 1
+
+    assert received == [("127.0.0.2", frame) for frame in frames[0:5]]
+
+
+def test_continually_written_files_are_still_read(tmp_path):
+    frames = synthetic.create_frames(5, seed=1)
+
+    received = []
+    batched_file_reader = observer.BatchedFileReader(
+        lambda ip, frame: received.append((ip, frame)), debounce=0.1, max_latency=1
+    )
+
+    with segments.SegmentStore(tmp_path) as segment_store:
+        for i, frame in enumerate(frames):
+            segment_store.append("127.0.0.1", frame)
+            (segment_path,) = tmp_path.joinpath("127.0.0.1").glob("*.seg")
+
+            # Written to more often than the debounce allows
+            now = i * 0.05
+            batched_file_reader.record(str(segment_path), now=now)
+            batched_file_reader.process_pending(now=now)
+
+        assert received == []
+
+        # The writes have not settled, but the file has waited too long
+        batched_file_reader.record(str(segment_path), now=1)
+        assert batched_file_reader.process_pending(now=1) == 5
+
+    assert received == [("127.0.0.1", frame) for frame in frames]
+
+
+def test_unread_timesteps_of_closed_segments_are_read(tmp_path):
+    frames = synthetic.create_frames(12, seed=1)
+
+    received = []
+    batched_file_reader = observer.BatchedFileReader(
+        lambda ip, frame: received.append(frame), debounce=0.1
+    )
+
+    segment_path = tmp_path.joinpath("127.0.0.1", "20210101_08.seg")
+    segment_path.parent.mkdir()
+
+    # The segment was closed once before, when the listener was
+    # restarted within the hour.
+    with open(segment_path, "wb") as f:
+        for frame in frames[0:3]:
+            f.write(segments.LENGTH.pack(len(frame)) + frame)
+    segments.close_segment(segment_path)
+
+    with open(segment_path, "wb") as f:
+        for frame in frames[3:6]:
+            f.write(segments.LENGTH.pack(len(frame)) + frame)
+
+    batched_file_reader.record(str(segment_path), now=0)
+    assert batched_file_reader.process_pending(now=1) == 3
+
+    with open(segment_path, "ab") as f:
+        for frame in frames[6:12]:
+            f.write(segments.LENGTH.pack(len(frame)) + frame)
+    batched_file_reader.record(str(segment_path), now=2)
+
+    segments.close_segment(segment_path)
+    assert not segment_path.exists()
+
+    # The deletion of the segment
+    batched_file_reader.record(str(segment_path), now=2)
+
+    assert batched_file_reader.process_pending(now=3) == 6
+    assert received == frames[3:12]
+
+
+def test_burst_of_frame_files_through_a_live_observer(tmp_path):
+    frames = synthetic.create_frames(256, seed=1)
+
+    received = []
+    batched_file_reader = observer.BatchedFileReader(
+        lambda ip, frame: received.append((ip, frame)), debounce=0.1
+    )
+
+    live_directory = tmp_path.joinpath("127.0.0.1")
+    live_directory.mkdir()
+
+    watchdog_observer = watchdog.observers.Observer()
+    watchdog_observer.schedule(
+        observer.create_event_handler(batched_file_reader),
+        str(tmp_path),
+        recursive=True,
+    )
+    watchdog_observer.start()
+
+    stop_event = threading.Event()
+    reader_thread = threading.Thread(
+        target=batched_file_reader.run, args=(stop_event,), kwargs={"window": 0.05}
+    )
+    reader_thread.start()
+
+    try:
+        for counter, frame in enumerate(frames):
+            live_directory.joinpath(f"{str(counter).zfill(3)}.txt").write_bytes(frame)
+
+        deadline = time.monotonic() + 10
+        while len(received) < len(frames) and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        stop_event.set()
+        reader_thread.join()
+        watchdog_observer.stop()
+        watchdog_observer.join()
+
+    assert received == [("127.0.0.1", frame) for frame in frames]
@@ -0,0 +1,185 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import datetime
+import lzma
+
+from pymedphys._imports import numpy as np
+
+import pymedphys
+from pymedphys._icom import extract, patients, synthetic
+
+START = datetime.datetime(2021, 1, 1, 8, 0, 0)
+INTERVAL = datetime.timedelta(seconds=1)
+
+
+def _create_frames(number_of_frames, first_counter, patient_id, patient_name):
+    return synthetic.create_frames(
+        number_of_frames,
+        seed=0,
+        start=START + first_counter * INTERVAL,
+        interval=INTERVAL,
+        first_counter=first_counter,
+        patient_id=patient_id,
+        patient_name=patient_name,
+    )
+
+
+def test_recordings_are_saved_on_patient_change(tmp_path, monkeypatch):
+    frames = (
+        _create_frames(10, 0, "111", "ONE")
+        + _create_frames(10, 10, "222", "TWO")
+        + _create_frames(5, 20, None, None)
+    )
+
+    tokenise_calls = []
+    tokenise_frame = extract.tokenise_frame
+
+    def counted_tokenise_frame(data, *args):
+        if data in frames:
+            tokenise_calls.append(data)
+
+        return tokenise_frame(data, *args)
+
+    monkeypatch.setattr(extract, "tokenise_frame", counted_tokenise_frame)
+
+    patient_icom_data = patients.PatientIcomData(tmp_path)
+    for frame in frames:
+        patient_icom_data.update_data("127.0.0.1", frame)
+
+    monkeypatch.undo()
+
+    # The identity is only extracted when the patient changes.
+    assert tokenise_calls == [frames[0], frames[10], frames[20]]
+
+    with lzma.open(tmp_path.joinpath("111_ONE", "20210101_080000.xz")) as f:
+        assert f.read() == b"".join(frames[0:10])
+
+    with lzma.open(tmp_path.joinpath("222_TWO", "20210101_080010.xz")) as f:
+        assert f.read() == b"".join(frames[10:20])
+
+
+def test_long_recordings_are_split(tmp_path):
+    frames = _create_frames(25, 0, "111", "ONE")
+
+    with patients.PatientIcomData(
+        tmp_path, max_frames_per_recording=10
+    ) as patient_icom_data:
+        for frame in frames:
+            patient_icom_data.update_data("127.0.0.1", frame)
+
+        assert sorted(path.name for path in tmp_path.joinpath("111_ONE").iterdir()) == [
+            "20210101_080000.xz",
+            "20210101_080010.xz",
+            "20210101_080020.xz.part",
+        ]
+
+    # Closing finishes the recording still in progress.
+    assert sorted(path.name for path in tmp_path.joinpath("111_ONE").iterdir()) == [
+        "20210101_080000.xz",
+        "20210101_080010.xz",
+        "20210101_080020.xz",
+    ]
+
+
+def test_recording_continues_across_missed_timesteps(tmp_path, caplog):
+    frames = _create_frames(10, 0, "111", "ONE")
+    received = frames[0:4] + frames[5:10]
+
+    with patients.PatientIcomData(tmp_path) as patient_icom_data:
+        for frame in received:
+            patient_icom_data.update_data("127.0.0.1", frame)
+
+    assert "counter jumped from 3 to 5" in caplog.text
+
+    with lzma.open(tmp_path.joinpath("111_ONE", "20210101_080000.xz")) as f:
+        data = f.read()
+
+    assert data == b"".join(received)
+
+    delivery = pymedphys.Delivery.from_icom(data)
+    expected = pymedphys.Delivery.from_icom(b"".join(frames))
+    assert len(delivery.mu) == len(received)
+    assert np.isclose(delivery.mu[-1], expected.mu[-1])
+
+
+def test_recording_is_readable_while_in_progress(tmp_path):
+    frames = _create_frames(5, 0, "111", "ONE")
+
+    recording = patients.PatientRecording(
+        tmp_path, "2021-01-01T08:00:00", "111", "ONE", flush_interval=0
+    )
+    for frame in frames:
+        recording.append(frame)
+
+    partial_path = tmp_path.joinpath("111_ONE", "20210101_080000.xz.part")
+    with lzma.open(partial_path) as f:
+        assert f.read() == b"".join(frames)
+
+    recording.finish()
+
+    assert not partial_path.exists()
+    with lzma.open(recording.filename) as f:
+        assert f.read() == b"".join(frames)
+
+
+def test_unfinished_recordings_are_recovered(tmp_path):
+    frames = _create_frames(10, 0, "111", "ONE")
+
+    # The last xz stream was cut short when the listener was killed.
+    partial_path = tmp_path.joinpath("111_ONE", "20210101_080000.xz.part")
+    partial_path.parent.mkdir()
+    partial_path.write_bytes(
+        lzma.compress(b"".join(frames[0:3]))
+        + lzma.compress(b"".join(frames[3:6]))
+        + lzma.compress(b"".join(frames[6:10]))[:-20]
+    )
+
+    patients.PatientIcomData(tmp_path).close()
+
+    assert not partial_path.exists()
+    with lzma.open(tmp_path.joinpath("111_ONE", "20210101_080000.xz")) as f:
+        assert f.read() == b"".join(frames[0:6])
+
+
+def test_recording_validator_matches_whole_recording():
+    frames = _create_frames(20, 0, "111", "ONE")
+    expected = pymedphys.Delivery.from_icom(b"".join(frames))
+
+    validator = patients.RecordingValidator()
+    for batch in [frames[0:1], frames[1:7], frames[7:20]]:
+        validator.update(b"".join(batch))
+
+    assert validator.is_readable
+    assert np.isclose(validator.total_mu, expected.mu[-1])
+
+    # A timestep without any MLC positions
+    validator.update(
+        synthetic.encode_frame(START, 20, {"Delivery MU": 1.0, "Gantry": 0.0})
+    )
+    assert not validator.is_readable
+
+
+def test_recordings_without_mu_are_not_saved(tmp_path):
+    recording = patients.PatientRecording(
+        tmp_path, "2021-01-01T08:00:00", "111", "ONE", flush_interval=0
+    )
+    frame = _create_frames(1, 0, "111", "ONE")[0]
+    for _ in range(5):
+        recording.append(frame)
+
+    recording.finish()
+
+    assert not list(tmp_path.joinpath("111_ONE").iterdir())
@@ -0,0 +1,47 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import collections
+
+from pymedphys._icom import replay, synthetic
+
+
+def test_benchmark_listener_with_faults():
+    frames = synthetic.create_frames(40, seed=0)
+    handled = collections.defaultdict(list)
+
+    # Both Linacs are served from 127.0.0.1, the only loopback address
+    # available by default on macOS, each on their own port.
+    result = replay.benchmark_listener(
+        {"192.168.100.200": frames, "192.168.100.201": frames},
+        handle_frame=lambda ip, frame: handled[ip].append(frame),
+        faults=replay.Faults(
+            disconnect=0.1, partial_frame=0.05, split_frame=0.3, seed=1
+        ),
+        trace_memory=False,
+        timeout=20,
+    )
+
+    assert result.frames_sent == 80
+    assert result.reconnects > 0
+    assert result.handling_errors == 0
+    assert result.frames_handled == sum(len(item) for item in handled.values())
+
+    for ip_handled in handled.values():
+        # Timesteps are lost across disconnects, but those received are
+        # intact and in order.
+        indices = [frames.index(frame) for frame in ip_handled]
+        assert indices == sorted(set(indices))
+        assert 0 < len(indices) < 40
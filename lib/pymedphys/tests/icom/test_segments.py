@@ -0,0 +1,130 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import datetime
+
+from pymedphys._icom import segments, synthetic
+
+
+def _create_frames():
+    return synthetic.create_frames(
+        120,
+        seed=0,
+        start=datetime.datetime(2021, 1, 1, 8, 30),
+        interval=datetime.timedelta(seconds=30),
+    )
+
+
+def test_segment_store(tmp_path):
+    frames = _create_frames()
+    ip_directory = tmp_path.joinpath("192.168.100.200")
+
+    with segments.SegmentStore(tmp_path, frames_per_chunk=10) as store:
+        for frame in frames[0:100]:
+            store.append("192.168.100.200", frame)
+
+        store.wait_until_closed()
+        assert sorted(path.name for path in ip_directory.iterdir()) == [
+            "20210101_08.seg.idx",
+            "20210101_08.seg.xz",
+            "20210101_09.seg",
+        ]
+        assert segments.read_icom_stream(tmp_path, "192.168.100.200") == b"".join(
+            frames[0:100]
+        )
+
+    assert not ip_directory.joinpath("20210101_09.seg").exists()
+
+    # Reopening a closed segment appends to it.
+    with segments.SegmentStore(tmp_path, frames_per_chunk=10) as store:
+        for frame in frames[100:]:
+            store.append("192.168.100.200", frame)
+
+    assert list(segments.iter_frames(tmp_path, "192.168.100.200")) == frames
+
+    start = datetime.datetime(2021, 1, 1, 8, 47, 15)
+    end = datetime.datetime(2021, 1, 1, 9, 10)
+    assert (
+        list(segments.iter_frames(tmp_path, "192.168.100.200", start, end))
+        == frames[35:80]
+    )
+
+
+def _write_open_segment(path, frames):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(
+        b"".join(segments.LENGTH.pack(len(frame)) + frame for frame in frames)
+    )
+
+
+def test_incomplete_record_is_truncated(tmp_path):
+    frames = _create_frames()[0:3]
+
+    # The state left by the listener stopping mid write.
+    segment_path = tmp_path.joinpath("a", "20210101_08.seg")
+    _write_open_segment(segment_path, frames[0:2])
+    with open(segment_path, "ab") as f:
+        f.write(segments.LENGTH.pack(len(frames[2])) + frames[2][0:10])
+
+    assert list(segments.iter_segment_frames(segment_path)) == frames[0:2]
+
+    with segments.SegmentStore(tmp_path) as store:
+        store.append("a", frames[2])
+
+    assert list(segments.iter_frames(tmp_path, "a")) == frames
+
+
+def test_interrupted_close_is_recovered(tmp_path):
+    frames = _create_frames()[0:30]
+    segment_path = tmp_path.joinpath("a", "20210101_08.seg")
+    index_path = tmp_path.joinpath("a", "20210101_08.seg.idx")
+
+    # Interrupted after the segment's first close replaced the
+    # compressed data, but before the index was written.
+    _write_open_segment(segment_path, frames[0:10])
+    segments.close_segment(segment_path, frames_per_chunk=4)
+    committed_index = index_path.read_bytes()
+    index_path.unlink()
+    _write_open_segment(segment_path, frames[0:10])
+
+    assert list(segments.iter_frames(tmp_path, "a")) == frames[0:10]
+
+    segments.close_segment(segment_path, frames_per_chunk=4)
+    assert index_path.read_bytes() == committed_index
+
+    # Interrupted after the compressed data was replaced, but before
+    # the index was.
+    _write_open_segment(segment_path, frames[10:20])
+    segments.close_segment(segment_path, frames_per_chunk=4)
+    index_path.write_bytes(committed_index)
+    _write_open_segment(segment_path, frames[10:20])
+
+    assert list(segments.iter_frames(tmp_path, "a")) == frames[0:20]
+
+    segments.close_segment(segment_path, frames_per_chunk=4)
+    assert not segment_path.exists()
+    assert list(segments.iter_frames(tmp_path, "a")) == frames[0:20]
+
+    # Interrupted after the index was replaced, but before the open
+    # segment was removed.
+    _write_open_segment(segment_path, frames[20:25])
+    segments.close_segment(segment_path, frames_per_chunk=4)
+    _write_open_segment(segment_path, frames[20:25])
+
+    with segments.SegmentStore(tmp_path, frames_per_chunk=4) as store:
+        for frame in frames[25:30]:
+            store.append("a", frame)
+
+    assert list(segments.iter_frames(tmp_path, "a")) == frames
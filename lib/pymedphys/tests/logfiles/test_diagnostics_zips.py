@@ -0,0 +1,59 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import zipfile
+
+from pymedphys._trf.manage.diagnostics_zips import extract_diagnostic_zips_and_archive
+
+
+def _write_diagnostics_zip(filepath, members):
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    with zipfile.ZipFile(filepath, "w") as zip_file:
+        for name, contents in members.items():
+            zip_file.writestr(name, contents)
+
+
+def test_only_new_members_are_extracted(tmp_path):
+    zips_to_be_indexed = tmp_path.joinpath("diagnostics", "to_be_indexed", "2619")
+    logfiles_to_be_indexed = tmp_path.joinpath("to_be_indexed")
+
+    _write_diagnostics_zip(
+        zips_to_be_indexed.joinpath("SDD+1.zip"),
+        {"logs/a.trf": b"a", "logs/b.trf": b"b", "logs/other.txt": b"c"},
+    )
+    extract_diagnostic_zips_and_archive(str(tmp_path))
+
+    assert sorted(
+        path.name for path in logfiles_to_be_indexed.glob("**/*") if path.is_file()
+    ) == ["a.trf", "b.trf"]
+    assert tmp_path.joinpath(
+        "diagnostics", "already_indexed", "2619", "SDD+1.zip"
+    ).exists()
+
+    for path in logfiles_to_be_indexed.glob("**/*.trf"):
+        path.unlink()
+
+    _write_diagnostics_zip(
+        zips_to_be_indexed.joinpath("SDD+2.zip"),
+        {"logs/a.trf": b"a", "logs/b.trf": b"changed", "../../c.trf": b"c"},
+    )
+    extract_diagnostic_zips_and_archive(str(tmp_path))
+
+    extracted = {
+        path.relative_to(logfiles_to_be_indexed).as_posix(): path.read_bytes()
+        for path in logfiles_to_be_indexed.glob("**/*")
+        if path.is_file()
+    }
+    assert extracted == {"logs/b.trf": b"changed", "c.trf": b"c"}
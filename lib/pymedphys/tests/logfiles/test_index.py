@@ -0,0 +1,156 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import datetime
+import json
+import os
+
+from pymedphys._imports import pytest
+
+from pymedphys._mosaiq.delivery import (
+    MultipleMosaiqEntries,
+    NoMosaiqEntries,
+    find_mosaiq_delivery_details,
+)
+from pymedphys._trf.manage import index as _index
+from pymedphys._trf.manage.index_store import open_logfile_index
+from pymedphys._utilities.config import get_gantry_tolerance, get_index
+
+from ..trf.test_header_index import _write_header_only_trf
+
+_GANTRY_CONFIG = {
+    "machine_map": {"2619": {"type": "elekta"}},
+    "machine_types": {"elekta": {"gantry_tolerance": 3}},
+}
+
+
+def _candidate(patient_id, field_label, field_name, start, end, field_id=1):
+    return (
+        patient_id,
+        field_id,
+        "PHANTOM",
+        "A",
+        False,
+        1,
+        True,
+        field_label,
+        field_name,
+        datetime.datetime.fromisoformat(start),
+        datetime.datetime.fromisoformat(end),
+    )
+
+
+CANDIDATES = [
+    _candidate("123", "1-1", "AP G0", "2021-01-01 19:00:00", "2021-01-01 19:02:00"),
+    _candidate("456", "1-1", "AP G0", "2021-01-01 19:05:00", "2021-01-01 19:07:00"),
+    _candidate("789", "1-2", "PA G180", "2021-01-02 08:00:00", "2021-01-02 08:02:00"),
+]
+
+
+def test_find_mosaiq_delivery_details():
+    details = find_mosaiq_delivery_details(
+        CANDIDATES, "2021-01-01 19:01:00", "1-1", "ap g0 ", buffer=240
+    )
+    assert details.patient_id == "123"
+    assert details.field_type == "Static"
+
+    with pytest.raises(NoMosaiqEntries):
+        find_mosaiq_delivery_details(
+            CANDIDATES, "2021-01-01 19:03:30", "1-1", "AP G0", buffer=0
+        )
+
+    with pytest.raises(MultipleMosaiqEntries):
+        find_mosaiq_delivery_details(
+            CANDIDATES + [CANDIDATES[0][0:1] + (2,) + CANDIDATES[0][2::]],
+            "2021-01-01 19:01:00",
+            "1-1",
+            "AP G0",
+            buffer=240,
+        )
+
+
+def test_index_logfiles_queries_once_per_machine_day(tmp_path, monkeypatch):
+    to_be_indexed = tmp_path.joinpath("to_be_indexed")
+    for i, utc_time in enumerate(["09:01:00", "09:06:00"]):
+        _write_header_only_trf(
+            to_be_indexed.joinpath(f"{i}.trf"), f"21/01/01 {utc_time} Z", "2619"
+        )
+    _write_header_only_trf(
+        to_be_indexed.joinpath("not_found.trf"), "21/01/01 12:00:00 Z", "2619"
+    )
+
+    queries = []
+
+    def get_candidates(connection, machine, day, buffer=0):
+        queries.append((connection, machine, day, buffer))
+        return CANDIDATES
+
+    monkeypatch.setattr(_index._pp_mosaiq, "connect", lambda *_: "connection")
+    monkeypatch.setattr(
+        _index, "get_mosaiq_delivery_candidates_for_day", get_candidates
+    )
+
+    centre_map = {"a_centre": {"mosaiq_sql_server": "msq", "timezone": "+10:00"}}
+    machine_map = {"2619": {"centre": "a_centre"}}
+    _index.index_logfiles(centre_map, machine_map, str(tmp_path))
+
+    assert queries == [("connection", "2619", "2021-01-01", 240)]
+
+    with open_logfile_index(tmp_path) as logfile_index:
+        index = logfile_index.query(machine="2619", start="2021-01-01")
+
+    assert [entry["delivery_details"]["patient_id"] for entry in index.values()] == [
+        "123",
+        "456",
+    ]
+    assert not list(to_be_indexed.glob("*.trf"))
+    assert tmp_path.joinpath("no_mosaiq_record_found", "not_found.trf").exists()
+
+
+def test_index_json_migration(tmp_path, capsys):
+    entry = {
+        "filepath": "centre/123_PHANTOM_A/clinical/a.trf",
+        "delivery_details": {"patient_id": "123"},
+        "logfile_header": {
+            "machine": "2619",
+            "date": "21/01/01 09:01:00 Z",
+            "timezone": "+10:00",
+            "field_label": "1-1",
+            "field_name": "AP G0",
+        },
+        "local_time": "2021-01-01 19:01:00",
+    }
+    with open(tmp_path.joinpath("index.json"), "w") as f:
+        json.dump(
+            {
+                "a_hash": entry,
+                "incomplete_hash": {"filepath": "centre/b.trf"},
+            },
+            f,
+        )
+
+    with open_logfile_index(tmp_path) as logfile_index:
+        assert "incomplete_hash" in capsys.readouterr().out
+        assert len(logfile_index) == 1
+        assert logfile_index["a_hash"] == entry
+        assert "another_hash" not in logfile_index
+        assert logfile_index.query(patient_id="123") == {"a_hash": entry}
+        assert not logfile_index.query(end="2021-01-01")
+
+    assert sorted(os.listdir(tmp_path)) == ["index.db", "index.json.migrated"]
+
+    config = {"linac_logfile_data_directory": str(tmp_path)}
+    with get_index(config) as logfile_index:
+        assert get_gantry_tolerance(logfile_index, "a_hash", _GANTRY_CONFIG) == 3
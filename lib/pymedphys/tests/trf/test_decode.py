@@ -23,6 +23,7 @@ from pymedphys._imports import pandas as pd
 from pymedphys._imports import pytest
 
 import pymedphys
+from pymedphys._trf.decode.table import apply_negative, decode_table_data
 from pymedphys._trf.decode.trf2csv import trf2csv
 
 # TODO need to include header test
@@ -96,3 +97,27 @@ def test_conversions():
 
         for filepath in files_without_references:
             convert_and_check_against_baseline(filepath, output_directory)
+
+
+def test_table_decoding_agrees_with_int_from_bytes():
+    line_grouping = 708
+    rows = [
+        np.random.randint(0, 256, size=line_grouping, dtype=np.uint8).tobytes()
+        for _ in range(10)
+    ]
+
+    decoded = decode_table_data(rows, line_grouping)
+
+    reference = [
+        [
+            int.from_bytes(row[i : i + 2], byteorder="little")
+            for i in range(0, line_grouping, 2)
+        ]
+        for row in rows
+    ]
+
+    np.testing.assert_array_equal(decoded, reference)
+    np.testing.assert_array_equal(
+        apply_negative(np.array([0, 2 ** 15, 2 ** 15 + 1, 2 ** 16 - 1])),
+        [0, 2 ** 15, -(2 ** 15) + 1, -1],
+    )
@@ -0,0 +1,78 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from pymedphys._imports import numpy as np
+from pymedphys._imports import pytest
+
+from pymedphys._trf.decode.detect import (
+    find_candidate_decoding_options,
+    search_for_possible_decoding_options,
+)
+from pymedphys._trf.decode.table import decode_rows
+
+
+def _create_table(number_of_rows, line_grouping, state_code_columns, seed=0):
+    rng = np.random.default_rng(seed)
+
+    # None of these values are linac state codes.
+    table = rng.integers(1000, 2 ** 16, size=(number_of_rows, line_grouping // 2))
+    for column in state_code_columns:
+        table[:, column] = rng.choice([39, 40, 42], size=number_of_rows)
+
+    return table.astype("<u2")
+
+
+def _brute_force_search(trf_table_contents):
+    possible_groupings = []
+    for line_grouping in range(600, 800):
+        for linac_state_codes_column in range(0, 50):
+            try:
+                decode_rows(
+                    trf_table_contents,
+                    input_line_grouping=line_grouping,
+                    input_linac_state_codes_column=linac_state_codes_column,
+                )
+                possible_groupings.append([line_grouping, linac_state_codes_column])
+            except ValueError:
+                pass
+
+    return possible_groupings
+
+
+@pytest.mark.parametrize("number_of_rows", [0, 1, 2, 50])
+def test_search_agrees_with_brute_force(number_of_rows):
+    trf_table_contents = _create_table(number_of_rows, 700, [2, 6]).tobytes()
+
+    possible_groupings = search_for_possible_decoding_options(trf_table_contents)
+
+    assert possible_groupings == _brute_force_search(trf_table_contents)
+    if number_of_rows != 0:
+        # Both integrity_v3 and unity_experimental decode this table.
+        assert [700, 2] in possible_groupings
+        assert [700, 6] in possible_groupings
+
+
+def test_sampled_candidates_are_confirmed():
+    table = _create_table(300, 708, [6, 10])
+
+    # A non-reference state code within a row that is not sampled.
+    table[1, 10] = 1
+    trf_table_contents = table.tobytes()
+
+    candidates = find_candidate_decoding_options(trf_table_contents)
+    assert (708, 6) in candidates
+    assert (708, 10) in candidates
+
+    assert search_for_possible_decoding_options(trf_table_contents) == [[708, 6]]
@@ -0,0 +1,89 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+
+from pymedphys._imports import pandas as pd
+
+from pymedphys._trf.manage.header_index import HeaderIndex
+
+from .test_trffile import HEADER_COLUMN_END
+
+
+def _write_header_only_trf(filepath, date, machine):
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    filepath.write_bytes(
+        b"\x00"
+        + date.encode()
+        + b"\x00+10:00\x00"
+        + b"1-1/AP G0"
+        + b"\x00"
+        + machine.encode()
+        + b"\x00"
+        + HEADER_COLUMN_END
+        + b"\x00" * 708
+    )
+
+
+def test_header_index(tmp_path):
+    archive = tmp_path.joinpath("archive")
+    _write_header_only_trf(archive.joinpath("a.trf"), "21/01/01 09:00:00 Z", "2619")
+    _write_header_only_trf(
+        archive.joinpath("b", "b.trf"), "21/01/02 09:00:00 Z", "2619"
+    )
+    _write_header_only_trf(archive.joinpath("c.trf"), "21/01/02 10:00:00 Z", "2694")
+    archive.joinpath("corrupt.trf").write_bytes(b"not a trf")
+
+    database_path = tmp_path.joinpath("headers.db")
+    with HeaderIndex(database_path) as index:
+        assert index.update(archive) == 4
+        assert index.update(archive) == 0
+
+        results = index.query(machine="2619", start="2021-01-02")
+        assert results["path"].tolist() == [str(archive.joinpath("b", "b.trf"))]
+        assert results["field_name"].tolist() == ["AP G0"]
+
+        assert len(index.query(end="2021-01-02 10:00:00")) == 2
+        assert len(index.query(end="2021-01-02 20:00:00+10:00")) == 2
+        assert (
+            len(
+                index.query(
+                    start=pd.Timestamp("2021-01-02 19:30", tz="Australia/Brisbane")
+                )
+            )
+            == 1
+        )
+        assert index.errors()["path"].tolist() == [str(archive.joinpath("corrupt.trf"))]
+
+    _write_header_only_trf(archive.joinpath("a.trf"), "21/01/03 09:00:00 Z", "2694")
+    os.utime(archive.joinpath("a.trf"), ns=(0, 0))
+    os.remove(archive.joinpath("c.trf"))
+
+    with HeaderIndex(database_path) as index:
+        assert index.update(archive) == 1
+        assert index.query(machine="2694")["date"].tolist() == ["21/01/03 09:00:00 Z"]
+
+
+def test_update_leaves_other_directories_alone(tmp_path):
+    for name in ["archive", "archive0", "archive_other"]:
+        _write_header_only_trf(
+            tmp_path.joinpath(name, "a.trf"), "21/01/01 09:00:00 Z", "2619"
+        )
+
+    with HeaderIndex(tmp_path.joinpath("headers.db")) as index:
+        for name in ["archive0", "archive_other", "archive"]:
+            assert index.update(tmp_path.joinpath(name)) == 1
+
+        assert len(index.query()) == 3
@@ -0,0 +1,64 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import zipfile
+
+from pymedphys._imports import numpy as np
+from pymedphys._imports import pytest
+
+import pymedphys
+from pymedphys._trf.decode.synthetic import (
+    create_synthetic_delivery,
+    create_trf_contents,
+    write_synthetic_diagnostics_zip,
+)
+
+
+@pytest.mark.parametrize("grouping", ["integrity_v3", "integrity_v4"])
+def test_synthetic_delivery_round_trip(tmp_path, grouping):
+    delivery = create_synthetic_delivery(number_of_rows=200, seed=0)
+    trf_path = tmp_path.joinpath("synthetic.trf")
+    trf_path.write_bytes(
+        create_trf_contents(delivery, grouping=grouping, field_name="Arc")
+    )
+
+    header, table = pymedphys.trf.read(trf_path)
+    assert header["field_name"][0] == "Arc"
+    assert len(table) == 200
+
+    decoded = pymedphys.Delivery.from_trf(trf_path)
+    for field in delivery._fields:
+        assert np.allclose(
+            getattr(decoded, field), getattr(delivery, field), atol=0.051
+        )
+
+
+def test_synthetic_diagnostics_zip(tmp_path):
+    zip_path = tmp_path.joinpath("SDD+1.zip")
+    write_synthetic_diagnostics_zip(zip_path, number_of_logfiles=3, seed=1)
+
+    with zipfile.ZipFile(zip_path) as zip_file:
+        names = zip_file.namelist()
+        assert names == [
+            "TrfLogs/2619/20210101_080000.trf",
+            "TrfLogs/2619/20210101_081500.trf",
+            "TrfLogs/2619/20210101_083000.trf",
+        ]
+
+        header, _ = pymedphys.trf.read(zip_file.open(names[1]))
+
+    assert header["date"][0] == "21/01/01 08:15:00 Z"
+    assert header["field_label"][0] == "1-2"
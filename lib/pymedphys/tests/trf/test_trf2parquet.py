@@ -0,0 +1,67 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from pymedphys._imports import numpy as np
+
+import pymedphys
+from pymedphys._trf.decode.trf2parquet import (
+    read_trf_parquet,
+    trf2parquet_by_directory,
+)
+
+from .test_trffile import _write_random_trf
+
+
+def test_convert_directory(tmp_path):
+    input_directory = tmp_path.joinpath("input")
+    output_directory = tmp_path.joinpath("output")
+
+    trf_filepath = input_directory.joinpath("machine", "random.trf")
+    trf_filepath.parent.mkdir(parents=True)
+    _write_random_trf(trf_filepath)
+
+    corrupt_filepath = input_directory.joinpath("corrupt.trf")
+    corrupt_filepath.write_bytes(b"not a trf file")
+
+    converted, skipped, failed = trf2parquet_by_directory(
+        input_directory, output_directory, processes=1
+    )
+    assert converted == [trf_filepath]
+    assert not skipped
+    assert list(failed.keys()) == [corrupt_filepath]
+
+    header, table = pymedphys.trf.read(trf_filepath)
+    parquet_filepath = output_directory.joinpath("machine", "random.parquet")
+
+    parquet_header, parquet_table = read_trf_parquet(parquet_filepath)
+    assert parquet_header.equals(header)
+    assert list(parquet_table.columns) == list(table.columns)
+    np.testing.assert_array_equal(parquet_table.index, table.index)
+
+    gantry = "Step Gantry/Scaled Actual (deg)"
+    np.testing.assert_allclose(parquet_table[gantry], table[gantry], atol=1e-3)
+    assert (
+        parquet_table["Linac State/Actual Value (None)"]
+        == table["Linac State/Actual Value (None)"]
+    ).all()
+
+    _, partial_table = read_trf_parquet(parquet_filepath, columns=[gantry])
+    assert list(partial_table.columns) == [gantry]
+
+    converted, skipped, failed = trf2parquet_by_directory(
+        input_directory, output_directory, processes=1
+    )
+    assert not converted
+    assert skipped == [trf_filepath]
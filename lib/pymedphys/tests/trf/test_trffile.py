@@ -0,0 +1,166 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from pymedphys._imports import numpy as np
+from pymedphys._imports import pandas as pd
+from pymedphys._imports import pytest
+
+import pymedphys
+
+HEADER_COLUMN_END = (
+    b"\t\xdc\x00\xe8\t\xdc\x00\xe9\t\xdc\x00\xea\t\xdc\x00\xeb\t\xdc\x00"
+)
+
+
+def _write_random_trf(filepath, number_of_rows=200):
+    header = (
+        b"\x00"
+        + b"21/01/01 00:00:00 Z"
+        + b"\x00"
+        + b"+10:00"
+        + b"\x00"
+        + b"1-1/AP G0"
+        + b"\x00"
+        + b"2619"
+        + b"\x00"
+        + HEADER_COLUMN_END
+    )
+
+    table = np.random.randint(0, 2 ** 16, size=(number_of_rows, 354)).astype("<u2")
+    table[:, 6] = np.random.choice([39, 40, 42], size=number_of_rows)
+    table[:, 11] = np.random.choice([0, 1, 2], size=number_of_rows)
+
+    filepath.write_bytes(header + table.tobytes())
+
+
+def test_trffile_agrees_with_read(tmp_path):
+    filepath = tmp_path.joinpath("random.trf")
+    _write_random_trf(filepath)
+
+    header, table = pymedphys.trf.read(filepath)
+
+    with pymedphys.trf.TrfFile(filepath) as trf:
+        assert trf.header.machine == header["machine"][0]
+        assert len(trf) == len(table)
+
+        pd.testing.assert_frame_equal(trf.to_pandas(), table)
+        pd.testing.assert_frame_equal(trf[50:100][10:20].to_pandas(), table.iloc[60:70])
+
+        gantry = "Step Gantry/Scaled Actual (deg)"
+        np.testing.assert_array_equal(trf[-20:][gantry], table[gantry].values[-20:])
+
+
+def test_compact_read(tmp_path):
+    filepath = tmp_path.joinpath("random.trf")
+    _write_random_trf(filepath)
+
+    _, table = pymedphys.trf.read(filepath)
+    _, compact_table = pymedphys.trf.read(filepath, compact=True)
+
+    assert list(compact_table.columns) == list(table.columns)
+    assert set(compact_table.dtypes.astype(str)) == {"float32", "uint16", "category"}
+    assert (
+        compact_table.memory_usage(deep=True).sum()
+        < table.memory_usage(deep=True).sum() / 2
+    )
+
+    pd.testing.assert_frame_equal(
+        compact_table.astype(table.dtypes), table, check_exact=False, atol=1e-3
+    )
+
+
+def test_stream_agrees_with_read(tmp_path):
+    filepath = tmp_path.joinpath("random.trf")
+    _write_random_trf(filepath, number_of_rows=230)
+
+    header, table = pymedphys.trf.read(filepath)
+
+    with open(filepath, "rb") as f:
+        streamed_header, chunks = pymedphys.trf.stream(f, rows_per_chunk=50)
+        streamed_tables = list(chunks)
+
+    assert streamed_header.equals(header)
+    assert [len(chunk) for chunk in streamed_tables] == [50, 50, 50, 50, 30]
+    pd.testing.assert_frame_equal(pd.concat(streamed_tables), table)
+
+
+def test_stream_follows_a_growing_file(tmp_path):
+    filepath = tmp_path.joinpath("random.trf")
+    _write_random_trf(filepath, number_of_rows=100)
+    contents = filepath.read_bytes()
+    _, table = pymedphys.trf.read(filepath)
+
+    header_length = len(contents) - 100 * 708
+    partially_written = header_length + 60 * 708 + 100
+    filepath.write_bytes(contents[0:partially_written])
+
+    with open(filepath, "rb") as f:
+        _, chunks = pymedphys.trf.stream(
+            f, rows_per_chunk=1000, follow=True, poll_interval=0.01, timeout=0.05
+        )
+
+        first = next(chunks)
+        assert len(first) == 60
+
+        with open(filepath, "ab") as appending:
+            appending.write(contents[partially_written::])
+
+        remaining = list(chunks)
+
+    pd.testing.assert_frame_equal(pd.concat([first] + remaining), table)
+
+
+def test_trffile_close(tmp_path):
+    filepath = tmp_path.joinpath("random.trf")
+    _write_random_trf(filepath)
+
+    trf = pymedphys.trf.TrfFile(filepath)
+    sliced = trf[10:20]
+    sliced.close()
+    assert len(trf[0:5]) == 5
+
+    raw_rows = trf.raw_rows
+    with pytest.raises(BufferError):
+        trf.close()
+
+    del raw_rows
+    trf.close()
+
+    with pytest.raises(ValueError):
+        sliced.to_pandas()
+
+
+def test_stream_resolves_ambiguity_beyond_first_chunk(tmp_path):
+    filepath = tmp_path.joinpath("ambiguous.trf")
+    _write_random_trf(filepath)
+    contents = filepath.read_bytes()
+    header = contents[0 : len(contents) - 200 * 708]
+
+    # Both the integrity_v3 and unity_experimental layouts are able to
+    # decode the first 100 rows of this table.
+    table = np.random.randint(1000, 2 ** 16, size=(150, 350)).astype("<u2")
+    table[:, 2] = np.random.choice([39, 40, 42], size=150)
+    table[0:100, 6] = np.random.choice([39, 40, 42], size=100)
+    table[:, 7] = np.random.choice([0, 1, 2], size=150)
+    filepath.write_bytes(header + table.tobytes())
+
+    _, expected = pymedphys.trf.read(filepath)
+
+    with open(filepath, "rb") as f:
+        _, chunks = pymedphys.trf.stream(f, rows_per_chunk=10)
+        streamed_tables = list(chunks)
+
+    assert len(streamed_tables) == 15
+    pd.testing.assert_frame_equal(pd.concat(streamed_tables), expected)
@@ -0,0 +1,41 @@
+# Copyright (C) 2021 Cancer Care Associates
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import hashlib
+import os
+
+from pymedphys._utilities.filehash import HashCache, hash_file
+
+
+def test_hash_cache(tmp_path):
+    filepath = tmp_path.joinpath("a_file")
+    filepath.write_bytes(b"some contents")
+    stat = os.stat(filepath)
+
+    database_path = tmp_path.joinpath("hashes.db")
+    with HashCache(database_path) as cache:
+        digest = hash_file(filepath, cache=cache)
+        assert digest == hashlib.sha1(b"some contents").hexdigest()
+
+    # Change the contents without changing the size or the mtime to
+    # demonstrate that the stored digest is returned without reading.
+    filepath.write_bytes(b"same contents")
+    os.utime(filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    with HashCache(database_path) as cache:
+        assert hash_file(filepath, cache=cache) == digest
+
+        filepath.write_bytes(b"new contents")
+        assert hash_file(filepath, cache=cache) == hash_file(filepath)
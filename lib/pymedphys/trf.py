@@ -1,4 +1,6 @@
 # pylint: disable = unused-import, missing-docstring
 
 from pymedphys._trf.decode.trf2pandas import trf2pandas as read
+from pymedphys._trf.decode.stream import stream_trf as stream
+from pymedphys._trf.decode.trffile import TrfFile
 from pymedphys._trf.manage.identify import identify_logfile as identify
@@ -186,6 +186,7 @@ extras_require = {
         "fsspec",
         "dicompyler-core",
         "scikit-learn",
+        "pyarrow",
         "numpy>=1.20.2",
         "pandas>=1.0.0",
         "pydicom>=2.0.0",
@@ -271,6 +272,7 @@ extras_require = {
         "fsspec",
         "dicompyler-core",
         "scikit-learn",
+        "pyarrow",
         "numpy>=1.20.2",
         "pandas>=1.0.0",
         "pydicom>=2.0.0",